@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Auto-transcription and alignment of segmented bulletins (CPU)
+Segments found by segment.py are decoded once per file, grouped into
+batches of similar duration (so little time goes into padding), and
+transcribed by a pool of worker processes that each load the model once.
+Decoding runs in a producer thread while the workers infer. Results are
+appended to a JSONL file as batches finish, so an interrupted run picks
+up where it stopped.
+Usage: python align_whisper.py data/raw/okapi/lingala --backend whisper --model small --workers 2
+"""
+# filepath: scripts/align_whisper.py
+
+import os, sys, json, time, queue, zlib, argparse, threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from audio_stream import TARGET_SR, stream_audio
+from audio_cache import add_cache_arguments, open_cache, slice_seconds, to_float
+from okapi_manifest import audio_index, load_manifest, update_entries
+
+DEFAULT_OUT = "data/interim/okapi/transcripts.jsonl"
+REPORT_FILE = "align_report.json"
+
+class StubBackend:
+    """Deterministic stand-in model: no dependencies, same output every run
+
+    Words are derived from a checksum of the audio and spread evenly over
+    the segment, which is enough to exercise batching, resume and reporting.
+    """
+    name = "stub"
+
+    def __init__(self, model: str = None, threads: int = 1):
+        self.model = model or "stub"
+
+    def transcribe(self, audios: list, language: str) -> list:
+        results = []
+        for audio in audios:
+            duration = len(audio) / TARGET_SR
+            seed = zlib.crc32((audio * 32767).astype('<i2').tobytes())
+            count = max(1, int(duration * 2))
+            step = duration / count
+            words = [{'word': f"{language}{(seed >> (i % 24)) % 1000:03d}",
+                      'start': round(i * step, 2), 'end': round((i + 1) * step, 2)}
+                     for i in range(count)]
+            results.append({'text': ' '.join(w['word'] for w in words), 'words': words})
+        return results
+
+class WhisperBackend:
+    """openai-whisper on CPU, decoding a whole batch of log-mels per call
+
+    Whisper works on 30 s windows, so segments are padded to 30 s here;
+    batching still amortizes the encoder and decoder calls. Word times come
+    from the same cross-attention alignment as transcribe(word_timestamps=True),
+    which costs one more forward pass per segment.
+    """
+    name = "whisper"
+
+    def __init__(self, model: str = "small", threads: int = 1):
+        import torch, whisper
+        import whisper.timing
+        torch.set_num_threads(threads)
+        self.torch, self.whisper = torch, whisper
+        self.model = whisper.load_model(model or "small", device="cpu")
+        self.tokenizers = {}
+
+    def _tokenizer(self, language: str):
+        if language not in self.tokenizers:
+            self.tokenizers[language] = self.whisper.tokenizer.get_tokenizer(
+                self.model.is_multilingual, num_languages=self.model.num_languages,
+                language=language, task="transcribe")
+        return self.tokenizers[language]
+
+    def _words(self, result, mel, num_samples: int) -> list:
+        tokenizer = self._tokenizer(result.language)
+        text_tokens = [t for t in result.tokens if t < tokenizer.eot]
+        num_frames = min(num_samples // self.whisper.audio.HOP_LENGTH, self.whisper.audio.N_FRAMES)
+        duration = num_samples / TARGET_SR
+        timings = self.whisper.timing.find_alignment(self.model, tokenizer, text_tokens, mel, num_frames)
+        return [{'word': t.word.strip(), 'start': round(min(t.start, duration), 2),
+                 'end': round(min(t.end, duration), 2), 'probability': round(float(t.probability), 3)}
+                for t in timings if t.word.strip()]
+
+    def transcribe(self, audios: list, language: str) -> list:
+        whisper = self.whisper
+        mels = self.torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(self.torch.from_numpy(audio)), self.model.dims.n_mels)
+            for audio in audios
+        ])
+        # Whisper has Lingala but not every Okapi language; detect the rest
+        options = whisper.DecodingOptions(
+            language=language if language in whisper.tokenizer.LANGUAGES else None,
+            fp16=False, without_timestamps=True)
+        with self.torch.inference_mode():
+            decoded = whisper.decode(self.model, mels, options)
+        return [{'text': r.text.strip(), 'words': self._words(r, mel, len(audio)),
+                 'avg_logprob': round(r.avg_logprob, 3), 'no_speech_prob': round(r.no_speech_prob, 3)}
+                for r, mel, audio in zip(decoded, mels, audios)]
+
+class CTCBackend:
+    """MMS wav2vec2 CTC model; word times come from the CTC frame alignment
+
+    Inputs are padded to the longest segment in the batch, which is where
+    duration bucketing pays off most.
+    """
+    name = "mms"
+
+    # Okapi language codes -> MMS adapter (ISO 639-3) codes
+    ADAPTERS = {'ln': 'lin', 'kg': 'kon', 'lua': 'lua'}
+
+    def __init__(self, model: str = "facebook/mms-1b-all", threads: int = 1):
+        import torch
+        from transformers import AutoProcessor, Wav2Vec2ForCTC
+        torch.set_num_threads(threads)
+        self.torch = torch
+        self.model_name = model or "facebook/mms-1b-all"
+        self.processor = AutoProcessor.from_pretrained(self.model_name)
+        self.model = Wav2Vec2ForCTC.from_pretrained(self.model_name).eval()
+        self.adapter = None
+
+    def _use(self, language: str):
+        adapter = self.ADAPTERS.get(language, language)
+        if adapter != self.adapter:
+            self.processor.tokenizer.set_target_lang(adapter)
+            self.model.load_adapter(adapter)
+            self.adapter = adapter
+
+    def transcribe(self, audios: list, language: str) -> list:
+        self._use(language)
+        inputs = self.processor(audios, sampling_rate=TARGET_SR, return_tensors="pt", padding=True)
+        with self.torch.inference_mode():
+            ids = self.model(**inputs).logits.argmax(dim=-1).numpy()
+        lengths = self.model._get_feat_extract_output_lengths(
+            self.torch.tensor([len(a) for a in audios])).tolist()
+        seconds_per_frame = self.model.config.inputs_to_logits_ratio / TARGET_SR
+        return [self._words(row[:n], seconds_per_frame) for row, n in zip(ids, lengths)]
+
+    def _words(self, ids, seconds_per_frame: float) -> dict:
+        tokenizer = self.processor.tokenizer
+        blank, delimiter = tokenizer.pad_token_id, tokenizer.word_delimiter_token
+        words, current, start, prev = [], "", None, None
+        for frame, token_id in enumerate(ids):
+            if token_id == prev:
+                continue
+            prev = token_id
+            if token_id == blank:
+                continue
+            token = tokenizer.convert_ids_to_tokens(int(token_id))
+            if token == delimiter:
+                if current:
+                    words.append({'word': current, 'start': round(start * seconds_per_frame, 2),
+                                  'end': round(frame * seconds_per_frame, 2)})
+                current, start = "", None
+                continue
+            if start is None:
+                start = frame
+            current += token
+        if current:
+            words.append({'word': current, 'start': round(start * seconds_per_frame, 2),
+                          'end': round(len(ids) * seconds_per_frame, 2)})
+        return {'text': ' '.join(w['word'] for w in words), 'words': words}
+
+BACKENDS = {backend.name: backend for backend in (StubBackend, WhisperBackend, CTCBackend)}
+
+# Per-process model, created once by the pool initializer
+_backend = None
+
+def _init_worker(backend: str, model: str, threads: int):
+    global _backend
+    _backend = BACKENDS[backend](model, threads)
+
+def transcribe_batch(batch: list, language: str):
+    """Worker entry point; returns ([(key, result), ...], CPU seconds used)"""
+    started = time.process_time()
+    results = _backend.transcribe([audio for _, audio in batch], language)
+    return list(zip((key for key, _ in batch), results)), time.process_time() - started
+
+def iter_segment_audio(path: Path, segments: list, wanted: set):
+    """Yield (index, samples) for the wanted segments of one file, decoding it once
+
+    Only the audio from the earliest pending segment onwards is buffered.
+    """
+    order = sorted((i for i in wanted), key=lambda i: segments[i][0])
+    buf, buf_start, k = np.zeros(0, dtype=np.float32), 0, 0
+
+    def cut(i):
+        a = max(0, int(segments[i][0] * TARGET_SR) - buf_start)
+        b = int(segments[i][1] * TARGET_SR) - buf_start
+        return buf[a:b].copy()
+
+    for block in stream_audio(path):
+        buf = np.concatenate((buf, block))
+        while k < len(order) and int(segments[order[k]][1] * TARGET_SR) <= buf_start + len(buf):
+            yield order[k], cut(order[k])
+            k += 1
+        keep = int(segments[order[k]][0] * TARGET_SR) if k < len(order) else buf_start + len(buf)
+        drop = min(len(buf), max(0, keep - buf_start))
+        buf, buf_start = buf[drop:], buf_start + drop
+
+    for i in order[k:]:  # Segments running past the decoded end
+        samples = cut(i)
+        if len(samples):
+            yield i, samples
+
+def cached_segment_audio(cache, path: Path, sha256: str, segments: list, wanted: set):
+    """Yield (index, samples) for the wanted segments from the decode cache
+
+    Each segment is a view into the memory-mapped PCM; only the float
+    conversion copies.
+    """
+    pcm = cache.pcm(path, sha256)
+    for i in sorted(wanted, key=lambda i: segments[i][0]):
+        samples = slice_seconds(pcm, *segments[i])
+        if len(samples):
+            yield i, to_float(samples)
+
+def duration_batches(items, max_batch_seconds: float, max_batch_size: int, window: int):
+    """Group ((filename, index), language, samples) items into same-language batches of similar length
+
+    Items are pooled `window` at a time and sorted by length, so each batch
+    pads to a maximum close to its members. Yields (language, batch, padded
+    samples).
+    """
+    budget = int(max_batch_seconds * TARGET_SR)
+    pools = {}
+
+    def cut(language, pool):
+        pool.sort(key=lambda item: len(item[1]))
+        batch = []
+        for item in pool:
+            # Sorted ascending, so the newcomer sets the padded length
+            if batch and (len(batch) >= max_batch_size or (len(batch) + 1) * len(item[1]) > budget):
+                yield language, batch, len(batch) * len(batch[-1][1])
+                batch = []
+            batch.append(item)
+        if batch:
+            yield language, batch, len(batch) * len(batch[-1][1])
+
+    for key, language, samples in items:
+        pool = pools.setdefault(language, [])
+        pool.append((key, samples))
+        if len(pool) >= window:
+            yield from cut(language, pool)
+            pools[language] = []
+    for language, pool in pools.items():
+        yield from cut(language, pool)
+
+def load_done(out_path: Path) -> dict:
+    """{(filename, segment): (start, end)} of the latest result for each key
+
+    A segment counts as done only while its bounds match; after segment.py
+    re-cuts a file the old records stay in the file but no longer apply.
+    A line cut short by an interrupted run is truncated away so appends
+    start on a clean line.
+    """
+    done = {}
+    if not out_path.exists():
+        return done
+    good = 0
+    with open(out_path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            done[(record['filename'], record['segment'])] = (record.get('start'), record.get('end'))
+            good += len(line)
+    if good != out_path.stat().st_size:
+        with open(out_path, 'r+b') as f:
+            f.truncate(good)
+    return done
+
+def current_transcript(record: dict, segment: list):
+    """record if it was transcribed for these segment bounds, else None"""
+    if record and [record.get('start'), record.get('end')] == list(segment):
+        return record
+    return None
+
+def producer(jobs: list, out: queue.Queue, stop: threading.Event, cache=None):
+    """Decode segments file by file into a bounded queue (runs in a thread)"""
+    try:
+        for path, filename, sha256, language, segments, wanted in jobs:
+            try:
+                if cache is not None:
+                    segment_audio = cached_segment_audio(cache, path, sha256, segments, wanted)
+                else:
+                    segment_audio = iter_segment_audio(path, segments, wanted)
+                for index, samples in segment_audio:
+                    while not stop.is_set():
+                        try:
+                            out.put(((filename, index), language, samples), timeout=0.5)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+            except Exception as e:
+                print(f"❌ Could not decode {filename}: {e}")
+    finally:
+        out.put(None)
+
+def drain(q: queue.Queue):
+    return iter(q.get, None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe and align segmented audio on CPU")
+    parser.add_argument("manifest_dir", nargs="?", default="data/raw/okapi", help="Directory with manifest.json and the audio")
+    parser.add_argument("--out", type=str, default=DEFAULT_OUT, help="Results JSONL (appended to, resumable)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="whisper", help="Transcription backend")
+    parser.add_argument("--model", type=str, help="Model name for the backend")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own model")
+    parser.add_argument("--threads", type=int, default=max(1, (os.cpu_count() or 1)), help="Total CPU threads (split across workers)")
+    parser.add_argument("--batch-seconds", type=float, default=240, help="Padded audio per batch (s)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Maximum segments per batch")
+    parser.add_argument("--window", type=int, default=256, help="Segments pooled before sorting by length")
+    parser.add_argument("--limit", type=int, help="Stop after this many files")
+    add_cache_arguments(parser)
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    args = parser.parse_args()
+
+    manifest_dir = Path(args.manifest_dir)
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    entries = load_manifest(manifest_dir)
+    paths = audio_index(manifest_dir)
+    done = load_done(out_path)
+
+    jobs, pending = [], {}
+    for filename, entry in entries.items():
+        segments = entry.get('segments')
+        if not segments or entry.get('duplicate_of') or filename not in paths:
+            continue
+        wanted = {i for i, (start, end) in enumerate(segments) if done.get((filename, i)) != (start, end)}
+        if wanted:
+            jobs.append((paths[filename], filename, entry.get('sha256'), entry.get('language', 'ln'),
+                         segments, wanted))
+            pending[filename] = len(wanted)
+    if args.limit:
+        jobs = jobs[:args.limit]
+        pending = {job[1]: pending[job[1]] for job in jobs}
+
+    unsegmented = sum(1 for e in entries.values() if not e.get('segments'))
+    if unsegmented:
+        print(f"⚠️  {unsegmented} files have no segments yet (run segment.py first)")
+    print(f"🗣️  {sum(pending.values())} segments from {len(jobs)} files, "
+          f"{len(done)} already done, backend={args.backend}, workers={args.workers}")
+    if not jobs:
+        return
+
+    segments_q = queue.Queue(maxsize=args.batch_size * args.workers * 4)
+    stop = threading.Event()
+    cache = None if args.no_audio_cache else open_cache(manifest_dir, args.audio_cache_mb)
+    decoder = threading.Thread(target=producer, args=(jobs, segments_q, stop, cache), daemon=True)
+
+    threads = max(1, args.threads // args.workers)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    audio_seconds = padded_seconds = worker_cpu = 0.0
+    finished, failed, updates = 0, 0, {}
+
+    with open(out_path, 'a', encoding='utf-8') as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                initargs=(args.backend, args.model, threads)) as executor:
+        decoder.start()
+        in_flight = {}
+
+        def collect(block: bool):
+            nonlocal audio_seconds, worker_cpu, finished, failed
+            if not in_flight:
+                return
+            ready, _ = wait(in_flight, return_when=FIRST_COMPLETED, timeout=None if block else 0)
+            for future in ready:
+                batch_info = in_flight.pop(future)
+                try:
+                    results, cpu = future.result()
+                except Exception as e:
+                    failed += len(batch_info)
+                    print(f"❌ Batch of {len(batch_info)} failed: {e}")
+                    continue
+                worker_cpu += cpu
+                for (filename, index), result in results:
+                    start, end = entries[filename]['segments'][index]
+                    audio_seconds += end - start
+                    out.write(json.dumps({'filename': filename, 'segment': index, 'start': start, 'end': end,
+                                          'backend': args.backend, 'model': args.model, **result},
+                                         ensure_ascii=False) + "\n")
+                    pending[filename] -= 1
+                    if not pending[filename]:
+                        finished += 1
+                        updates[filename] = {'needs_transcription': False, 'transcript': str(out_path),
+                                             'asr_backend': args.backend}
+                out.flush()
+
+        try:
+            batches = duration_batches(drain(segments_q), args.batch_seconds, args.batch_size, args.window)
+            for language, batch, padded in batches:
+                padded_seconds += padded / TARGET_SR
+                while len(in_flight) >= args.workers * 2:
+                    collect(block=True)
+                in_flight[executor.submit(transcribe_batch, batch, language)] = [key for key, _ in batch]
+                collect(block=False)
+            while in_flight:
+                collect(block=True)
+        except KeyboardInterrupt:
+            print("\n⏹️  Interrupted; finished batches are saved")
+            stop.set()
+            for future in in_flight:
+                future.cancel()
+            raise
+        finally:
+            if updates:
+                update_entries(manifest_dir, updates, args.manifest_format)
+
+    wall = time.perf_counter() - wall_start
+    cpu = worker_cpu + (time.process_time() - cpu_start)
+    report = {
+        'backend': args.backend,
+        'model': args.model,
+        'workers': args.workers,
+        'threads_per_worker': threads,
+        'audio_hours': round(audio_seconds / 3600, 4),
+        'wall_hours': round(wall / 3600, 4),
+        'cpu_hours': round(cpu / 3600, 4),
+        'audio_hours_per_cpu_hour': round(audio_seconds / cpu, 2) if cpu else None,
+        'real_time_factor': round(wall / audio_seconds, 4) if audio_seconds else None,
+        'padding_overhead': round(padded_seconds / audio_seconds - 1, 4) if audio_seconds else None,
+        'files_completed': finished,
+        'segments_failed': failed,
+    }
+    with open(out_path.parent / REPORT_FILE, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print("\n📊 Alignment Summary:")
+    print(f"   • Audio: {audio_seconds / 3600:.2f} h in {wall:.0f}s wall, {cpu:.0f}s CPU")
+    print(f"   • Throughput: {report['audio_hours_per_cpu_hour']} audio-hours per CPU-hour")
+    print(f"   • Padding overhead: {(report['padding_overhead'] or 0) * 100:.1f}%")
+    print(f"   • Files completed: {finished}, segments failed: {failed}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
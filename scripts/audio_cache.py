@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Shared decode cache for the processing stages
+Each MP3 is decoded once to 16 kHz mono int16 PCM (and, on request,
+log-mel features or waveform peaks) stored as raw arrays keyed by the
+audio's SHA-256.
+Stages memory-map them, so slicing a segment is a view, not a copy.
+Entries are written under a per-key file lock and renamed into place, so
+worker processes can share the cache; a size cap evicts the least
+recently used entries.
+Usage: python audio_cache.py data/raw/okapi --warm [--logmel] [--peaks] [--workers 4]
+"""
+# filepath: scripts/audio_cache.py
+
+import os, fcntl, argparse, tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_stream import TARGET_SR, BLOCK_SECONDS, stream_audio
+from okapi_dedup import file_sha256
+
+CACHE_DIR = ".audio_cache"
+DEFAULT_MAX_MB = 4096
+
+N_FFT = 400      # 25 ms window
+HOP = 160        # 10 ms hop
+N_MELS = 80
+PEAKS_PER_SECOND = 100  # Waveform min/max bins for display
+
+PCM_SUFFIX = ".s16"
+MEL_SUFFIX = f".mel{N_MELS}.f32"
+PEAKS_SUFFIX = f".peaks{PEAKS_PER_SECOND}.i8"
+
+def slice_seconds(array: np.ndarray, start: float, end: float, rate: float = TARGET_SR) -> np.ndarray:
+    """Rows [start, end) seconds of a cached array; a view into the mapping"""
+    return array[max(0, int(start * rate)):max(0, int(end * rate))]
+
+def to_float(pcm: np.ndarray) -> np.ndarray:
+    return pcm.astype(np.float32) / 32768.0
+
+class AudioCache:
+    """Content-addressed store of decoded audio under <root>/.audio_cache"""
+
+    def __init__(self, root: Path, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = Path(root) / CACHE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _path(self, sha256: str, suffix: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}{suffix}"
+
+    @contextmanager
+    def _lock(self, name: str):
+        """Exclusive flock on a sidecar file, shared across processes"""
+        lock_path = self.root / f"{name}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _open(self, path: Path, dtype, columns: int = None):
+        """Map a cached array read-only and mark it recently used"""
+        try:
+            os.utime(path)
+            if path.stat().st_size == 0:
+                return np.zeros((0, columns) if columns else 0, dtype=dtype)
+            array = np.memmap(path, dtype=dtype, mode='r')
+        except FileNotFoundError:  # Not cached yet, or just evicted
+            return None
+        return array.reshape(-1, columns) if columns else array
+
+    def _build(self, target: Path, write_blocks):
+        """Write target once: lock, re-check, stream to a temp file, rename"""
+        with self._lock(target.relative_to(self.root).with_suffix('').as_posix()):
+            if target.exists():
+                return
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+            os.fchmod(fd, 0o644)  # mkstemp creates 0600 files
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for block in write_blocks():
+                        f.write(np.ascontiguousarray(block).tobytes())
+                os.replace(tmp, target)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+        self.evict(keep=target)
+
+    def pcm(self, path: Path, sha256: str = None) -> np.ndarray:
+        """16 kHz mono int16 samples of path, decoding it on first use"""
+        sha256 = sha256 or file_sha256(Path(path))
+        target = self._path(sha256, PCM_SUFFIX)
+        array = self._open(target, np.int16)
+        if array is None:
+            def blocks():
+                for block in stream_audio(Path(path)):
+                    yield (np.clip(block, -1.0, 32767 / 32768) * 32768).astype('<i2')
+            self._build(target, blocks)
+            array = self._open(target, np.int16)
+        return array
+
+    def logmel(self, path: Path, sha256: str = None) -> np.ndarray:
+        """(frames, N_MELS) log-mel features of path at 100 frames/s"""
+        sha256 = sha256 or file_sha256(Path(path))
+        target = self._path(sha256, MEL_SUFFIX)
+        array = self._open(target, np.float32, N_MELS)
+        if array is None:
+            pcm = self.pcm(path, sha256)
+            self._build(target, lambda: log_mel_blocks(pcm))
+            array = self._open(target, np.float32, N_MELS)
+        return array
+
+    def peaks(self, path: Path, sha256: str = None) -> np.ndarray:
+        """(bins, 2) int8 min/max of path at PEAKS_PER_SECOND bins/s"""
+        sha256 = sha256 or file_sha256(Path(path))
+        target = self._path(sha256, PEAKS_SUFFIX)
+        array = self._open(target, np.int8, 2)
+        if array is None:
+            pcm = self.pcm(path, sha256)
+            self._build(target, lambda: peak_blocks(pcm))
+            array = self._open(target, np.int8, 2)
+        return array
+
+    def blocks(self, path: Path, sha256: str = None, block_seconds: float = BLOCK_SECONDS):
+        """Drop-in for audio_stream.stream_audio served from the cache"""
+        pcm = self.pcm(path, sha256)
+        step = int(block_seconds * TARGET_SR)
+        for offset in range(0, len(pcm), step):
+            yield to_float(pcm[offset:offset + step])
+
+    def entries(self) -> list:
+        """(mtime, size, path) of every cached array"""
+        found = []
+        for sub in os.scandir(self.root):
+            if not sub.is_dir():
+                continue
+            for dirent in os.scandir(sub.path):
+                if dirent.name.endswith((PCM_SUFFIX, MEL_SUFFIX, PEAKS_SUFFIX)):
+                    stat = dirent.stat()
+                    found.append((stat.st_mtime, stat.st_size, Path(dirent.path)))
+        return found
+
+    def evict(self, keep: Path = None) -> int:
+        """Delete least recently used arrays until under max_bytes; returns bytes freed
+
+        Processes that already mapped an evicted file keep reading it; the
+        space is released when they unmap it.
+        """
+        with self._lock("evict"):
+            found = sorted(self.entries())
+            total = sum(size for _, size, _ in found)
+            freed = 0
+            for _, size, path in found:
+                if total - freed <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    path.unlink()
+                    freed += size
+                except FileNotFoundError:
+                    pass
+            return freed
+
+def open_blocks(path: Path, sha256: str = None, cache: AudioCache = None,
+                block_seconds: float = BLOCK_SECONDS):
+    """stream_audio(), served from the decode cache when one is given"""
+    if cache is None:
+        return stream_audio(Path(path), TARGET_SR, block_seconds)
+    return cache.blocks(path, sha256, block_seconds)
+
+def open_cache(root, max_mb: float = DEFAULT_MAX_MB):
+    """AudioCache under root, or None when the stage runs without one"""
+    if root is None:
+        return None
+    return AudioCache(Path(root), int(max_mb * 1024 * 1024))
+
+def add_cache_arguments(parser):
+    """The decode-cache flags shared by the processing stages"""
+    parser.add_argument("--no-audio-cache", action="store_true",
+                        help=f"Decode MP3s directly instead of through {CACHE_DIR}/")
+    parser.add_argument("--audio-cache-mb", type=float, default=DEFAULT_MAX_MB, help="Decode cache size cap (MB)")
+
+def mel_filterbank(sr: int = TARGET_SR, n_fft: int = N_FFT, n_mels: int = N_MELS) -> np.ndarray:
+    """Area-normalized triangular mel filters, shape (n_mels, n_fft // 2 + 1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+    bins = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    edges = mel_to_hz(np.linspace(hz_to_mel(0), hz_to_mel(sr / 2), n_mels + 2))
+    lower = (bins[None, :] - edges[:-2, None]) / (edges[1:-1] - edges[:-2])[:, None]
+    upper = (edges[2:, None] - bins[None, :]) / (edges[2:] - edges[1:-1])[:, None]
+    weights = np.maximum(0, np.minimum(lower, upper))
+    return (weights * (2.0 / (edges[2:] - edges[:-2]))[:, None]).astype(np.float32)
+
+def log_mel_blocks(pcm: np.ndarray, frames_per_block: int = 3000):
+    """Yield log-mel frames of an int16 array a block at a time (flat memory)"""
+    basis = mel_filterbank()
+    window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+    n_frames = 1 + max(0, len(pcm) - N_FFT) // HOP if len(pcm) >= N_FFT else 0
+    for first in range(0, n_frames, frames_per_block):
+        count = min(frames_per_block, n_frames - first)
+        chunk = to_float(pcm[first * HOP:(first + count - 1) * HOP + N_FFT])
+        frames = np.lib.stride_tricks.sliding_window_view(chunk, N_FFT)[::HOP][:count]
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        yield np.log10(power.astype(np.float32) @ basis.T + 1e-10)
+
+def peak_blocks(pcm: np.ndarray, bins_per_block: int = 6000):
+    """Yield (bins, 2) int8 min/max pairs of an int16 array a block at a time"""
+    hop = TARGET_SR // PEAKS_PER_SECOND
+    n_bins = -(-len(pcm) // hop)
+    for first in range(0, n_bins, bins_per_block):
+        chunk = pcm[first * hop:(first + bins_per_block) * hop]
+        full = len(chunk) // hop
+        frames = [chunk[:full * hop].reshape(full, hop)] if full else []
+        lo = [f.min(axis=1) for f in frames]
+        hi = [f.max(axis=1) for f in frames]
+        if len(chunk) % hop:  # Partial last bin
+            lo.append(chunk[full * hop:].min(keepdims=True))
+            hi.append(chunk[full * hop:].max(keepdims=True))
+        yield (np.stack((np.concatenate(lo), np.concatenate(hi)), axis=1) >> 8).astype(np.int8)
+
+def _warm(root: str, max_bytes: int, path: str, sha256: str, logmel: bool, peaks: bool = False):
+    cache = AudioCache(Path(root), max_bytes)
+    array = cache.logmel(path, sha256) if logmel else cache.pcm(path, sha256)
+    if peaks:
+        cache.peaks(path, sha256)
+    return len(array)
+
+def main():
+    from okapi_manifest import audio_index, load_manifest
+
+    parser = argparse.ArgumentParser(description="Manage the decoded-audio cache")
+    parser.add_argument("manifest_dir", nargs="?", default="data/raw/okapi", help="Directory with manifest.json and the audio")
+    parser.add_argument("--warm", action="store_true", help="Decode every manifest file into the cache")
+    parser.add_argument("--logmel", action="store_true", help="Also compute log-mel features when warming")
+    parser.add_argument("--peaks", action="store_true", help="Also compute waveform peaks (validate_ui.py) when warming")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Decode processes when warming")
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_MB, help="Cache size cap (MB)")
+    args = parser.parse_args()
+
+    manifest_dir = Path(args.manifest_dir)
+    max_bytes = int(args.max_mb * 1024 * 1024)
+    cache = AudioCache(manifest_dir, max_bytes)
+
+    if args.warm:
+        entries = load_manifest(manifest_dir)
+        paths = audio_index(manifest_dir)
+        jobs = [(str(paths[f]), e.get('sha256')) for f, e in entries.items()
+                if f in paths and not e.get('duplicate_of')]
+        print(f"🔥 Warming {len(jobs)} files with {args.workers} workers")
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = {executor.submit(_warm, str(manifest_dir), max_bytes, path, sha, args.logmel, args.peaks): path
+                       for path, sha in jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"❌ {Path(futures[future]).name}: {e}")
+
+    freed = cache.evict()
+    found = cache.entries()
+    size = sum(s for _, s, _ in found)
+    print(f"📊 {len(found)} cached arrays, {size / 1024 / 1024:.1f} MB "
+          f"(cap {args.max_mb:.0f} MB, {freed / 1024 / 1024:.1f} MB evicted)")
+
+if __name__ == "__main__":
+    main()
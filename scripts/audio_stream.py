@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Block-wise audio decoding for the processing stages
+Bulletins are decoded in fixed-size blocks and resampled to 16 kHz mono
+on the fly, so memory stays flat however long the file is (librosa.load
+would hold the whole decoded file, plus a resampling copy, per worker).
+"""
+# filepath: scripts/audio_stream.py
+
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+TARGET_SR = 16000
+BLOCK_SECONDS = 30
+
+class _SequentialSoundFile(sf.SoundFile):
+    """SoundFile that never seeks
+
+    After every read SoundFile seeks to tell() + frames to keep its position
+    in sync. libsndfile's MPEG decoder treats that as a real seek and
+    resyncs, zeroing a few ms of audio at every block edge. Reporting the
+    file as unseekable keeps the reads strictly sequential.
+    """
+
+    def seekable(self) -> bool:
+        return False
+
+def _soundfile_blocks(path: Path, block_seconds: float):
+    """Yield (mono float32 block, native sample rate) via libsndfile"""
+    with _SequentialSoundFile(str(path)) as f:
+        blocksize = max(1, int(f.samplerate * block_seconds))
+        while True:
+            block = f.read(blocksize, dtype='float32', always_2d=True)
+            if not len(block):
+                return
+            yield block.mean(axis=1, dtype=np.float32), f.samplerate
+
+def _audioread_blocks(path: Path, block_seconds: float):
+    """Fallback for builds of libsndfile without MP3 support (uses ffmpeg/gstreamer)"""
+    import audioread
+
+    with audioread.audio_open(str(path)) as f:
+        channels, samplerate = f.channels, f.samplerate
+        target = int(samplerate * block_seconds) * channels
+        pending, size = [], 0
+        for buf in f:
+            pending.append(np.frombuffer(buf, dtype='<i2'))
+            size += len(pending[-1])
+            if size >= target:
+                yield _to_mono(np.concatenate(pending), channels), samplerate
+                pending, size = [], 0
+        if pending:
+            yield _to_mono(np.concatenate(pending), channels), samplerate
+
+def _to_mono(pcm: np.ndarray, channels: int) -> np.ndarray:
+    samples = pcm.astype(np.float32) / 32768.0
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels).mean(axis=1, dtype=np.float32)
+
+def decode_blocks(path: Path, block_seconds: float = BLOCK_SECONDS):
+    """Yield (mono float32 block, native sample rate), preferring libsndfile"""
+    try:
+        sf.info(str(path))
+    except (RuntimeError, sf.LibsndfileError):
+        yield from _audioread_blocks(path, block_seconds)
+        return
+    yield from _soundfile_blocks(path, block_seconds)
+
+def stream_audio(path: Path, sr: int = TARGET_SR, block_seconds: float = BLOCK_SECONDS):
+    """Yield mono float32 blocks of path resampled to sr
+
+    Resampling uses a soxr stream so block edges don't click; only one
+    block (plus the resampler's small history) is in memory at a time.
+    """
+    resampler = None
+    for block, native_sr in decode_blocks(path, block_seconds):
+        if native_sr == sr:
+            yield block
+            continue
+        if resampler is None:
+            import soxr
+            resampler = soxr.ResampleStream(native_sr, sr, 1, dtype='float32')
+        out = resampler.resample_chunk(block)
+        if len(out):
+            yield out
+    if resampler is not None:
+        tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+        if len(tail):
+            yield tail
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for MP3 link extraction over saved article pages
+Usage: python bench_extract.py [--fixtures fixtures/okapi] [--repeat 200]
+"""
+# filepath: scripts/bench_extract.py
+
+import sys, time, argparse
+from pathlib import Path
+
+from okapi_extract import extract, extract_fast, extract_full
+
+def bench(func, pages: list, repeat: int) -> float:
+    """Mean seconds per page for func over all pages"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Radio Okapi MP3 extraction")
+    parser.add_argument("--fixtures", type=str, default=str(Path(__file__).parent / "fixtures" / "okapi"),
+                        help="Directory of saved article HTML")
+    parser.add_argument("--repeat", type=int, default=200, help="Passes over the fixture set")
+    args = parser.parse_args()
+
+    files = sorted(Path(args.fixtures).glob("*.html"))
+    if not files:
+        print(f"❌ No fixtures in {args.fixtures}")
+        sys.exit(1)
+    pages = [f.read_text(encoding='utf-8') for f in files]
+
+    # The fast path must agree with the full parse before its speed matters
+    mismatches = 0
+    for f, page in zip(files, pages):
+        fast, full = extract(page), extract_full(page)
+        if fast != full:
+            mismatches += 1
+            print(f"⚠️  {f.name}: fast={fast} full={full}")
+    print(f"🔍 {len(files)} fixtures, {mismatches} mismatches")
+
+    full_time = bench(extract_full, pages, max(1, args.repeat // 20))
+    fast_time = bench(extract_fast, pages, args.repeat)
+    auto_time = bench(extract, pages, args.repeat)
+
+    print(f"🐢 full parse : {full_time * 1e6:9.1f} µs/page")
+    print(f"⚡ fast path  : {fast_time * 1e6:9.1f} µs/page")
+    print(f"🔀 extract()  : {auto_time * 1e6:9.1f} µs/page ({full_time / auto_time:.0f}x faster)")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == "__main__":
+    main()
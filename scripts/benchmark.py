@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Reproducible benchmark of the collection and processing pipeline
+A local stand-in for Radio Okapi serves the saved article pages from
+fixtures/okapi (with each MP3 link pointed at a synthetic bulletin) with
+configurable latency, bandwidth and error rates. The scraper and the
+processing stages then run against it in child processes, each measured
+for wall time, CPU time and peak memory, and the results are written as
+JSON so runs can be compared.
+Usage: python benchmark.py --articles 20 --latency-ms 50 --bandwidth-mbps 20 --label threads8 --threads 8
+       python benchmark.py --compare data/benchmarks/baseline.json
+       python benchmark.py --serve-only --port 8000
+"""
+# filepath: scripts/benchmark.py
+
+import io, os, re, sys, json, time, random, shutil, hashlib, platform, argparse, tempfile, threading, subprocess
+from pathlib import Path
+from statistics import median
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from okapi_sources import DEFAULT_SECTION, SECTIONS
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+FIXTURES = SCRIPTS_DIR / "fixtures" / "okapi"
+MP3_LINK_RE = re.compile(r"/sites/default/files/[^'\"\s<>]+\.mp3")
+STAGE_ORDER = ('scrape', 'manifest', 'segment', 'quality')
+CHUNK = 64 * 1024
+
+def synth_bulletin(seed: int, seconds: float, sr: int = 22050) -> np.ndarray:
+    """Speech-like audio: syllable-modulated noise bursts separated by pauses"""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    audio = rng.normal(0, 0.003, n).astype(np.float32)  # Noise floor
+    pos = int(rng.uniform(0.2, 1.0) * sr)
+    t = np.arange(n) / sr
+    while pos < n:
+        length = min(n - pos, int(rng.uniform(0.8, 6.0) * sr))
+        burst = rng.normal(0, 0.2, length).astype(np.float32)
+        syllables = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * t[:length])
+        audio[pos:pos + length] += burst * syllables
+        pos += length + int(rng.uniform(0.35, 1.2) * sr)
+    return np.clip(audio, -1, 1)
+
+def encode_mp3(audio: np.ndarray, sr: int = 22050) -> bytes:
+    import soundfile as sf
+    buf = io.BytesIO()
+    sf.write(buf, audio, sr, format='MP3')
+    return buf.getvalue()
+
+class StandIn:
+    """In-memory Radio Okapi: article pages, MP3s, HEAD probes and Range requests"""
+
+    def __init__(self, articles: int, section_keys: list, mp3_seconds: float = 60.0,
+                 latency: float = 0.0, bandwidth: float = None, error_rate: float = 0.0,
+                 drop_rate: float = 0.0, seed: int = 0, fixtures: Path = FIXTURES):
+        self.latency, self.bandwidth = latency, bandwidth
+        self.error_rate, self.drop_rate = error_rate, drop_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors_injected': 0, 'drops_injected': 0, 'bytes_sent': 0}
+        self.pages, self.files = {}, {}
+
+        templates = [f.read_text(encoding='utf-8') for f in sorted(fixtures.glob("*.html"))]
+        if not templates:
+            raise FileNotFoundError(f"No article fixtures in {fixtures}")
+        for key in section_keys:
+            prefix = urlsplit(SECTIONS[key]['url']).path
+            for num in range(1, articles + 1):
+                template = templates[num % len(templates)]
+                day = (date(2025, 1, 1) + timedelta(days=num)).strftime('%d%m%Y')
+                mp3_path = f"/sites/default/files/bench/{day}-{key}-{num}.mp3"
+                page = MP3_LINK_RE.sub(mp3_path, template)
+                self.pages[f"{prefix}{num}"] = page.encode('utf-8')
+                if page != template:
+                    seed_n = int(hashlib.md5(f"{seed}:{key}:{num}".encode()).hexdigest()[:8], 16)
+                    self.files[mp3_path] = encode_mp3(synth_bulletin(seed_n, mp3_seconds))
+        self.server = None
+
+    def chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < rate
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+    def start(self, port: int = 0) -> str:
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head: bool):
+                standin.count('requests')
+                if standin.latency:
+                    time.sleep(standin.latency)
+                path = urlsplit(self.path).path
+                body = standin.pages.get(path) or standin.files.get(path)
+                if body is None:
+                    return self.send_plain(404, head)
+                if standin.chance(standin.error_rate):
+                    standin.count('errors_injected')
+                    return self.send_plain(503, head)
+
+                is_mp3 = path in standin.files
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                start, status = 0, 200
+                match = re.match(r"bytes=(\d+)-$", self.headers.get('Range', ''))
+                if_range = self.headers.get('If-Range')
+                if match and (if_range is None or if_range == etag):
+                    start = int(match.group(1))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{len(body)}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    status = 206
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'audio/mpeg' if is_mp3 else 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body) - start))
+                if is_mp3:
+                    self.send_header('Accept-Ranges', 'bytes')
+                    self.send_header('ETag', etag)
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+                self.end_headers()
+                if head:
+                    return
+
+                # A dropped connection cuts the body short at a random point
+                stop = len(body)
+                if is_mp3 and standin.chance(standin.drop_rate):
+                    standin.count('drops_injected')
+                    stop = start + (len(body) - start) // 2
+                    self.close_connection = True
+                self.send_body(body, start, stop)
+
+            def send_body(self, body: bytes, start: int, stop: int):
+                sent_at = time.perf_counter()
+                for offset in range(start, stop, CHUNK):
+                    chunk = body[offset:min(stop, offset + CHUNK)]
+                    try:
+                        self.wfile.write(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        self.close_connection = True
+                        return
+                    standin.count('bytes_sent', len(chunk))
+                    if standin.bandwidth:
+                        # Pace the connection to the configured rate
+                        due = sent_at + (offset + len(chunk) - start) / standin.bandwidth
+                        delay = due - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+
+            def send_plain(self, status: int, head: bool):
+                body = f"{status}\n".encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+def process_tree(pid: int) -> list:
+    """pid and all its descendants (Linux /proc)"""
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        for task in Path(f"/proc/{current}/task").glob("*"):
+            try:
+                todo.extend(int(c) for c in (task / "children").read_text().split())
+            except OSError:
+                pass
+    return pids
+
+def memory_kb(pid: int) -> tuple:
+    """(VmRSS, VmHWM) of one process in KB, zeros once it is gone"""
+    rss = hwm = 0
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1])
+            elif line.startswith("VmHWM:"):
+                hwm = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, hwm
+
+def run_stage(cmd: list, cwd: Path, env: dict, log_path: Path, interval: float = 0.05) -> dict:
+    """Run one stage in a child process; wall time, CPU time and peak memory
+
+    CPU comes from wait4(), so it includes the stage's own worker processes
+    but not the stand-in server running in this process. Memory is sampled
+    from /proc for the whole process tree: ru_maxrss would report this
+    process's size, which the child inherits at fork.
+    """
+    peak_hwm = peak_tree = 0
+    with open(log_path, 'w') as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            samples = [memory_kb(p) for p in process_tree(proc.pid)]
+            peak_hwm = max([peak_hwm] + [hwm for _, hwm in samples])
+            peak_tree = max(peak_tree, sum(rss for rss, _ in samples))
+            time.sleep(interval)
+        wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        'wall_s': round(wall, 3),
+        'cpu_user_s': round(usage.ru_utime, 3),
+        'cpu_sys_s': round(usage.ru_stime, 3),
+        'max_rss_mb': round(peak_hwm / 1024, 1),        # Largest single process
+        'peak_tree_rss_mb': round(peak_tree / 1024, 1),  # All processes of the stage at once
+        'exit_code': proc.returncode,
+    }
+
+def stage_commands(args, out_dir: Path, extra: list) -> dict:
+    python = sys.executable
+    return {
+        'scrape': [python, str(SCRIPTS_DIR / "download_okapi.py"), "--out", str(out_dir),
+                   "--start", "1", "--end", str(args.articles), "--threads", str(args.threads),
+                   "--no-page-cache", *extra],
+        'manifest': [python, str(SCRIPTS_DIR / "okapi_manifest.py"), str(out_dir), "--full"],
+        'segment': [python, str(SCRIPTS_DIR / "segment.py"), str(out_dir), "--workers", str(args.workers)],
+        'quality': [python, str(SCRIPTS_DIR / "quality_filter.py"), str(out_dir), "--workers", str(args.workers)],
+    }
+
+def corpus_stats(out_dir: Path) -> dict:
+    files = [f for f in out_dir.glob("*.mp3")]
+    audio_seconds = 0.0
+    manifest = out_dir / "manifest.json"
+    if manifest.exists():
+        entries = json.loads(manifest.read_text(encoding='utf-8'))
+        entries = entries.values() if isinstance(entries, dict) else entries
+        audio_seconds = sum(e.get('duration') or 0 for e in entries)
+    return {'files': len(files), 'bytes': sum(f.stat().st_size for f in files), 'audio_seconds': audio_seconds}
+
+def run_once(args, stages: list, base_url: str, standin: StandIn, extra: list) -> dict:
+    """All requested stages in a fresh working directory"""
+    work = Path(tempfile.mkdtemp(prefix="okapi_bench_", dir=args.work_dir))
+    out_dir = work / "okapi"
+    env = {**os.environ, 'OKAPI_SITE_URL': base_url, 'PYTHONDONTWRITEBYTECODE': '1'}
+    commands = stage_commands(args, out_dir, extra)
+    results = {}
+    try:
+        for stage in stages:
+            before = dict(standin.stats)
+            result = run_stage(commands[stage], work, env, work / f"{stage}.log")
+            if result['exit_code'] != 0:
+                print(f"⚠️  {stage} exited with {result['exit_code']} (log: {work / f'{stage}.log'})")
+            corpus = corpus_stats(out_dir)
+            if stage == 'scrape':
+                result.update({
+                    'articles': args.articles,
+                    'downloaded': corpus['files'],
+                    'downloaded_mb': round(corpus['bytes'] / 1024 / 1024, 2),
+                    'articles_per_s': round(args.articles / result['wall_s'], 2),
+                    'mb_per_s': round(corpus['bytes'] / 1024 / 1024 / result['wall_s'], 2),
+                    'server': {k: standin.stats[k] - before[k] for k in standin.stats},
+                })
+            elif stage in ('segment', 'quality') and corpus['audio_seconds']:
+                result['audio_seconds'] = round(corpus['audio_seconds'], 1)
+                result['realtime_factor'] = round(corpus['audio_seconds'] / result['wall_s'], 1)
+            results[stage] = result
+            print(f"   {stage:<9} {result['wall_s']:8.2f}s wall  "
+                  f"{result['cpu_user_s'] + result['cpu_sys_s']:8.2f}s CPU  {result['max_rss_mb']:7.1f} MB")
+    finally:
+        if args.keep_work:
+            print(f"   📁 Kept {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+def summarize(runs: list) -> dict:
+    """Median (and spread of wall time) of every numeric metric per stage"""
+    summary = {}
+    for stage in STAGE_ORDER:
+        measured = [run[stage] for run in runs if stage in run]
+        if not measured:
+            continue
+        summary[stage] = {key: median(m[key] for m in measured)
+                          for key, value in measured[0].items()
+                          if isinstance(value, (int, float)) and key != 'exit_code'}
+        walls = [m['wall_s'] for m in measured]
+        summary[stage]['wall_s_min'], summary[stage]['wall_s_max'] = min(walls), max(walls)
+    return summary
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(baseline: dict, current: dict):
+    """Print the change of each stage's medians against a baseline result"""
+    print(f"\n📊 {current.get('label') or 'current'} vs {baseline.get('label') or 'baseline'} "
+          f"({baseline.get('git_commit')} → {current.get('git_commit')})")
+    for stage, now in current['summary'].items():
+        before = baseline.get('summary', {}).get(stage)
+        if not before:
+            continue
+        for key in ('wall_s', 'cpu_user_s', 'max_rss_mb', 'articles_per_s', 'mb_per_s', 'realtime_factor'):
+            if key in now and before.get(key):
+                change = (now[key] - before[key]) / before[key] * 100
+                print(f"   {stage:<9} {key:<15} {before[key]:>10.2f} → {now[key]:>10.2f}  ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper and processing stages against a local stand-in",
+                                     epilog="Unrecognized arguments are passed through to download_okapi.py")
+    parser.add_argument("--stages", type=str, default=",".join(STAGE_ORDER),
+                        help=f"Comma-separated stages to run, in order ({', '.join(STAGE_ORDER)})")
+    parser.add_argument("--articles", type=int, default=20, help="Articles served by the stand-in")
+    parser.add_argument("--mp3-seconds", type=float, default=60.0, help="Length of each synthetic bulletin")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay before every response")
+    parser.add_argument("--bandwidth-mbps", type=float, help="Per-connection bandwidth cap (megabits/s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of MP3 responses cut off halfway")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the audio and injected faults")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration (medians are reported)")
+    parser.add_argument("--threads", type=int, default=3, help="Scraper threads")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processing-stage workers")
+    parser.add_argument("--label", type=str, help="Name of this configuration in the results")
+    parser.add_argument("--output", type=str, help="Results JSON (default: data/benchmarks/<label>_<time>.json)")
+    parser.add_argument("--compare", type=str, help="Earlier results JSON to compare against")
+    parser.add_argument("--work-dir", type=str, help="Where the temporary corpora are created")
+    parser.add_argument("--keep-work", action="store_true", help="Keep each run's corpus and stage logs")
+    parser.add_argument("--serve-only", action="store_true", help="Only run the stand-in server")
+    parser.add_argument("--port", type=int, default=0, help="Stand-in port (default: any free port)")
+    args, extra = parser.parse_known_args()
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_ORDER]
+    if unknown:
+        parser.error(f"Unknown stage(s): {', '.join(unknown)}")
+    print(f"🎛️  Preparing stand-in: {args.articles} articles, {args.mp3_seconds:.0f}s bulletins")
+    standin = StandIn(args.articles, [DEFAULT_SECTION], args.mp3_seconds,
+                      latency=args.latency_ms / 1000,
+                      bandwidth=args.bandwidth_mbps * 1e6 / 8 if args.bandwidth_mbps else None,
+                      error_rate=args.error_rate, drop_rate=args.drop_rate, seed=args.seed)
+    base_url = standin.start(args.port)
+    print(f"🌐 Stand-in at {base_url} (OKAPI_SITE_URL={base_url} points the scraper at it)")
+
+    if args.serve_only:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        standin.stop()
+        return
+
+    runs = []
+    try:
+        for i in range(args.repeat):
+            print(f"🏁 Run {i + 1}/{args.repeat}")
+            runs.append(run_once(args, stages, base_url, standin, extra))
+    finally:
+        standin.stop()
+
+    result = {
+        'label': args.label,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': {
+            'articles': args.articles, 'mp3_seconds': args.mp3_seconds,
+            'latency_ms': args.latency_ms, 'bandwidth_mbps': args.bandwidth_mbps,
+            'error_rate': args.error_rate, 'drop_rate': args.drop_rate, 'seed': args.seed,
+            'threads': args.threads, 'workers': args.workers, 'scraper_args': extra,
+            'stages': stages, 'repeat': args.repeat,
+        },
+        'runs': runs,
+        'summary': summarize(runs),
+    }
+
+    output = Path(args.output) if args.output else \
+        Path("data/benchmarks") / f"{args.label or 'benchmark'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"💾 Results: {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), result)
+
+    failed = [stage for run in runs for stage, r in run.items() if r['exit_code'] != 0]
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Segment-level language/dialect labelling
+Each segment is summarized by pooled log-mel statistics (computed for all
+segments of a file at once from cumulative sums over the cached features)
+and scored by a linear softmax head in NumPy. The head is trained on the
+section languages in the manifest (Lingala / Kikongo / Tshiluba), plus any
+hand labels such as French code-switching. Labels and confidences are
+written back to the manifest; already-labelled segments are skipped.
+Usage: python dialect_classifier.py data/raw/okapi --train
+       python dialect_classifier.py data/raw/okapi
+"""
+# filepath: scripts/dialect_classifier.py
+
+import os, sys, json, hashlib, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_cache import N_MELS, HOP, DEFAULT_MAX_MB, add_cache_arguments, open_cache, log_mel_blocks
+from audio_stream import TARGET_SR
+from okapi_manifest import (
+    audio_index, find_manifest_dirs, load_manifest, segment_field, segments_hash, update_entries,
+)
+
+DEFAULT_MODEL = "models/dialect_linear.npz"
+FRAMES_PER_SECOND = TARGET_SR / HOP
+EMBED_DIM = 3 * N_MELS
+
+def embed_segments(mel: np.ndarray, segments: list) -> np.ndarray:
+    """(len(segments), EMBED_DIM) pooled features: mel mean, std and mean |delta|
+
+    Uses cumulative sums so every segment of a file is pooled in one
+    vectorized pass. The file mean is removed first to keep float32 sums
+    accurate, then added back.
+    """
+    if not len(mel) or not segments:
+        return np.zeros((len(segments), EMBED_DIM), dtype=np.float32)
+    bounds = np.clip((np.asarray(segments) * FRAMES_PER_SECOND).astype(np.int64), 0, len(mel))
+    starts, ends = bounds[:, 0], np.maximum(bounds[:, 1], bounds[:, 0] + 1)
+    ends = np.minimum(ends, len(mel))
+    starts = np.minimum(starts, ends - 1)
+    counts = (ends - starts)[:, None].astype(np.float32)
+
+    offset = mel.mean(axis=0, dtype=np.float64).astype(np.float32)
+    centered = mel - offset
+    zero = np.zeros((1, mel.shape[1]), dtype=np.float32)
+
+    def window_sums(values):
+        cumulative = np.concatenate((zero, np.cumsum(values, axis=0, dtype=np.float32)))
+        return cumulative[ends] - cumulative[starts]
+
+    mean = window_sums(centered) / counts
+    var = np.maximum(window_sums(centered ** 2) / counts - mean ** 2, 0)
+    delta = np.concatenate((zero, np.abs(np.diff(centered, axis=0))))
+    # The first frame of a segment has no in-segment predecessor
+    delta_sum = window_sums(delta) - delta[starts]
+    delta_mean = delta_sum / np.maximum(counts - 1, 1)
+    return np.hstack((mean + offset, np.sqrt(var), delta_mean)).astype(np.float32)
+
+def file_mel(path: str, sha256: str, cache_root: str, cache_mb: float) -> np.ndarray:
+    cache = open_cache(cache_root, cache_mb)
+    if cache is not None:
+        return cache.logmel(Path(path), sha256)
+    from audio_stream import stream_audio
+    pcm = np.concatenate([(b * 32768).clip(-32768, 32767).astype(np.int16) for b in stream_audio(Path(path))])
+    return np.concatenate(list(log_mel_blocks(pcm)))
+
+class LinearHead:
+    """Standardized features -> softmax over classes"""
+
+    def __init__(self, classes: list, mean: np.ndarray, scale: np.ndarray, weights: np.ndarray, bias: np.ndarray):
+        self.classes = list(classes)
+        self.mean, self.scale = mean, scale
+        self.weights, self.bias = weights, bias
+
+    @classmethod
+    def load(cls, path: Path) -> 'LinearHead':
+        with np.load(path) as data:
+            head = cls([str(c) for c in data['classes']], data['mean'], data['scale'], data['weights'], data['bias'])
+        head.version = hashlib.sha256(Path(path).read_bytes()).hexdigest()[:12]
+        return head
+
+    def save(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, classes=np.array(self.classes), mean=self.mean, scale=self.scale,
+                 weights=self.weights, bias=self.bias)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        logits = ((features - self.mean) / self.scale) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: list, l2: float = 1e-3, lr: float = 0.5,
+            epochs: int = 500) -> 'LinearHead':
+        """Full-batch gradient descent on class-balanced cross-entropy"""
+        classes = sorted(set(labels))
+        y = np.array([classes.index(label) for label in labels])
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        x = (features - mean) / scale
+
+        onehot = np.eye(len(classes), dtype=np.float32)[y]
+        sample_weight = (len(y) / (len(classes) * np.bincount(y, minlength=len(classes))))[y][:, None]
+        weights = np.zeros((x.shape[1], len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        head = cls(classes, mean, scale, weights, bias)
+        for _ in range(epochs):
+            grad = (head.predict_proba(features) - onehot) * sample_weight / len(y)
+            head.weights -= lr * (x.T @ grad + l2 * head.weights)
+            head.bias -= lr * grad.sum(axis=0)
+        return head
+
+# Per-process state for the pool
+_head = None
+
+def _init_worker(model_path: str):
+    global _head
+    _head = LinearHead.load(Path(model_path))
+
+def embed_file(path: str, sha256: str, segments: list, cache_root: str = None,
+               cache_mb: float = DEFAULT_MAX_MB) -> np.ndarray:
+    return embed_segments(file_mel(path, sha256, cache_root, cache_mb), segments)
+
+def label_file(path: str, sha256: str, segments: list, cache_root: str = None,
+               cache_mb: float = DEFAULT_MAX_MB) -> list:
+    """[[label, confidence], ...] for each segment of one file"""
+    probs = _head.predict_proba(embed_file(path, sha256, segments, cache_root, cache_mb))
+    best = probs.argmax(axis=1)
+    return [[_head.classes[i], round(float(p), 3)] for i, p in zip(best, probs[np.arange(len(best)), best])]
+
+def load_hand_labels(path: Path) -> dict:
+    """{(filename, segment): label} from a JSONL of hand labels"""
+    labels = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                labels[(record['filename'], record['segment'])] = record['label']
+    return labels
+
+def train(args, corpus: list, cache_root_for):
+    hand = load_hand_labels(Path(args.labels)) if args.labels else {}
+    features, labels, groups = [], [], []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(embed_file, str(path), entry.get('sha256'), entry['segments'],
+                                   cache_root_for(manifest_dir), args.audio_cache_mb): (filename, entry)
+                   for manifest_dir, filename, entry, path in corpus}
+        for future in as_completed(futures):
+            filename, entry = futures[future]
+            try:
+                embedded = future.result()
+            except Exception as e:
+                print(f"❌ {filename}: {e}")
+                continue
+            for index, vector in enumerate(embedded):
+                # Hand labels win; otherwise the section's language
+                label = hand.get((filename, index), entry.get('language'))
+                if label:
+                    features.append(vector)
+                    labels.append(label)
+                    groups.append(filename)
+
+    if len(set(labels)) < 2:
+        print(f"❌ Need at least two languages to train, found {sorted(set(labels))}")
+        sys.exit(1)
+
+    features = np.stack(features)
+    # Hold out whole files so the score isn't inflated by same-bulletin segments
+    held_out = np.array([int(hashlib.md5(g.encode()).hexdigest(), 16) % 10 == 0 for g in groups])
+    if held_out.any() and (~held_out).any() and len(set(np.array(labels)[~held_out])) > 1:
+        head = LinearHead.fit(features[~held_out], [l for l, h in zip(labels, held_out) if not h])
+        probs = head.predict_proba(features[held_out])
+        predicted = np.array(head.classes)[probs.argmax(axis=1)]
+        accuracy = np.mean(predicted == np.array(labels)[held_out])
+        print(f"🎯 Held-out accuracy: {accuracy:.3f} on {held_out.sum()} segments")
+
+    head = LinearHead.fit(features, labels)
+    head.save(Path(args.model))
+    counts = {c: labels.count(c) for c in head.classes}
+    print(f"💾 Saved {args.model}: {len(labels)} segments, classes {counts}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Label segments with their language/dialect")
+    parser.add_argument("manifest_dirs", nargs="*", default=["data/raw/okapi"],
+                        help="Directories with manifest.json (section subdirectories are included)")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL, help="Linear head weights (.npz)")
+    parser.add_argument("--train", action="store_true", help="Fit the head on section languages and --labels")
+    parser.add_argument("--labels", type=str, help="JSONL of hand labels {filename, segment, label} (e.g. French)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--force", action="store_true", help="Relabel segments already labelled by this model")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    def cache_root_for(manifest_dir):
+        return None if args.no_audio_cache else str(manifest_dir)
+
+    corpus = []
+    for manifest_dir in find_manifest_dirs(args.manifest_dirs):
+        paths = audio_index(manifest_dir)
+        for filename, entry in load_manifest(manifest_dir).items():
+            if entry.get('segments') and not entry.get('duplicate_of') and filename in paths:
+                corpus.append((manifest_dir, filename, entry, paths[filename]))
+    if not corpus:
+        print("❌ No segmented files found (run segment.py first)")
+        sys.exit(1)
+
+    if args.train:
+        train(args, corpus, cache_root_for)
+        return
+
+    if not Path(args.model).exists():
+        print(f"❌ No model at {args.model} (train one with --train)")
+        sys.exit(1)
+    head = LinearHead.load(Path(args.model))
+
+    todo = [item for item in corpus if args.force
+            or item[2].get('dialect_model') != head.version
+            or segment_field(item[2], 'dialect_labels') is None]
+    print(f"🏷️  {len(todo)} files to label, {len(corpus) - len(todo)} already labelled by model {head.version}")
+
+    updates = {}
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.model,)) as executor:
+        futures = {executor.submit(label_file, str(path), entry.get('sha256'), entry['segments'],
+                                   cache_root_for(manifest_dir), args.audio_cache_mb): (manifest_dir, filename, entry)
+                   for manifest_dir, filename, entry, path in todo}
+        for future in as_completed(futures):
+            manifest_dir, filename, entry = futures[future]
+            try:
+                labels = future.result()
+            except Exception as e:
+                print(f"❌ {filename}: {e}")
+                continue
+            counts = {}
+            for label, _ in labels:
+                counts[label] = counts.get(label, 0) + 1
+            majority = max(counts, key=counts.get) if counts else None
+            updates.setdefault(manifest_dir, {})[filename] = {
+                'dialect_labels': labels,
+                'dialect_labels_hash': segments_hash(entry['segments']),
+                'dialect': majority,
+                'dialect_model': head.version,
+                # Share of segments not in the bulletin's own language
+                'code_switch_ratio': round(1 - counts.get(entry.get('language'), 0) / len(labels), 3) if labels else 0.0,
+            }
+            print(f"✅ {filename}: {counts}")
+
+    for manifest_dir, file_updates in updates.items():
+        changed = update_entries(manifest_dir, file_updates, args.manifest_format)
+        print(f"📋 Updated {changed} manifest entries in {manifest_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 #!/usr/bin/env python3
 """
-Automated Radio Okapi Lingala scraper with article number iteration
+Automated Radio Okapi scraper with article number iteration
 Usage: python download_okapi_auto.py --start 190 --end 200 --out data/raw/okapi
+       python download_okapi_auto.py --latest 10 --sections lingala,kikongo,tshiluba --out data/raw/okapi
 """
 # filepath: scripts/download_okapi_auto.py
 
 import re, sys, requests, json, time, argparse, logging
 from urllib.parse import urljoin
 from pathlib import Path
-from bs4 import BeautifulSoup
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from resumable import download_file, load_part_state
+from okapi_state import open_state
+from okapi_sources import DEFAULT_SECTION, SECTIONS, SITE_URL, get_sections, interleave
+from okapi_extract import extract
+from http_cache import CACHE_DIR, PageCache, cached_get_text
+from okapi_manifest import build_manifest
+from okapi_dedup import ContentStore
+from okapi_probe import find_latest, load_cached_latest, make_head_probe, save_cached_latest
+import metrics
 
 # Setup logging
 def setup_logging():
@@ -29,62 +38,73 @@ def setup_logging():
 
 logger = setup_logging()
 
-BASE_URL = "https://www.radiookapi.net/journal-journal-lingala/journal-lingala-matin-"
+BASE_URL = SECTIONS[DEFAULT_SECTION]['url']
+DATE_RE = re.compile(r'(\d{2})(\d{2})(\d{4})')
 
-def fetch_mp3_from_article(article_num: int) -> dict:
-    """Fetch MP3 from a specific article number"""
-    article_url = f"{BASE_URL}{article_num}"
+_session = None
+_page_cache = None  # PageCache for article HTML, set up in run()
+
+def get_session(pool_size: int = 10) -> requests.Session:
+    """Return the shared keep-alive session, creating it on first use"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def default_section() -> dict:
+    """Registry entry for the Lingala morning bulletin at BASE_URL"""
+    return {'key': DEFAULT_SECTION, **SECTIONS[DEFAULT_SECTION], 'url': BASE_URL}
+
+def parse_article(article_num: int, article_url: str, html: str, section: dict = None) -> dict:
+    """Extract MP3 link and metadata from article HTML"""
+    section = section or default_section()
+    with metrics.timer('parse_seconds'):
+        mp3_path, title = extract(html)
     
-    try:
-        response = requests.get(article_url, timeout=10)
-        response.raise_for_status()
-        html = response.text
+    if mp3_path:
+        mp3_url = urljoin(SITE_URL, mp3_path)
         
-        # Multiple patterns to try
-        patterns = [
-            r'(/sites/default/files/[^"\']+?\.mp3)',
-            r'href="(/sites/default/files/[^"]+\.mp3)"',
-            r"href='(/sites/default/files/[^']+\.mp3)'",
-        ]
+        # Try to extract date from content or filename
+        date_match = DATE_RE.search(mp3_path)
+        date = f"{date_match.group(1)}/{date_match.group(2)}/{date_match.group(3)}" if date_match else None
         
-        for pattern in patterns:
-            matches = re.findall(pattern, html)
-            if matches:
-                mp3_path = matches[0]
-                mp3_url = urljoin("https://www.radiookapi.net", mp3_path)
-                
-                # Extract metadata from page
-                soup = BeautifulSoup(html, 'html.parser')
-                title_elem = soup.find(['h1', 'h2', 'title'])
-                title = title_elem.get_text(strip=True) if title_elem else f"Journal Lingala Matin {article_num}"
-                
-                # Try to extract date from content or filename
-                date_match = re.search(r'(\d{2})(\d{2})(\d{4})', mp3_path)
-                date = f"{date_match.group(1)}/{date_match.group(2)}/{date_match.group(3)}" if date_match else None
-                
-                return {
-                    'article_num': article_num,
-                    'article_url': article_url,
-                    'mp3_url': mp3_url,
-                    'title': title,
-                    'date': date,
-                    'filename': Path(mp3_path).name,
-                    'found': True
-                }
-        
-        logger.warning(f"No MP3 found in article {article_num}")
-        return {'article_num': article_num, 'found': False, 'error': 'No MP3 found'}
+        return {
+            'article_num': article_num,
+            'article_url': article_url,
+            'mp3_url': mp3_url,
+            'title': title or f"{section['title']} {article_num}",
+            'date': date,
+            'filename': Path(mp3_path).name,
+            'section': section['key'],
+            'found': True
+        }
+    
+    logger.warning(f"No MP3 found in {section['key']} article {article_num}")
+    return {'article_num': article_num, 'section': section['key'], 'found': False, 'error': 'No MP3 found'}
+
+def fetch_mp3_from_article(article_num: int, section: dict = None) -> dict:
+    """Fetch MP3 from a specific article number"""
+    section = section or default_section()
+    article_url = f"{section['url']}{article_num}"
+    missing = {'article_num': article_num, 'section': section['key'], 'found': False}
+    
+    try:
+        html = cached_get_text(get_session(), _page_cache, article_url)
+        return parse_article(article_num, article_url, html, section)
         
     except requests.exceptions.RequestException as e:
-        if e.response and e.response.status_code == 404:
+        if e.response is not None and e.response.status_code == 404:
             logger.info(f"Article {article_num} not found (404)")
-            return {'article_num': article_num, 'found': False, 'error': '404 Not Found'}
+            return {**missing, 'error': '404 Not Found'}
         else:
             logger.error(f"Error fetching article {article_num}: {e}")
-            return {'article_num': article_num, 'found': False, 'error': str(e)}
+            return {**missing, 'error': str(e)}
     except Exception as e:
         logger.error(f"Unexpected error for article {article_num}: {e}")
-        return {'article_num': article_num, 'found': False, 'error': str(e)}
+        return {**missing, 'error': str(e)}
 
 def download_mp3(mp3_info: dict, output_dir: Path) -> bool:
     """Download MP3 file"""
@@ -94,31 +114,34 @@ def download_mp3(mp3_info: dict, output_dir: Path) -> bool:
     filename = mp3_info['filename']
     output_path = output_dir / filename
     
-    # Skip if file already exists
+    # Only completed downloads are renamed into place, so this is never a partial file
     if output_path.exists():
         logger.info(f"⏭️  Skipping existing file: {filename}")
+        mp3_info['file_size'] = output_path.stat().st_size
         return True
     
     try:
-        logger.info(f"⬇️  Downloading: {filename}")
+        offset, _ = load_part_state(output_path)
+        if offset:
+            logger.info(f"⏯️  Resuming: {filename} from {offset / 1024 / 1024:.1f} MB")
+        else:
+            logger.info(f"⬇️  Downloading: {filename}")
         
-        response = requests.get(mp3_info['mp3_url'], stream=True, timeout=30)
-        response.raise_for_status()
+        def on_retry(attempt, e):
+            metrics.inc('retries_total', kind='download')
+            logger.warning(f"🔁 Retry {attempt} for {filename}: {e}")
         
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with metrics.timer('request_seconds', kind='download'):
+            mp3_info.update(download_file(get_session(), mp3_info['mp3_url'], output_path, on_retry=on_retry))
+        metrics.inc('bytes_total', mp3_info['file_size'] - offset, direction='down')
         
-        size_mb = output_path.stat().st_size / 1024 / 1024
-        logger.info(f"✅ Downloaded: {filename} ({size_mb:.1f} MB)")
+        logger.info(f"✅ Downloaded: {filename} ({mp3_info['file_size'] / 1024 / 1024:.1f} MB)")
         
         return True
         
     except Exception as e:
+        # Keep the .part file so the next run resumes instead of starting over
         logger.error(f"❌ Download failed for {filename}: {e}")
-        if output_path.exists():
-            output_path.unlink()  # Remove partial file
         return False
 
 def save_metadata(mp3_info: dict, output_dir: Path):
@@ -140,190 +163,278 @@ def save_metadata(mp3_info: dict, output_dir: Path):
         'audio_url': mp3_info['mp3_url'],
         'filename': mp3_info['filename'],
         'downloaded_at': datetime.now().isoformat(),
-        'source': 'radio_okapi_lingala'
+        'source': SECTIONS[mp3_info.get('section', DEFAULT_SECTION)]['source']
     }
     
     with open(metadata_file, 'w', encoding='utf-8') as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
 
-def find_article_range(start_num: int = None, end_num: int = None) -> tuple:
+def find_article_range(start_num: int = None, end_num: int = None,
+                       output_dir: Path = None, gap: int = 5, base_url: str = None) -> tuple:
     """Find valid article number range by probing"""
     logger.info("🔍 Finding valid article range...")
     
     if start_num and end_num:
         return start_num, end_num
     
-    # If no range specified, find the current range
-    current_num = 1  # Start from a reasonable number
+    # Start from the last known maximum so only the new articles get probed
+    base_url = base_url or BASE_URL
+    hint = load_cached_latest(output_dir, base_url) if output_dir else None
+    exists = make_head_probe(get_session(), base_url)
+    max_num = find_latest(exists, hint=hint, gap=gap)
+    logger.info(f"🔎 Probed {len(exists.probes)} article numbers (cached max: {hint})")
     
-    # Find the highest available article
-    while current_num < 20:  # Safety limit
-        result = fetch_mp3_from_article(current_num)
-        if result.get('error') == '404 Not Found':
-            break
-        current_num += 1
-        time.sleep(0.1)  # Small delay
+    if output_dir and max_num:
+        save_cached_latest(output_dir, base_url, max_num)
     
-    max_num = current_num - 1
-    min_num = max(1, max_num - 10)  # Get last 5 articles
+    min_num = max(1, max_num - 10)  # Get last 10 articles
     
     logger.info(f"📊 Found article range: {min_num} to {max_num}")
     return min_num, max_num
 
-def load_processed_articles(output_dir: Path) -> set:
-    """Load list of already processed articles"""
-    processed_file = output_dir / "processed_articles.json"
-    if processed_file.exists():
-        with open(processed_file, 'r') as f:
-            return set(json.load(f))
-    return set()
+def generate_manifest(output_dir: Path, state=None, fmt: str = "json", full: bool = False,
+                      language: str = 'ln', root: Path = None):
+    """Update dataset manifest with only the files that changed"""
+    builder = build_manifest(output_dir, state, fmt, full, language=language, root=root)
+    
+    if builder.changed or builder.removed:
+        logger.info(f"📋 Updated manifest: {len(builder.changed)} changed, {len(builder.removed)} removed, {len(builder.entries)} files")
+    else:
+        logger.info(f"📋 Manifest up to date ({len(builder.entries)} files)")
 
-def save_processed_articles(output_dir: Path, processed: set):
-    """Save list of processed articles"""
-    processed_file = output_dir / "processed_articles.json"
-    with open(processed_file, 'w') as f:
-        json.dump(list(processed), f, indent=2)
+def open_page_cache(output_dir: Path, max_mb: int) -> PageCache:
+    """Open the shared article page cache, reusing it if already open for output_dir"""
+    global _page_cache
+    cache_dir = output_dir / CACHE_DIR
+    if _page_cache is not None and _page_cache.cache_dir != cache_dir:
+        close_page_cache()
+    if _page_cache is None:
+        _page_cache = PageCache(cache_dir, max_bytes=max_mb * 1024 * 1024)
+    return _page_cache
 
-def generate_manifest(output_dir: Path):
-    """Generate dataset manifest"""
-    manifest = []
-    
-    for mp3_file in output_dir.glob("*.mp3"):
-        metadata_file = output_dir / "metadata" / f"{mp3_file.stem}.json"
-        
-        if metadata_file.exists():
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
-        else:
-            metadata = {
-                'title': mp3_file.stem,
-                'article_number': None,
-                'date': None
-            }
-        
-        manifest.append({
-            'audio_path': str(mp3_file.relative_to(output_dir.parent.parent)),
-            'filename': mp3_file.name,
-            'title': metadata.get('title', mp3_file.stem),
-            'article_number': metadata.get('article_number'),
-            'date': metadata.get('date'),
-            'source': 'radio_okapi',
-            'source_url': metadata.get('source_url'),
-            'file_size': mp3_file.stat().st_size,
-            'language': 'ln',
-            'needs_transcription': True
-        })
-    
-    manifest_file = output_dir / "manifest.json"
-    with open(manifest_file, 'w', encoding='utf-8') as f:
-        json.dump(manifest, f, indent=2, ensure_ascii=False)
-    
-    logger.info(f"📋 Generated manifest with {len(manifest)} files")
+def close_page_cache():
+    global _page_cache
+    if _page_cache is not None:
+        _page_cache.close()
+        _page_cache = None
 
-def main():
-    parser = argparse.ArgumentParser(description="Automated Radio Okapi Lingala scraper")
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Automated Radio Okapi scraper")
     parser.add_argument("--start", type=int, help="Start article number")
     parser.add_argument("--end", type=int, help="End article number")
     parser.add_argument("--out", type=str, default="data/raw/okapi", help="Output directory")
+    parser.add_argument("--sections", "--languages", dest="sections", type=str,
+                        help=f"Comma-separated sections to crawl into <out>/<section> ({', '.join(SECTIONS)}); "
+                             f"default: Lingala morning bulletin straight into --out")
     parser.add_argument("--threads", type=int, default=3, help="Number of concurrent downloads")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads", help="Scraping engine")
+    parser.add_argument("--page-workers", type=int, default=8, help="Concurrent page fetches (async engine)")
+    parser.add_argument("--download-workers", type=int, default=4, help="Concurrent MP3 downloads (async engine)")
+    parser.add_argument("--rate", type=float, default=10.0, help="Max requests per second per host, shared by all sections (async engine)")
     parser.add_argument("--incremental", action="store_true", help="Skip already processed articles")
     parser.add_argument("--latest", type=int, help="Download only the latest N articles")
+    parser.add_argument("--no-page-cache", action="store_true", help="Always re-download article HTML")
+    parser.add_argument("--cache-size-mb", type=int, default=200, help="Size cap of the article page cache")
+    parser.add_argument("--probe-gap", type=int, default=5, help="Missing article numbers tolerated when probing for the latest")
     parser.add_argument("--metadata", action="store_true", default=True, help="Save metadata")
     parser.add_argument("--manifest", action="store_true", default=True, help="Generate manifest")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format (jsonl is append-only)")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="Stat every file instead of applying crawl state changes")
+    metrics.add_metrics_arguments(parser)
+    return parser
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    return build_parser().parse_args(argv)
+
+def run(args: argparse.Namespace, keep_warm: bool = False) -> dict:
+    """One crawl; returns a summary of the run
     
-    args = parser.parse_args()
-    
+    With keep_warm the page cache stays open (and the HTTP session is kept
+    anyway), so a long-running caller such as schedule_okapi.py reuses them
+    on the next run.
+    """
     # Setup directories
     output_dir = Path(args.out)
     output_dir.mkdir(parents=True, exist_ok=True)
+    metrics.configure_from_args(args)
     
-    # Load processed articles for incremental mode
-    processed_articles = load_processed_articles(output_dir) if args.incremental else set()
+    # Conditional cache for article pages (shared by all sections)
+    if args.no_page_cache:
+        close_page_cache()
+    else:
+        open_page_cache(output_dir, args.cache_size_mb)
     
-    # Determine article range
-    if args.latest:
-        # Find current max and go backwards
-        _, max_num = find_article_range()
-        start_num = max(1, max_num - args.latest + 1)
-        end_num = max_num
+    # Without --sections keep the original layout: Lingala matin straight into --out
+    if args.sections:
+        sections = get_sections(args.sections)
     else:
-        start_num, end_num = find_article_range(args.start, args.end)
+        sections = [{**default_section(), 'subdir': ''}]
+    
+    # Per-section output directory, crawl state and article numbers
+    contexts = {}
+    with metrics.stage('probe'):
+        for section in sections:
+            section_dir = output_dir / section['subdir']
+            section_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Crawl state (imports processed_articles.json and metadata/ on first run)
+            state = open_state(section_dir, section['source'], logger=logger)
+            
+            # Determine article range
+            if args.latest:
+                # Find current max and go backwards
+                _, max_num = find_article_range(output_dir=output_dir, gap=args.probe_gap, base_url=section['url'])
+                start_num = max(1, max_num - args.latest + 1)
+                end_num = max_num
+            else:
+                start_num, end_num = find_article_range(args.start, args.end, output_dir=output_dir,
+                                                        gap=args.probe_gap, base_url=section['url'])
+            
+            # Generate article numbers to process
+            if args.incremental:
+                article_numbers = state.pending(start_num, end_num)
+            else:
+                article_numbers = list(range(start_num, end_num + 1))
+            
+            contexts[section['key']] = {'section': section, 'dir': section_dir, 'state': state, 'numbers': article_numbers}
+            logger.info(f"🚀 [{section['key']}] articles {start_num} to {end_num}: {len(article_numbers)} to process")
     
-    logger.info(f"🚀 Starting scrape of articles {start_num} to {end_num}")
     logger.info(f"📁 Output directory: {output_dir}")
-    logger.info(f"🧵 Using {args.threads} threads")
+    if args.engine == "async":
+        logger.info(f"⚡ Async engine: {args.page_workers} page / {args.download_workers} download workers, {args.rate} req/s per host")
+    else:
+        logger.info(f"🧵 Using {args.threads} threads")
     logger.info(f"🔄 Incremental mode: {args.incremental}")
     
-    # Generate article numbers to process
-    article_numbers = []
-    for num in range(start_num, end_num + 1):
-        if args.incremental and num in processed_articles:
-            continue
-        article_numbers.append(num)
+    # Round-robin across sections so one long backfill can't starve the others
+    jobs = interleave(*([(ctx['section'], num) for num in ctx['numbers']] for ctx in contexts.values()))
+    
+    logger.info(f"📊 Processing {len(jobs)} articles across {len(contexts)} section(s)")
+    metrics.set_gauge('queue_depth', len(jobs), queue='articles')
     
-    logger.info(f"📊 Processing {len(article_numbers)} articles")
+    # Content-addressed store shared by all sections
+    store = ContentStore(output_dir)
     
-    # Process articles with threading
+    # Process articles
     successful_downloads = 0
     failed_downloads = 0
     processed_count = 0
     
-    with ThreadPoolExecutor(max_workers=args.threads) as executor:
-        # Submit all article fetching tasks
-        future_to_num = {
-            executor.submit(fetch_mp3_from_article, num): num 
-            for num in article_numbers
-        }
+    def handle_result(mp3_info: dict, downloaded):
+        """Save metadata and commit one article's outcome to its section's state"""
+        nonlocal successful_downloads, failed_downloads
+        ctx = contexts[mp3_info['section']]
+        if downloaded:
+            successful_downloads += 1
+            # Same bulletin under another name: share one copy on disk
+            if mp3_info.get('sha256') and store.adopt(ctx['dir'] / mp3_info['filename'], mp3_info['sha256']):
+                logger.info(f"♻️  Duplicate content: {mp3_info['filename']}")
+            if args.metadata:
+                save_metadata(mp3_info, ctx['dir'])
+        elif downloaded is False:
+            failed_downloads += 1
+        if downloaded is not None:
+            result = 'downloaded' if downloaded else 'failed'
+        elif mp3_info.get('error') in ('No MP3 found', '404 Not Found'):
+            result = 'no_mp3'
+        else:
+            result = 'page_error'
+        metrics.inc('items_total', stage='scrape', result=result)
         
-        for future in as_completed(future_to_num):
-            article_num = future_to_num[future]
-            processed_count += 1
-            
-            try:
-                mp3_info = future.result()
+        # Commit this article's outcome right away
+        ctx['state'].record_result(mp3_info, downloaded)
+    
+    with metrics.stage('crawl'):
+        if args.engine == "async":
+            import asyncio
+            from okapi_async import crawl
+
+            def on_result(mp3_info: dict, downloaded):
+                nonlocal failed_downloads, processed_count
+                processed_count += 1
+                metrics.set_gauge('queue_depth', len(jobs) - processed_count, queue='articles')
+                try:
+                    handle_result(mp3_info, downloaded)
                 
-                if mp3_info.get('found'):
-                    # Download the MP3
-                    if download_mp3(mp3_info, output_dir):
-                        successful_downloads += 1
-                        
-                        # Save metadata
-                        if args.metadata:
-                            save_metadata(mp3_info, output_dir)
-                    else:
-                        failed_downloads += 1
-                else:
-                    # Still count as processed
-                    pass
+                    if processed_count % 10 == 0:
+                        logger.info(f"📈 Progress: {processed_count}/{len(jobs)} articles processed")
+                except Exception as e:
+                    logger.error(f"Error processing article {mp3_info['article_num']}: {e}")
+                    failed_downloads += 1
+        
+            asyncio.run(crawl(
+                [(section, num, contexts[section['key']]['dir']) for section, num in jobs],
+                parse_article, on_result,
+                page_workers=args.page_workers,
+                download_workers=args.download_workers,
+                rate=args.rate,
+                cache=_page_cache,
+            ))
+        else:
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                # Submit all article fetching tasks
+                future_to_job = {
+                    executor.submit(fetch_mp3_from_article, num, section): (section, num)
+                    for section, num in jobs
+                }
+        
+                for future in as_completed(future_to_job):
+                    section, article_num = future_to_job[future]
+                    processed_count += 1
+                    metrics.set_gauge('queue_depth', len(jobs) - processed_count, queue='articles')
+            
+                    try:
+                        mp3_info = future.result()
                 
-                # Update processed list
-                processed_articles.add(article_num)
+                        downloaded = None
+                        if mp3_info.get('found'):
+                            # Download the MP3
+                            downloaded = download_mp3(mp3_info, contexts[section['key']]['dir'])
+                    
+                        handle_result(mp3_info, downloaded)
                 
-                # Progress update
-                if processed_count % 10 == 0:
-                    logger.info(f"📈 Progress: {processed_count}/{len(article_numbers)} articles processed")
+                        # Progress update
+                        if processed_count % 10 == 0:
+                            logger.info(f"📈 Progress: {processed_count}/{len(jobs)} articles processed")
                 
-            except Exception as e:
-                logger.error(f"Error processing article {article_num}: {e}")
-                failed_downloads += 1
+                    except Exception as e:
+                        logger.error(f"Error processing article {article_num}: {e}")
+                        failed_downloads += 1
             
-            # Small delay between requests
-            time.sleep(0.1)
+                    # Small delay between requests
+                    time.sleep(0.1)
     
-    # Save processed articles list
-    if args.incremental:
-        save_processed_articles(output_dir, processed_articles)
+    # Generate manifests
+    with metrics.stage('manifest'):
+        for ctx in contexts.values():
+            if args.manifest:
+                generate_manifest(ctx['dir'], ctx['state'], args.manifest_format, args.rebuild_manifest,
+                                  language=ctx['section']['language'])
+            ctx['state'].close()
     
-    # Generate manifest
-    if args.manifest:
-        generate_manifest(output_dir)
+    if not keep_warm:
+        close_page_cache()
     
     # Summary
     logger.info(f"🎉 Scraping complete!")
     logger.info(f"✅ Successful downloads: {successful_downloads}")
     logger.info(f"❌ Failed downloads: {failed_downloads}")
-    logger.info(f"📁 Total files: {len(list(output_dir.glob('*.mp3')))}")
+    for key, ctx in contexts.items():
+        logger.info(f"📁 Total files [{key}]: {len(list(ctx['dir'].glob('*.mp3')))}")
     logger.info(f"💾 Output directory: {output_dir}")
+    metrics.export_from_args(args)
+    
+    return {
+        'successful': successful_downloads,
+        'failed': failed_downloads,
+        'processed': processed_count,
+        'sections': {key: {'dir': str(ctx['dir']), 'language': ctx['section']['language'],
+                           'source': ctx['section']['source']}
+                     for key, ctx in contexts.items()},
+    }
+
+def main():
+    run(parse_args())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Top Congo FM ingester
+Playlists, channels and podcast feeds are resolved lazily with yt-dlp and
+their episodes fetched concurrently as audio-only streams. MP3 streams are
+kept as they are (and resumed with Range requests); anything else is
+transcoded on the fly to 16 kHz mono MP3 by ffmpeg reading the stream
+directly, so no video or intermediate file is written. Output matches the
+Radio Okapi scraper: <out>/*.mp3, metadata/<stem>.json and manifest.json.
+Episode IDs already fetched are kept in a SQLite index and skipped.
+Local directories of media files are accepted as sources, and so is any
+HTTP server yt-dlp can read (e.g. an RSS feed with enclosures), which
+lets the ingester run offline against fixtures.
+Usage: python download_topcongo.py "https://www.youtube.com/playlist?list=<id>" --out data/raw/topcongo
+       python download_topcongo.py http://127.0.0.1:8000/feed.xml --out data/test/topcongo
+       python download_topcongo.py fixtures/topcongo/ --out data/test/topcongo
+"""
+# filepath: scripts/download_topcongo.py
+
+import re, sys, json, shutil, sqlite3, hashlib, logging, argparse, threading, subprocess
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from resumable import download_file
+from okapi_dedup import ContentStore, file_sha256
+from okapi_manifest import build_manifest
+from audio_stream import TARGET_SR
+
+logger = logging.getLogger(__name__)
+
+SOURCE = "top_congo"
+INDEX_DB = "episode_index.sqlite"
+MEDIA_SUFFIXES = {".mp3", ".m4a", ".aac", ".opus", ".ogg", ".oga", ".webm", ".mp4", ".wav", ".flac"}
+# Read by libsndfile, so local files can be transcoded without ffmpeg
+SOUNDFILE_SUFFIXES = {".wav", ".flac", ".ogg", ".oga", ".opus"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    episode_id    TEXT PRIMARY KEY,
+    status        TEXT NOT NULL,
+    title         TEXT,
+    date          TEXT,
+    source_url    TEXT,
+    filename      TEXT,
+    sha256        TEXT,
+    file_size     INTEGER,
+    error         TEXT,
+    updated_at    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_updated ON episodes (status, updated_at);
+"""
+
+class EpisodeIndex:
+    """Persistent record of the episodes seen, keyed by source episode ID
+
+    Also serves build_manifest() like the Okapi crawl state does, so the
+    manifest is updated from the episodes changed since the last build.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db = sqlite3.connect(db_path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def is_done(self, episode_id: str) -> bool:
+        row = self.db.execute("SELECT status FROM episodes WHERE episode_id = ?", (episode_id,)).fetchone()
+        return row is not None and row['status'] == 'downloaded'
+
+    def record(self, episode_id: str, status: str, **fields):
+        """Insert or update one episode and commit"""
+        columns = ["episode_id", "status", "updated_at", *fields]
+        values = [episode_id, status, datetime.now().isoformat(), *fields.values()]
+        updates = ", ".join(f"{col} = excluded.{col}" for col in columns[1:])
+        self.db.execute(
+            f"INSERT INTO episodes ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (episode_id) DO UPDATE SET {updates}",
+            values,
+        )
+        self.db.commit()
+
+    def changed_since(self, cursor: str = None) -> list:
+        """Downloaded episodes updated after `cursor`, as crawl-state rows"""
+        rows = self.db.execute(
+            "SELECT *, source_url AS article_url FROM episodes "
+            "WHERE status = 'downloaded' AND updated_at > ? ORDER BY updated_at",
+            (cursor or "",),
+        )
+        return [dict(row) for row in rows]
+
+    def status_counts(self) -> dict:
+        rows = self.db.execute("SELECT status, COUNT(*) AS n FROM episodes GROUP BY status")
+        return {row['status']: row['n'] for row in rows}
+
+def slug(text: str, limit: int = 48) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", text).strip("-")[:limit] or "episode"
+
+def format_date(info: dict) -> str:
+    """dd/mm/yyyy like the Okapi metadata, from upload_date or a timestamp"""
+    if info.get('upload_date'):
+        return datetime.strptime(info['upload_date'], "%Y%m%d").strftime("%d/%m/%Y")
+    if info.get('timestamp'):
+        return datetime.fromtimestamp(info['timestamp']).strftime("%d/%m/%Y")
+    return None
+
+def episode_filename(episode: dict) -> str:
+    day = datetime.strptime(episode['date'], "%d/%m/%Y").strftime("%Y%m%d") if episode.get('date') else "undated"
+    return f"topcongo_{day}_{slug(episode['id'])}.mp3"
+
+def unsmuggle_url(url: str) -> tuple:
+    from yt_dlp.utils import unsmuggle_url as unsmuggle
+    return unsmuggle(url, {})
+
+def _entry_id(entry: dict) -> str:
+    """Stable episode ID of a flat playlist entry"""
+    if entry.get('id'):
+        return str(entry['id'])
+    url, data = unsmuggle_url(entry.get('url') or "")
+    return str(data.get('force_videoid') or hashlib.sha256(url.encode()).hexdigest()[:16])
+
+def local_episode(path: Path, root: Path) -> dict:
+    """A local media file as a playlist entry
+
+    The ID comes from the path relative to the source root, so a.wav and
+    sub/a.flac stay separate episodes; the digest leads so slug() can't cut it.
+    """
+    relative = path.relative_to(root).as_posix()
+    return {
+        'id': f"local-{hashlib.sha256(relative.encode()).hexdigest()[:12]}-{path.stem}",
+        'title': path.stem,
+        'date': datetime.fromtimestamp(path.stat().st_mtime).strftime("%d/%m/%Y"),
+        'local_path': str(path),
+        'source_url': path.resolve().as_uri(),
+    }
+
+def iter_playlist(source: str, ydl_opts: dict):
+    """Lazily yield the episodes of a playlist, channel or feed
+
+    Pages are only requested as the generator is consumed, so stopping
+    early (--limit, --stop-after-seen) stops the listing too.
+    """
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL({**ydl_opts, 'extract_flat': 'in_playlist', 'lazy_playlist': True}) as ydl:
+        def walk(item):
+            if item.get('_type') in ('playlist', 'multi_video'):
+                for entry in item.get('entries') or []:
+                    yield from walk(entry)
+            elif item.get('_type') == 'url' and item.get('ie_key') == 'YoutubeTab':
+                # Channel pages list their tabs (videos, streams, ...) as playlists
+                yield from walk(ydl.extract_info(item['url'], download=False, process=False))
+            else:
+                yield {'id': _entry_id(item), 'title': item.get('title'), 'date': format_date(item), 'entry': item}
+
+        yield from walk(ydl.extract_info(source, download=False, process=False))
+
+def iter_episodes(source: str, ydl_opts: dict):
+    path = Path(source)
+    if path.is_dir():
+        return (local_episode(p, path) for p in sorted(path.rglob("*")) if p.suffix.lower() in MEDIA_SUFFIXES)
+    if path.is_file():
+        return iter([local_episode(path, path.parent)])
+    return iter_playlist(source, ydl_opts)
+
+_local = threading.local()
+
+def _ydl(ydl_opts: dict):
+    """Per-thread YoutubeDL (instances are not thread-safe)"""
+    if getattr(_local, 'ydl', None) is None:
+        import yt_dlp
+        _local.ydl = yt_dlp.YoutubeDL({**ydl_opts, 'format': 'bestaudio/best'})
+    return _local.ydl
+
+def transcode(src: str, dest: Path, headers: dict = None, bitrate: str = "64k") -> str:
+    """Transcode a file or stream URL to 16 kHz mono MP3; returns the tool used
+
+    ffmpeg reads the source directly and drops any video track. Without it,
+    local files libsndfile can read are re-encoded block by block.
+    """
+    part = dest.with_name(dest.name + ".part")
+    ffmpeg = shutil.which("ffmpeg")
+    try:
+        if ffmpeg:
+            cmd = [ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-y"]
+            if headers:
+                cmd += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+            cmd += ["-i", src, "-vn", "-ac", "1", "-ar", str(TARGET_SR),
+                    "-c:a", "libmp3lame", "-b:a", bitrate, "-f", "mp3", str(part)]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-300:]}")
+            tool = "ffmpeg"
+        elif Path(src).suffix.lower() in SOUNDFILE_SUFFIXES and Path(src).is_file():
+            import soundfile as sf
+            from audio_stream import stream_audio
+            with sf.SoundFile(str(part), 'w', samplerate=TARGET_SR, channels=1, format='MP3') as out:
+                for block in stream_audio(Path(src)):
+                    out.write(block)
+            tool = "soundfile"
+        else:
+            raise RuntimeError(f"ffmpeg is needed to transcode {Path(src).suffix or 'this stream'}")
+        part.replace(dest)
+        return tool
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+
+def fetch_episode(episode: dict, output_dir: Path, ydl_opts: dict, bitrate: str) -> dict:
+    """Resolve, fetch and store one episode; returns its metadata"""
+    if episode.get('local_path'):
+        src = Path(episode['local_path'])
+        info = {'title': episode['title'], 'date': episode['date'], 'source_url': episode['source_url'],
+                'audio_url': episode['source_url'], 'duration': None}
+        filename = episode_filename({**episode, **info})
+        dest = output_dir / filename
+        if src.suffix.lower() == ".mp3":
+            shutil.copyfile(src, dest.with_name(dest.name + ".part"))
+            dest.with_name(dest.name + ".part").replace(dest)
+            info['transcoded'] = "copy"
+        else:
+            info['transcoded'] = transcode(str(src), dest, bitrate=bitrate)
+    else:
+        # Format selection picks the audio-only stream when there is one
+        resolved = _ydl(ydl_opts).process_ie_result(dict(episode['entry']), download=False)
+        info = {
+            'title': resolved.get('title') or episode.get('title'),
+            'date': format_date(resolved) or episode.get('date'),
+            'source_url': unsmuggle_url(resolved.get('webpage_url') or resolved.get('original_url') or "")[0] or None,
+            'audio_url': resolved['url'],
+            'duration': resolved.get('duration'),
+        }
+        filename = episode_filename({**episode, **info})
+        dest = output_dir / filename
+        if resolved.get('acodec') == 'mp3' and resolved.get('protocol', 'http').startswith('http'):
+            # Already in the corpus format: stream it in, resumably
+            import requests
+            session = getattr(_local, 'session', None) or requests.Session()
+            _local.session = session
+            session.headers.update(resolved.get('http_headers') or {})
+            download_file(session, resolved['url'], dest)
+            info['transcoded'] = "copy"
+        else:
+            info['transcoded'] = transcode(resolved['url'], dest, resolved.get('http_headers'), bitrate)
+
+    stat = dest.stat()
+    return {**info, 'episode_id': episode['id'], 'filename': filename,
+            'file_size': stat.st_size, 'sha256': file_sha256(dest)}
+
+def save_metadata(meta: dict, output_dir: Path):
+    metadata_dir = output_dir / "metadata"
+    metadata_dir.mkdir(exist_ok=True)
+    with open(metadata_dir / f"{Path(meta['filename']).stem}.json", 'w', encoding='utf-8') as f:
+        json.dump({
+            'episode_id': meta['episode_id'],
+            'title': meta['title'],
+            'date': meta['date'],
+            'source_url': meta['source_url'],
+            'audio_url': meta['audio_url'],
+            'filename': meta['filename'],
+            'duration': meta['duration'],
+            'transcoded': meta['transcoded'],
+            'downloaded_at': datetime.now().isoformat(),
+            'source': SOURCE,
+        }, f, indent=2, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Top Congo FM ingester")
+    parser.add_argument("sources", nargs="+", help="Playlist/channel/feed URLs or local media directories")
+    parser.add_argument("--out", type=str, default="data/raw/topcongo", help="Output directory")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent episode downloads")
+    parser.add_argument("--limit", type=int, help="Fetch at most this many new episodes per source")
+    parser.add_argument("--stop-after-seen", type=int, default=0,
+                        help="Stop listing a source after this many consecutive already-fetched episodes "
+                             "(newest-first playlists; 0 lists everything)")
+    parser.add_argument("--bitrate", type=str, default="64k", help="MP3 bitrate when transcoding with ffmpeg")
+    parser.add_argument("--language", type=str, default="ln", help="Language code for manifest entries")
+    parser.add_argument("--force", action="store_true", help="Fetch episodes already in the index again")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="Stat every file instead of applying index changes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    output_dir = Path(args.out)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index = EpisodeIndex(output_dir / INDEX_DB)
+    store = ContentStore(output_dir)
+    ydl_opts = {'quiet': True, 'no_warnings': True}
+
+    downloaded = failed = skipped = 0
+
+    def handle(future, episode):
+        nonlocal downloaded, failed
+        try:
+            meta = future.result()
+        except Exception as e:
+            failed += 1
+            logger.error(f"❌ {episode['id']}: {e}")
+            index.record(episode['id'], 'failed', title=episode.get('title'), error=str(e)[:500])
+            return
+        downloaded += 1
+        if store.adopt(output_dir / meta['filename'], meta['sha256']):
+            logger.info(f"♻️  Duplicate content: {meta['filename']}")
+        save_metadata(meta, output_dir)
+        index.record(meta['episode_id'], 'downloaded', title=meta['title'], date=meta['date'],
+                     source_url=meta['source_url'], filename=meta['filename'],
+                     sha256=meta['sha256'], file_size=meta['file_size'], error=None)
+        logger.info(f"✅ {meta['filename']} ({meta['file_size'] / 1024 / 1024:.1f} MB, {meta['transcoded']})")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # A bounded window keeps the playlist generator only a little ahead of the downloads
+        window = args.workers * 2
+        pending, queued = {}, set()
+        for source in args.sources:
+            logger.info(f"📻 Listing {source}")
+            submitted = seen_run = 0
+            try:
+                for episode in iter_episodes(source, ydl_opts):
+                    if not args.force and index.is_done(episode['id']):
+                        skipped += 1
+                        seen_run += 1
+                        if args.stop_after_seen and seen_run >= args.stop_after_seen:
+                            logger.info(f"⏹️  {seen_run} known episodes in a row; done with {source}")
+                            break
+                        continue
+                    seen_run = 0
+                    if episode['id'] in queued:
+                        # Same ID from another source: both would write one file
+                        logger.warning(f"⚠️  {episode['id']} listed twice; keeping the first")
+                        continue
+                    if args.limit and submitted >= args.limit:
+                        break
+                    queued.add(episode['id'])
+                    pending[executor.submit(fetch_episode, episode, output_dir, ydl_opts, args.bitrate)] = episode
+                    submitted += 1
+                    while len(pending) >= window:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            handle(future, pending.pop(future))
+            except Exception as e:
+                failed += 1
+                logger.error(f"❌ Could not list {source}: {e}")
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                handle(future, pending.pop(future))
+
+    builder = build_manifest(output_dir, index, args.manifest_format, args.rebuild_manifest,
+                             language=args.language, source=SOURCE)
+    logger.info(f"📋 Manifest: {len(builder.changed)} changed, {len(builder.entries)} files")
+    index.close()
+
+    logger.info(f"🎉 Done: {downloaded} downloaded, {skipped} already fetched, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Export the corpus as WebDataset-style tar shards
+Segments (after quality filtering, with transcripts when available) are
+packed as <key>.flac|.wav|.npy + <key>.json pairs into fixed-size tar
+shards, so training jobs read a few large files sequentially instead of
+thousands of small ones. Whole episodes go to train/dev/test by a hash of
+their content, so splits are stable across exports. index.jsonl records
+the byte offset of every member for random access.
+Usage: python export_shards.py data/raw/okapi --out data/shards --audio-format flac
+"""
+# filepath: scripts/export_shards.py
+
+import io, os, sys, json, random, hashlib, tarfile, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from audio_stream import TARGET_SR, stream_audio
+from audio_cache import DEFAULT_MAX_MB, add_cache_arguments, open_cache, slice_seconds
+from align_whisper import DEFAULT_OUT as DEFAULT_TRANSCRIPTS, current_transcript, load_done
+from okapi_manifest import atomic_write_json, audio_index, find_manifest_dirs, load_manifest, segment_field
+
+INDEX_FILE = "index.jsonl"
+SUMMARY_FILE = "shards.json"
+SPLITS = ('train', 'dev', 'test')
+
+def split_for(episode: str, ratios: tuple) -> str:
+    """Deterministic split of an episode from a hash of its id"""
+    bucket = int(hashlib.sha256(episode.encode()).hexdigest()[:8], 16) / 0x100000000
+    cumulative = 0.0
+    for name, ratio in zip(SPLITS, ratios):
+        cumulative += ratio
+        if bucket < cumulative:
+            return name
+    return SPLITS[-1]
+
+def encode_audio(samples: np.ndarray, audio_format: str) -> bytes:
+    """int16 PCM -> FLAC / WAV / .npy bytes"""
+    buf = io.BytesIO()
+    if audio_format == 'npy':
+        np.save(buf, np.ascontiguousarray(samples, dtype='<i2'))
+    else:
+        sf.write(buf, samples, TARGET_SR, format=audio_format.upper(), subtype='PCM_16')
+    return buf.getvalue()
+
+def encode_file(job: dict, audio_format: str, cache_root: str = None, cache_mb: float = DEFAULT_MAX_MB) -> list:
+    """[(key, audio bytes, metadata)] for the exported segments of one file"""
+    cache = open_cache(cache_root, cache_mb)
+    if cache is not None:
+        pcm = cache.pcm(Path(job['path']), job['sha256'])
+    else:
+        pcm = np.concatenate([(b * 32768).clip(-32768, 32767).astype(np.int16)
+                              for b in stream_audio(Path(job['path']))])
+    samples = []
+    for sample in job['samples']:
+        audio = slice_seconds(pcm, sample['start'], sample['end'])
+        if len(audio):
+            samples.append((sample['key'], encode_audio(audio, audio_format), sample))
+    return samples
+
+class ShardWriter:
+    """Rolls over to a new tar once the current one reaches max_bytes"""
+
+    def __init__(self, out_dir: Path, split: str, max_bytes: int):
+        self.out_dir, self.split, self.max_bytes = out_dir, split, max_bytes
+        self.index = 0
+        self.tar = None
+        self.shards = []
+
+    def _open(self):
+        name = f"{self.split}-{self.index:06d}.tar"
+        self.tar = tarfile.open(self.out_dir / f"{name}.tmp", 'w', format=tarfile.USTAR_FORMAT)
+        self.shards.append({'shard': name, 'samples': 0, 'seconds': 0.0})
+        self.index += 1
+
+    def _close(self):
+        if self.tar is not None:
+            self.tar.close()
+            name = self.shards[-1]['shard']
+            os.replace(self.out_dir / f"{name}.tmp", self.out_dir / name)
+            self.shards[-1]['bytes'] = (self.out_dir / name).stat().st_size
+            self.tar = None
+
+    def _add(self, name: str, data: bytes) -> list:
+        """Append one member; returns [data offset, size] within the shard"""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = 0  # Byte-identical shards for identical inputs
+        self.tar.addfile(info, io.BytesIO(data))
+        padded = -(-len(data) // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return [self.tar.offset - padded, len(data)]
+
+    def write(self, key: str, audio_ext: str, audio: bytes, meta: dict) -> dict:
+        if self.tar is None or self.tar.offset >= self.max_bytes:
+            self._close()
+            self._open()
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        entry = {'key': key, 'split': self.split, 'shard': self.shards[-1]['shard'],
+                 audio_ext: self._add(f"{key}.{audio_ext}", audio),
+                 'json': self._add(f"{key}.json", meta_bytes),
+                 'duration': meta['duration']}
+        self.shards[-1]['samples'] += 1
+        self.shards[-1]['seconds'] += meta['duration']
+        return entry
+
+    def close(self):
+        self._close()
+
+def read_member(shard_dir: Path, entry: dict, member: str) -> bytes:
+    """Random access to one sample member through an index.jsonl entry"""
+    offset, size = entry[member]
+    with open(Path(shard_dir) / entry['shard'], 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+def load_transcripts(path: Path) -> dict:
+    """{(filename, segment): record} from align_whisper's results JSONL"""
+    transcripts = {}
+    if path.exists():
+        load_done(path)  # Trims a torn last line from an interrupted run
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                transcripts[(record['filename'], record['segment'])] = record
+    return transcripts
+
+def export_files(out_dir: Path) -> list:
+    """Files a previous export wrote to out_dir (shards, partial shards, index, summary)"""
+    files = [out_dir / INDEX_FILE, out_dir / SUMMARY_FILE]
+    for split in SPLITS:
+        files += out_dir.glob(f"{split}-*.tar")
+        files += out_dir.glob(f"{split}-*.tar.tmp")
+    return [path for path in files if path.is_file()]
+
+def collect_jobs(manifest_dirs: list, transcripts: dict, args) -> list:
+    """One job per episode with the samples it contributes
+
+    Quality and dialect results are lists by segment index and transcripts
+    are keyed by it, so each is checked against the current segments:
+    episodes whose lists were computed for other segments are skipped, and
+    transcripts of other bounds are left out.
+    """
+    ratios = tuple(float(r) for r in args.split.split(','))
+    jobs, stale = [], 0
+    for manifest_dir in manifest_dirs:
+        paths = audio_index(manifest_dir)
+        for filename, entry in sorted(load_manifest(manifest_dir).items()):
+            segments = entry.get('segments')
+            if not segments or entry.get('duplicate_of') or filename not in paths:
+                continue
+            if entry.get('quality_pass') is False:
+                continue
+            kept = segment_field(entry, 'segments_kept')
+            labels = segment_field(entry, 'dialect_labels')
+            if (kept is None and entry.get('segments_kept') is not None) or \
+                    (labels is None and entry.get('dialect_labels') is not None):
+                stale += 1
+                continue
+            kept = range(len(segments)) if kept is None else kept
+            labels = labels or []
+            episode = entry.get('sha256') or filename
+            split = split_for(episode, ratios)
+            samples = []
+            for index in kept:
+                start, end = segments[index]
+                transcript = current_transcript(transcripts.get((filename, index)), [start, end])
+                if args.require_transcript and not transcript:
+                    continue
+                samples.append({
+                    'key': f"{Path(filename).stem}_{index:04d}",
+                    'episode': filename,
+                    'segment': index,
+                    'start': start,
+                    'end': end,
+                    'duration': round(end - start, 3),
+                    'sample_rate': TARGET_SR,
+                    'language': (labels[index][0] if index < len(labels) else None) or entry.get('language'),
+                    'text': transcript.get('text') if transcript else None,
+                    'words': transcript.get('words') if transcript else None,
+                    'source': entry.get('source'),
+                    'date': entry.get('date'),
+                })
+            if samples:
+                jobs.append({'path': str(paths[filename]), 'sha256': entry.get('sha256'),
+                             'split': split, 'samples': samples,
+                             'cache_root': None if args.no_audio_cache else str(manifest_dir)})
+    if stale:
+        print(f"⚠️  Skipped {stale} episodes whose quality or dialect results predate their segments "
+              "(re-run quality_filter.py / dialect_classifier.py)")
+    return jobs
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack segmented audio and transcripts into tar shards")
+    parser.add_argument("manifest_dirs", nargs="*", default=["data/raw/okapi"],
+                        help="Directories with manifest.json (section subdirectories are included)")
+    parser.add_argument("--out", type=str, default="data/shards/okapi", help="Output directory for shards")
+    parser.add_argument("--transcripts", type=str, default=DEFAULT_TRANSCRIPTS, help="align_whisper.py results JSONL")
+    parser.add_argument("--require-transcript", action="store_true", help="Only export transcribed segments")
+    parser.add_argument("--audio-format", choices=["flac", "wav", "npy"], default="flac",
+                        help="FLAC (compact), WAV or .npy int16 (pre-decoded PCM)")
+    parser.add_argument("--shard-size-mb", type=float, default=256, help="Target shard size (MB)")
+    parser.add_argument("--split", type=str, default="0.9,0.05,0.05", help="train,dev,test ratios by episode")
+    parser.add_argument("--seed", type=int, default=0, help="Episode order shuffle seed (deterministic)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Encoding processes")
+    parser.add_argument("--overwrite", action="store_true", help="Replace an existing export")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    out_dir = Path(args.out)
+    if out_dir.exists() and any(out_dir.iterdir()):
+        if not args.overwrite:
+            print(f"❌ {out_dir} is not empty (use --overwrite)")
+            sys.exit(1)
+        # Only what an export wrote goes, so a mistyped --out can't take anything else with it
+        for path in export_files(out_dir):
+            path.unlink()
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    transcripts = load_transcripts(Path(args.transcripts))
+    jobs = collect_jobs(find_manifest_dirs(args.manifest_dirs), transcripts, args)
+    # Spread episodes across shards; the seed keeps exports reproducible
+    random.Random(args.seed).shuffle(jobs)
+    total = sum(len(job['samples']) for job in jobs)
+    print(f"📦 Exporting {total} segments from {len(jobs)} episodes as {args.audio_format}")
+
+    max_bytes = int(args.shard_size_mb * 1024 * 1024)
+    writers = {split: ShardWriter(out_dir, split, max_bytes) for split in SPLITS}
+    failed = 0
+    with open(out_dir / INDEX_FILE, 'w', encoding='utf-8') as index, \
+            ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # Results are consumed in job order, so shard contents don't depend
+        # on scheduling; a bounded window keeps encoded audio from piling up
+        window = max(1, args.workers * 4)
+        pending = []
+        for job in jobs + [None] * window:
+            if job is not None:
+                pending.append((job, executor.submit(encode_file, job, args.audio_format,
+                                                     job['cache_root'], args.audio_cache_mb)))
+            if len(pending) < window and job is not None:
+                continue
+            if not pending:
+                break
+            done_job, future = pending.pop(0)
+            writer = writers[done_job['split']]
+            try:
+                samples = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {Path(done_job['path']).name}: {e}")
+                continue
+            for key, audio, meta in samples:
+                entry = writer.write(key, args.audio_format, audio, meta)
+                index.write(json.dumps(entry) + "\n")
+    for writer in writers.values():
+        writer.close()
+
+    summary = {
+        'audio_format': args.audio_format,
+        'sample_rate': TARGET_SR,
+        'split_ratios': args.split,
+        'splits': {split: {'shards': w.shards,
+                           'samples': sum(s['samples'] for s in w.shards),
+                           'hours': round(sum(s['seconds'] for s in w.shards) / 3600, 3)}
+                   for split, w in writers.items()},
+    }
+    atomic_write_json(out_dir / SUMMARY_FILE, summary)
+
+    print("\n📊 Export Summary:")
+    for split, info in summary['splits'].items():
+        print(f"   • {split}: {info['samples']} samples, {info['hours']} h in {len(info['shards'])} shards")
+    if failed:
+        print(f"   • Failed: {failed} episodes")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
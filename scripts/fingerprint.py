@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Audio fingerprint index for recurring jingles, intros and music beds
+Spectral peaks of each file's log-mel features (from the decode cache) are
+paired into (f1, f2, dt) landmark hashes in one parallel pass, and stored
+per file under its SHA-256 so an update only fingerprints new downloads.
+An inverted count of how many episodes contain each hash is merged
+incrementally (a sort-merge, never a pairwise comparison of files). Hashes
+found in a large share of episodes are candidates; a candidate counts as
+recurring where it lines up at one time offset with the same run of hashes
+in other episodes (looked up in a capped posting list, as song matchers
+do). Stretches of a file dense with recurring hashes are written to the
+manifest as "strip_regions", which segment.py cuts out before the later
+stages see the audio.
+Usage: python fingerprint.py data/raw/okapi
+       python fingerprint.py data/raw/okapi --min-share 0.3 --dry-run
+"""
+# filepath: scripts/fingerprint.py
+
+import os, sys, math, time, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import metrics
+from audio_cache import HOP, N_MELS, DEFAULT_MAX_MB, add_cache_arguments, log_mel_blocks, open_cache
+from audio_stream import TARGET_SR
+from okapi_dedup import file_sha256
+from okapi_manifest import audio_index, find_manifest_dirs, load_manifest, update_entries
+
+FINGERPRINT_DIR = ".fingerprints"
+INDEX_FILE = "index.npz"
+FINGERPRINT_VERSION = 1  # Bump when the peak picking or hash layout changes
+
+FRAMES_PER_SECOND = TARGET_SR / HOP
+PEAK_TIME = 10       # Peak neighbourhood: ±100 ms ...
+PEAK_FREQ = 4        # ... by ±4 mel bands
+PEAK_DB = 10.0       # Peaks must stand this far above the file's median level
+FAN_OUT = 5          # Targets paired with each anchor peak
+MAX_DT = 63          # Frames; dt gets 6 bits of the hash, f1 and f2 get 7 each
+ALIGN_FRAMES = 4     # Offset tolerance when lining hashes up across episodes
+MAX_POSTINGS = 64    # Episodes kept per candidate hash, so lookups stay linear
+
+DEFAULTS = {
+    'min_share': 0.25,    # A hash in at least this share of episodes is recurring ...
+    'min_episodes': 3,    # ... and in at least this many
+    'min_matches': 8,     # Hashes at one offset for two episodes to share audio
+    'min_ratio': 0.35,    # Share of a bin's hashes that must be recurring
+    'bin_seconds': 0.5,   # Detection resolution
+    'min_span': 2.0,      # Shorter recurring stretches are left alone
+    'max_gap': 1.0,       # Gaps up to this long inside a stretch are bridged
+}
+
+def file_logmel(path: str, sha256: str, cache_root: str, cache_mb: float) -> np.ndarray:
+    cache = open_cache(cache_root, cache_mb)
+    if cache is not None:
+        return cache.logmel(Path(path), sha256)
+    from audio_stream import stream_audio
+    pcm = np.concatenate([(b * 32768).clip(-32768, 32767).astype(np.int16) for b in stream_audio(Path(path))])
+    return np.concatenate(list(log_mel_blocks(pcm))) if len(pcm) else np.zeros((0, N_MELS), np.float32)
+
+def sliding_max(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """Max over a ±radius window along one axis (edges padded with -inf)"""
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+def find_peaks(mel: np.ndarray) -> tuple:
+    """(frames, bands) of local spectral maxima, sorted by frame
+
+    The 2-D neighbourhood max is done as two 1-D passes, so the cost is
+    linear in the number of frames.
+    """
+    if not len(mel):
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    neighbourhood = sliding_max(sliding_max(mel, PEAK_TIME, 0), PEAK_FREQ, 1)
+    floor = np.median(mel) + PEAK_DB / 10  # log10 power, so 1.0 is 10 dB
+    frames, bands = np.nonzero((mel == neighbourhood) & (mel > floor))
+    return frames, bands
+
+def landmark_hashes(frames: np.ndarray, bands: np.ndarray) -> tuple:
+    """Pair each peak with the next FAN_OUT peaks; returns (uint32 hashes, anchor frames)
+
+    A hash depends only on the two bands and their time difference, so the
+    same sound hashes the same wherever it falls in an episode.
+    """
+    hashes, anchors = [], []
+    for k in range(1, FAN_OUT + 1):
+        if len(frames) <= k:
+            break
+        dt = frames[k:] - frames[:-k]
+        ok = (dt >= 1) & (dt <= MAX_DT)
+        f1, f2 = bands[:-k][ok], bands[k:][ok]
+        hashes.append((f1 << 13) | (f2 << 6) | dt[ok])
+        anchors.append(frames[:-k][ok])
+    if not hashes:
+        return np.zeros(0, np.uint32), np.zeros(0, np.uint32)
+    return np.concatenate(hashes).astype(np.uint32), np.concatenate(anchors).astype(np.uint32)
+
+def fingerprint_path(store: Path, sha256: str) -> Path:
+    return store / sha256[:2] / f"{sha256}.npz"
+
+def fingerprint_file(path: str, sha256: str, store: str, cache_root: str = None,
+                     cache_mb: float = DEFAULT_MAX_MB) -> dict:
+    """Fingerprint one file into the store; the arrays stay on disk, not in the result"""
+    started = time.perf_counter()
+    mel = file_logmel(path, sha256, cache_root, cache_mb)
+    hashes, anchors = landmark_hashes(*find_peaks(np.asarray(mel)))
+    target = fingerprint_path(Path(store), sha256)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        np.savez(f, version=FINGERPRINT_VERSION, hashes=hashes, frames=anchors)
+    os.replace(tmp, target)
+    return {'hashes': len(hashes), 'seconds': time.perf_counter() - started}
+
+def load_fingerprint(store: Path, sha256: str):
+    """(hashes, anchor frames) for a file, or None if missing or from an older version"""
+    path = fingerprint_path(store, sha256)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        if int(data['version']) != FINGERPRINT_VERSION:
+            return None
+        return data['hashes'], data['frames']
+
+class HashIndex:
+    """Episode counts per hash: sorted unique hashes, their counts, and which files are in
+
+    Adding or removing files merges their unique hashes into the counts
+    with one sort, so an update costs O((index + new) log) rather than
+    anything per pair of episodes.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.reset()
+        if path.exists():
+            with np.load(path) as data:
+                if int(data['version']) == FINGERPRINT_VERSION:
+                    self.hashes, self.counts = data['hashes'], data['counts']
+                    self.files = set(str(s) for s in data['files'])
+
+    def reset(self):
+        self.hashes = np.zeros(0, np.uint32)
+        self.counts = np.zeros(0, np.uint32)
+        self.files = set()
+
+    def update(self, added: list, removed: list):
+        """Merge per-file hash arrays in (added) or out (removed)"""
+        parts = [self.hashes] + [np.unique(h) for h in added] + [np.unique(h) for h in removed]
+        weights = [self.counts.astype(np.int64)] \
+            + [np.ones(len(p), np.int64) for p in parts[1:1 + len(added)]] \
+            + [-np.ones(len(p), np.int64) for p in parts[1 + len(added):]]
+        unique, inverse = np.unique(np.concatenate(parts), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(weights), minlength=len(unique))
+        keep = totals > 0
+        self.hashes = unique[keep].astype(np.uint32)
+        self.counts = totals[keep].astype(np.uint32)
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Episode count of each hash (0 for unknown hashes)"""
+        if not len(self.hashes):
+            return np.zeros(len(hashes), np.uint32)
+        pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return np.where(self.hashes[pos] == hashes, self.counts[pos], 0)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=FINGERPRINT_VERSION, hashes=self.hashes, counts=self.counts,
+                     files=np.array(sorted(self.files), dtype='U64'))
+        os.replace(tmp, self.path)
+
+def build_postings(prints, candidates: np.ndarray) -> tuple:
+    """(hashes, file ids, frames) of candidate hash occurrences in (file id, prints) pairs
+
+    Only the first MAX_POSTINGS files of each hash are kept: a jingle that
+    aired in hundreds of episodes is confirmed just as well by a sample.
+    """
+    parts = []
+    for file_id, (hashes, frames) in prints:
+        keep = np.isin(hashes, candidates)
+        parts.append((hashes[keep], np.full(np.count_nonzero(keep), file_id, np.uint32), frames[keep]))
+    if not parts:
+        return np.zeros(0, np.uint32), np.zeros(0, np.uint32), np.zeros(0, np.uint32)
+    hashes, files, frames = (np.concatenate(column) for column in zip(*parts))
+    order = np.lexsort((files, hashes))
+    hashes, files, frames = hashes[order], files[order], frames[order]
+    new_hash = np.r_[True, hashes[1:] != hashes[:-1]]
+    seen = np.cumsum(new_hash | np.r_[True, files[1:] != files[:-1]])
+    rank = seen - np.maximum.accumulate(np.where(new_hash, seen, 0))
+    keep = rank < MAX_POSTINGS
+    return hashes[keep], files[keep], frames[keep]
+
+def recurring_anchors(hashes: np.ndarray, anchors: np.ndarray, file_id: int, postings: tuple,
+                      min_files: int, params: dict) -> np.ndarray:
+    """Mask of hashes that line up with the same audio in at least min_files other episodes
+
+    Chance collisions scatter over offsets; a shared jingle piles
+    min_matches or more hashes onto a single (episode, offset) pair.
+    """
+    posted, files, frames = postings
+    lo = np.searchsorted(posted, hashes, 'left')
+    n = np.searchsorted(posted, hashes, 'right') - lo
+    if not n.sum():
+        return np.zeros(len(hashes), bool)
+    anchor = np.repeat(np.arange(len(hashes)), n)
+    pos = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n) + np.repeat(lo, n)
+    other = files[pos].astype(np.int64)
+    offset = (frames[pos].astype(np.int64) - anchors[anchor].astype(np.int64)) // ALIGN_FRAMES
+    keys = (other << 32) | (offset + 2 ** 31)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    aligned = (counts[inverse] >= params['min_matches']) & (other != file_id)
+    pairs = np.unique((anchor[aligned].astype(np.int64) << 32) | other[aligned])
+    return np.bincount(pairs >> 32, minlength=len(hashes)) >= min_files
+
+def strip_regions(recurring: np.ndarray, anchors: np.ndarray, params: dict) -> list:
+    """[start, end] seconds of stretches where recurring hashes dominate"""
+    if not len(anchors):
+        return []
+    bin_frames = params['bin_seconds'] * FRAMES_PER_SECOND
+    bins = (anchors / bin_frames).astype(np.int64)
+    total = np.bincount(bins)
+    recurring = np.bincount(bins[recurring], minlength=len(total))
+    flagged = (recurring >= params['min_ratio'] * np.maximum(total, 1)) & (total > 0)
+
+    regions = []
+    max_gap = round(params['max_gap'] / params['bin_seconds'])
+    for b in np.flatnonzero(flagged):
+        if regions and b - regions[-1][1] <= max_gap:
+            regions[-1][1] = b + 1
+        else:
+            regions.append([b, b + 1])
+    # The end of the last flagged bin already covers its anchors; padding it would cut speech
+    return [[round(a * params['bin_seconds'], 2), round(b * params['bin_seconds'], 2)]
+            for a, b in regions if (b - a) * params['bin_seconds'] >= params['min_span']]
+
+def main():
+    parser = argparse.ArgumentParser(description="Find recurring jingles/intros and record strip regions")
+    parser.add_argument("manifest_dirs", nargs="*", default=["data/raw/okapi"],
+                        help="Directories with manifest.json (section subdirectories are included)")
+    parser.add_argument("--store", type=str, help=f"Fingerprint store (default: <first dir>/{FINGERPRINT_DIR})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    for key, default in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(default), default=default,
+                            help=f"(default {default})")
+    parser.add_argument("--rebuild", action="store_true", help="Re-fingerprint every file and rebuild the index")
+    parser.add_argument("--dry-run", action="store_true", help="Report strip regions without touching the manifest")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args)
+
+    manifest_dirs = find_manifest_dirs(args.manifest_dirs)
+    if not manifest_dirs:
+        print("❌ No manifest found; run download_okapi.py or okapi_manifest.py first")
+        sys.exit(1)
+    store = Path(args.store) if args.store else Path(args.manifest_dirs[0]) / FINGERPRINT_DIR
+    index = HashIndex(store / INDEX_FILE)
+
+    # One row per distinct content across all sections; duplicates share theirs
+    corpus, files = [], {}
+    for manifest_dir in manifest_dirs:
+        paths = audio_index(manifest_dir)
+        for filename, entry in load_manifest(manifest_dir).items():
+            if entry.get('duplicate_of') or filename not in paths:
+                continue
+            sha = entry.get('sha256') or file_sha256(paths[filename])
+            corpus.append((manifest_dir, filename, entry, sha))
+            files.setdefault(sha, (str(paths[filename]), None if args.no_audio_cache else str(manifest_dir)))
+
+    todo = [sha for sha in files if args.rebuild or load_fingerprint(store, sha) is None]
+    print(f"🔊 {len(files)} episodes, {len(files) - len(todo)} fingerprinted, {len(todo)} to fingerprint")
+
+    failed = 0
+    with metrics.stage('fingerprint'):
+        if todo:
+            with ProcessPoolExecutor(max_workers=args.workers) as executor:
+                futures = {executor.submit(fingerprint_file, files[sha][0], sha, str(store), files[sha][1],
+                                           args.audio_cache_mb): sha for sha in todo}
+                for future in as_completed(futures):
+                    sha = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"❌ {Path(files[sha][0]).name}: {e}")
+                        continue
+                    metrics.observe('fingerprint_seconds', result['seconds'])
+                    print(f"✅ {Path(files[sha][0]).name}: {result['hashes']} hashes")
+
+    with metrics.stage('index'):
+        # New episodes are merged in and departed ones subtracted; if an indexed
+        # file was re-fingerprinted its old hashes are gone, so start over
+        departed = [load_fingerprint(store, sha) for sha in index.files - set(files)]
+        if args.rebuild or index.files & set(todo) or any(p is None for p in departed):
+            print("♻️  Rebuilding the hash index")
+            index.reset()
+            departed = []
+        current = {sha for sha in files if load_fingerprint(store, sha) is not None}
+        added = current - index.files
+        if added or departed:
+            index.update([load_fingerprint(store, sha)[0] for sha in added], [p[0] for p in departed])
+            index.files = current
+            index.save()
+        threshold = max(args.min_episodes, math.ceil(args.min_share * len(index.files)))
+        print(f"📇 Index: {len(index.files)} episodes, {len(index.hashes)} distinct hashes, "
+              f"{np.count_nonzero(index.counts >= threshold)} recurring (in ≥{threshold} episodes)")
+
+    # Detection is a lookup per hash, so every file is re-checked against the current index
+    params = {key: getattr(args, key) for key in DEFAULTS}
+    ids = {sha: i for i, sha in enumerate(sorted(index.files))}
+    updates, stripped = {}, 0.0
+    with metrics.stage('detect'):
+        candidates = index.hashes[index.counts >= threshold]
+        postings = build_postings(((ids[sha], load_fingerprint(store, sha)) for sha in ids), candidates)
+        for manifest_dir, filename, entry, sha in corpus:
+            prints = load_fingerprint(store, sha)
+            if prints is None:
+                continue
+            hashes, anchors = prints
+            recurring = recurring_anchors(hashes, anchors, ids[sha], postings, args.min_episodes - 1, params)
+            regions = strip_regions(recurring, anchors, params)
+            stripped += sum(b - a for a, b in regions)
+            fields = {'strip_regions': regions, 'strip_params': {**params, 'threshold': threshold}}
+            if {k: entry.get(k) for k in fields} != fields:
+                updates.setdefault(manifest_dir, {})[filename] = fields
+                if args.dry_run or regions:
+                    print(f"✂️  {filename}: {', '.join(f'{a:.1f}-{b:.1f}s' for a, b in regions) or 'nothing'}")
+
+    print(f"📊 {stripped / 60:.1f} min of recurring audio across {len(corpus)} files")
+    if not args.dry_run:
+        for manifest_dir, file_updates in updates.items():
+            changed = update_entries(manifest_dir, file_updates, args.manifest_format)
+            print(f"📋 Updated {changed} manifest entries in {manifest_dir}")
+    metrics.export_from_args(args)
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+On-disk conditional HTTP cache for article pages
+Bodies live in one file per URL; an SQLite index keeps validators, sizes
+and last-use times for TTL checks and size-bounded LRU eviction.
+"""
+# filepath: scripts/http_cache.py
+
+import os, time, sqlite3, hashlib, threading
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+CACHE_DIR = ".http_cache"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url           TEXT PRIMARY KEY,
+    key           TEXT NOT NULL,
+    etag          TEXT,
+    last_modified TEXT,
+    size          INTEGER NOT NULL,
+    first_seen    REAL NOT NULL,
+    checked_at    REAL NOT NULL,
+    last_used     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_last_used ON pages (last_used);
+"""
+
+class PageCache:
+    """Size-bounded LRU cache of page bodies with a two-tier TTL
+
+    Pages that changed less than `recent_age` seconds ago may still be
+    edited, so they are revalidated after `recent_ttl`; older pages only
+    after `stable_ttl`. A page's age comes from its Last-Modified date;
+    without one it is counted from when the page was first cached, so a
+    backfill of old articles is treated as recent for its first week.
+    Revalidation is a conditional GET, so an unchanged page costs a 304
+    with no body.
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 200 * 1024 * 1024,
+                 recent_age: float = 7 * 86400, recent_ttl: float = 6 * 3600,
+                 stable_ttl: float = 30 * 86400):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.recent_age = recent_age
+        self.recent_ttl = recent_ttl
+        self.stable_ttl = stable_ttl
+        self._lock = threading.Lock()
+
+        # One connection shared under a lock: cache operations are tiny
+        # compared to the network round trip they save
+        self._db = sqlite3.connect(self.cache_dir / "index.sqlite", check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _body_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.html"
+
+    def lookup(self, url: str):
+        """Cached entry for url as a dict (with 'body'), or None"""
+        with self._lock:
+            row = self._db.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        try:
+            body = self._body_path(row['key']).read_text(encoding='utf-8')
+        except OSError:
+            return None
+        return {**dict(row), 'body': body}
+
+    @staticmethod
+    def changed_at(entry: dict) -> float:
+        """When the page last changed: its Last-Modified date, else when it was first cached"""
+        try:
+            return parsedate_to_datetime(entry['last_modified']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return entry['first_seen']
+
+    def is_fresh(self, entry: dict, now: float = None) -> bool:
+        """Whether entry can be served without asking the server"""
+        now = now or time.time()
+        ttl = self.recent_ttl if now - self.changed_at(entry) < self.recent_age else self.stable_ttl
+        return now - entry['checked_at'] < ttl
+
+    @staticmethod
+    def conditional_headers(entry: dict) -> dict:
+        """If-None-Match / If-Modified-Since headers for revalidating entry"""
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url: str, body: str, etag: str = None, last_modified: str = None):
+        """Save a fresh 200 response"""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        path = self._body_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(body, encoding='utf-8')
+        os.replace(tmp, path)
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO pages (url, key, etag, last_modified, size, first_seen, checked_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, "
+                "size = excluded.size, checked_at = excluded.checked_at, last_used = excluded.last_used",
+                (url, key, etag, last_modified, path.stat().st_size, now, now, now),
+            )
+            self._db.commit()
+        self.evict()
+
+    def touch(self, url: str, revalidated: bool = False):
+        """Mark an entry used (and, after a 304, freshly validated)"""
+        now = time.time()
+        with self._lock:
+            if revalidated:
+                self._db.execute("UPDATE pages SET last_used = ?, checked_at = ? WHERE url = ?", (now, now, url))
+            else:
+                self._db.execute("UPDATE pages SET last_used = ? WHERE url = ?", (now, url))
+            self._db.commit()
+
+    def evict(self):
+        """Drop least recently used pages until the cache fits in max_bytes"""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for row in self._db.execute("SELECT url, key, size FROM pages ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                victims.append((row['url'], row['key']))
+                total -= row['size']
+            self._db.executemany("DELETE FROM pages WHERE url = ?", [(url,) for url, _ in victims])
+            self._db.commit()
+        for _, key in victims:
+            path = self._body_path(key)
+            if path.exists():
+                path.unlink()
+
+def cached_get_text(session, cache: PageCache, url: str, timeout: int = 10) -> str:
+    """GET a page through the cache with a requests-style session
+
+    Raises requests' HTTPError for error statuses, like raise_for_status().
+    """
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(entry):
+        cache.touch(url)
+        metrics.inc('cache_total', result='hit')
+        return entry['body']
+
+    with metrics.timer('request_seconds', kind='page'):
+        response = session.get(url, timeout=timeout, headers=PageCache.conditional_headers(entry))
+    if response.status_code == 304 and entry:
+        cache.touch(url, revalidated=True)
+        metrics.inc('cache_total', result='revalidated')
+        return entry['body']
+    metrics.inc('cache_total', result='miss')
+    response.raise_for_status()
+    metrics.inc('bytes_total', len(response.content), direction='down')
+
+    if cache:
+        cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return response.text
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Run metrics shared by the scraper and the uploader
+A process-wide registry of counters, gauges and histograms (request latency,
+bytes transferred, parse time, queue depth, retries), optional cProfile and
+tracemalloc hooks switched on per stage, and export to a JSON report and a
+Prometheus textfile (node_exporter's textfile collector format).
+Recording a sample is a dict lookup and an add under a lock, so the
+instrumentation stays on; only the profilers cost anything, and they are off
+unless asked for.
+Usage: python metrics.py logs/metrics/okapi.json
+       python metrics.py logs/metrics/okapi.json --baseline previous.json --markdown
+"""
+# filepath: scripts/metrics.py
+
+import os, io, sys, json, time, random, bisect, pstats, argparse, cProfile, resource, threading, tracemalloc
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+
+PREFIX = "lingala_"
+
+# Seconds; spans a cached page hit up to a slow MP3 download or Drive upload
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RESERVOIR_SIZE = 2048  # Samples kept per histogram for exact-ish quantiles in the JSON report
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+HELP = {
+    'request_seconds': ('histogram', "Latency of one HTTP request or transfer, by kind"),
+    'parse_seconds': ('histogram', "Time spent extracting an article page"),
+    'stage_seconds': ('gauge', "Wall time of the last run of a stage"),
+    'bytes_total': ('counter', "Bytes transferred, by direction"),
+    'retries_total': ('counter', "Retried requests, by kind"),
+    'items_total': ('counter', "Items handled, by stage and result"),
+    'cache_total': ('counter', "Page cache lookups, by result"),
+    'queue_depth': ('gauge', "Work items waiting, by queue"),
+    'transcode_seconds': ('histogram', "Time to decode one file and encode its variants"),
+    'fingerprint_seconds': ('histogram', "Time to fingerprint one file"),
+    'variant_bytes_total': ('counter', "Bytes of transcoded audio written, by variant"),
+}
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus a bounded reservoir for quantiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.samples = []
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        # Reservoir sampling keeps a uniform sample however many values come in
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self.samples[slot] = value
+
+    def summary(self) -> dict:
+        summary = {
+            'count': self.count, 'sum': round(self.sum, 6),
+            'min': self.min, 'max': self.max,
+            'mean': round(self.sum / self.count, 6) if self.count else None,
+        }
+        ordered = sorted(self.samples)
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+        return summary
+
+class Registry:
+    """Thread-safe metric store; labels are keyword arguments"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}      # key -> [current, high-water mark]
+        self.histograms = {}
+        self.stages = {}      # name -> report section (seconds, profile, tracemalloc)
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge, remembering the highest value it has held"""
+        key = _key(name, labels)
+        with self.lock:
+            gauge = self.gauges.get(key)
+            if gauge is None:
+                self.gauges[key] = [value, value]
+            else:
+                gauge[0] = value
+                gauge[1] = max(gauge[1], value)
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the with-block, including when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def report(self) -> dict:
+        """Everything recorded so far, as a JSON-serializable dict"""
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        with self.lock:
+            return {
+                'generated_at': datetime.now().isoformat(timespec='seconds'),
+                'argv': sys.argv,
+                'process': {
+                    'wall_seconds': round(time.time() - self.started, 3),
+                    'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+                    'max_rss_mb': round(usage.ru_maxrss / 1024, 1),
+                },
+                'counters': [{'name': n, 'labels': dict(l), 'value': v} for (n, l), v in sorted(self.counters.items())],
+                'gauges': [{'name': n, 'labels': dict(l), 'value': g[0], 'max': g[1]}
+                           for (n, l), g in sorted(self.gauges.items())],
+                'histograms': [{'name': n, 'labels': dict(l), **h.summary()}
+                               for (n, l), h in sorted(self.histograms.items())],
+                'stages': dict(self.stages),
+            }
+
+    def prometheus(self) -> str:
+        """Text exposition format; gauges also export their high-water mark as <name>_max"""
+        def labels_text(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ''
+            escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+            return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+        families = {}
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                families.setdefault(name, []).append(f"{PREFIX}{name}{labels_text(labels)} {value}")
+            for (name, labels), (value, high) in sorted(self.gauges.items()):
+                families.setdefault(name, []).append(f"{PREFIX}{name}{labels_text(labels)} {value}")
+                families.setdefault(f"{name}_max", []).append(f"{PREFIX}{name}_max{labels_text(labels)} {high}")
+            for (name, labels), h in sorted(self.histograms.items()):
+                lines = families.setdefault(name, [])
+                cumulative = 0
+                for bound, count in zip((*h.bounds, '+Inf'), h.counts):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{labels_text(labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{labels_text(labels)} {h.sum}")
+                lines.append(f"{PREFIX}{name}_count{labels_text(labels)} {h.count}")
+
+        out = []
+        for name in sorted(families):
+            if name in HELP:
+                kind, text = HELP[name]
+            elif name.endswith('_max'):
+                kind, text = 'gauge', f"High-water mark of {PREFIX}{name[:-4]}"
+            else:
+                kind, text = 'untyped', name
+            out.append(f"# HELP {PREFIX}{name} {text}")
+            out.append(f"# TYPE {PREFIX}{name} {kind}")
+            out.extend(families[name])
+        return '\n'.join(out) + '\n'
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+# Stages to profile; set from the command line or LINGALA_PROFILE / LINGALA_TRACEMALLOC
+# (comma-separated stage names, or "all"), so subprocess stages can be switched on too
+_profile = set(filter(None, os.environ.get('LINGALA_PROFILE', '').split(',')))
+_tracemalloc = set(filter(None, os.environ.get('LINGALA_TRACEMALLOC', '').split(',')))
+_profile_dir = Path(os.environ.get('LINGALA_PROFILE_DIR', 'logs/profiles'))
+
+def configure(profile: str = None, trace_memory: str = None, profile_dir: str = None):
+    """Switch profilers on for comma-separated stage names ("all" for every stage)"""
+    global _profile_dir
+    if profile:
+        _profile.update(s.strip() for s in profile.split(',') if s.strip())
+    if trace_memory:
+        _tracemalloc.update(s.strip() for s in trace_memory.split(',') if s.strip())
+    if profile_dir:
+        _profile_dir = Path(profile_dir)
+
+def _enabled(stages: set, name: str) -> bool:
+    return name in stages or 'all' in stages
+
+@contextmanager
+def stage(name: str, top: int = 15):
+    """Time a stage and, if switched on for it, profile it
+
+    cProfile only sees the thread that enters the stage (pool workers show up
+    as time spent waiting on futures); tracemalloc covers every thread. The
+    profile is dumped to <profile dir>/<stage>.prof for snakeviz/pstats and
+    its top entries go into the report.
+    """
+    profiler = cProfile.Profile() if _enabled(_profile, name) else None
+    tracing = _enabled(_tracemalloc, name)
+    started_tracing = tracing and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(10)
+    if tracing:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    if profiler:
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler:
+            profiler.disable()
+        REGISTRY.set('stage_seconds', round(elapsed, 6), stage=name)
+        section = {'seconds': round(elapsed, 3)}
+
+        if profiler:
+            _profile_dir.mkdir(parents=True, exist_ok=True)
+            path = _profile_dir / f"{name}.prof"
+            profiler.dump_stats(path)
+            stats = pstats.Stats(profiler, stream=io.StringIO()).sort_stats('cumulative')
+            section['profile'] = {
+                'path': str(path),
+                'top': [{'function': f"{file}:{line}({func})", 'calls': nc,
+                         'tottime': round(tt, 4), 'cumtime': round(ct, 4)}
+                        for (file, line, func), (_, nc, tt, ct, _) in
+                        sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top]],
+            }
+
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            growth = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            section['tracemalloc'] = {
+                'current_mb': round(current / 1024 / 1024, 2),
+                'peak_mb': round(peak / 1024 / 1024, 2),
+                'top_growth': [{'where': str(diff.traceback[0]), 'size_kb': round(diff.size_diff / 1024, 1),
+                                'count': diff.count_diff} for diff in growth[:top]],
+            }
+            if started_tracing:
+                tracemalloc.stop()
+
+        with REGISTRY.lock:
+            REGISTRY.stages[name] = section
+
+def _atomic_write(path: Path, text: str):
+    """Write-then-rename, so the textfile collector never reads half a file"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding='utf-8')
+    os.replace(tmp, path)
+
+def write_json(path):
+    _atomic_write(path, json.dumps(REGISTRY.report(), indent=2, ensure_ascii=False))
+
+def write_prometheus(path):
+    _atomic_write(path, REGISTRY.prometheus())
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    """The metrics/profiling flags every instrumented script accepts"""
+    group = parser.add_argument_group('metrics')
+    group.add_argument('--metrics-json', help='Write a JSON metrics report here at the end of the run')
+    group.add_argument('--metrics-prom', help='Write a Prometheus textfile here at the end of the run')
+    group.add_argument('--profile', help='Comma-separated stages to run under cProfile ("all" for every stage)')
+    group.add_argument('--tracemalloc', help='Comma-separated stages to trace allocations in ("all" for every stage)')
+    group.add_argument('--profile-dir', help='Where .prof files go (default: logs/profiles)')
+    return group
+
+def configure_from_args(args: argparse.Namespace):
+    configure(getattr(args, 'profile', None), getattr(args, 'tracemalloc', None), getattr(args, 'profile_dir', None))
+
+def export_from_args(args: argparse.Namespace):
+    """Write whichever reports were asked for on the command line"""
+    if getattr(args, 'metrics_json', None):
+        write_json(args.metrics_json)
+    if getattr(args, 'metrics_prom', None):
+        write_prometheus(args.metrics_prom)
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f"{k}={v}" for k, v in sorted(labels.items())) + '}'
+
+def headline(report: dict) -> dict:
+    """Flatten a report into comparable numbers: histogram p50/p95/p99, counters, stage times"""
+    values = {}
+    for h in report.get('histograms', []):
+        for q in ('p50', 'p95', 'p99'):
+            if h.get(q) is not None:
+                values[f"{_series(h['name'], h['labels'])} {q}"] = h[q]
+    for c in report.get('counters', []):
+        values[_series(c['name'], c['labels'])] = c['value']
+    for name, section in report.get('stages', {}).items():
+        values[f"stage_seconds{{stage={name}}}"] = section['seconds']
+    values['process cpu_seconds'] = report['process']['cpu_seconds']
+    values['process max_rss_mb'] = report['process']['max_rss_mb']
+    return values
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """Rows of (metric, baseline, current, change, regressed) for latency and stage times"""
+    current, previous = headline(report), headline(baseline)
+    rows = []
+    for name, value in current.items():
+        before = previous.get(name)
+        change = (value - before) / before if before else None
+        # Only times and resources count as regressions; counters just describe the workload
+        timed = '_seconds' in name or 'max_rss' in name
+        rows.append((name, before, value, change, bool(timed and change is not None and change > threshold)))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a metrics report, optionally against a baseline")
+    parser.add_argument('report', help='JSON report written with --metrics-json')
+    parser.add_argument('--baseline', help='Earlier report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative slowdown flagged as a regression')
+    parser.add_argument('--markdown', action='store_true', help='Markdown table (for $GITHUB_STEP_SUMMARY)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 when anything regressed')
+    args = parser.parse_args()
+
+    report = json.loads(Path(args.report).read_text())
+    baseline = None
+    if args.baseline and Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text())
+    if baseline:
+        rows = compare(report, baseline, args.threshold)
+    else:
+        rows = [(name, None, value, None, False) for name, value in headline(report).items()]
+
+    def fmt(value):
+        return '' if value is None else f"{value:.4g}" if isinstance(value, float) else str(value)
+
+    if args.markdown:
+        print("| Metric | Baseline | Current | Change |")
+        print("|---|---:|---:|---:|")
+        for name, before, value, change, regressed in rows:
+            delta = f"{change:+.0%}" if change is not None else ''
+            print(f"| `{name}` | {fmt(before)} | {fmt(value)} | {delta}{' ⚠️' if regressed else ''} |")
+    else:
+        width = max((len(r[0]) for r in rows), default=10)
+        for name, before, value, change, regressed in rows:
+            delta = f"{change:+.0%}" if change is not None else ''
+            print(f"{name:<{width}}  {fmt(before):>10}  {fmt(value):>10}  {delta:>6}{'  ⚠️' if regressed else ''}")
+
+    regressions = [r[0] for r in rows if r[4]]
+    if baseline is None and args.baseline:
+        print(f"\nℹ️  No baseline at {args.baseline}", file=sys.stderr)
+    if regressions:
+        print(f"\n⚠️  {len(regressions)} metric(s) regressed more than {args.threshold:.0%}", file=sys.stderr)
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
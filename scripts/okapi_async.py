@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Asyncio scraping engine for Radio Okapi
+Used by download_okapi.py when run with --engine async
+"""
+# filepath: scripts/okapi_async.py
+
+import asyncio, time, logging
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import metrics
+from http_cache import PageCache
+from resumable import (
+    MAX_ATTEMPTS, READ_SIZE, WRITE_BUFFER, IncompleteDownload, discard_part, finalize,
+    load_part_state, part_hasher, part_path, plan_response, resume_headers, save_part_state,
+)
+
+logger = logging.getLogger(__name__)
+
+class HostRateLimiter:
+    """Space out requests so each host sees at most `rate` requests per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = {}
+
+    async def wait(self, url: str):
+        """Sleep until the next request slot for the URL's host"""
+        if not self.interval:
+            return
+
+        host = urlsplit(url).netloc
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(host, now))
+        # Reserve the slot before sleeping so concurrent callers queue up behind it
+        self._next_slot[host] = slot + self.interval
+
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def cached_get_text(session, limiter: HostRateLimiter, cache, url: str) -> str:
+    """Async counterpart of http_cache.cached_get_text"""
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(entry):
+        cache.touch(url)
+        metrics.inc('cache_total', result='hit')
+        return entry['body']
+
+    await limiter.wait(url)
+    started = time.perf_counter()
+    async with session.get(url, headers=PageCache.conditional_headers(entry)) as response:
+        if response.status == 304 and entry:
+            cache.touch(url, revalidated=True)
+            metrics.inc('cache_total', result='revalidated')
+            metrics.observe('request_seconds', time.perf_counter() - started, kind='page')
+            return entry['body']
+        metrics.inc('cache_total', result='miss')
+        response.raise_for_status()
+        body = await response.read()
+        html = body.decode(response.get_encoding())
+    metrics.observe('request_seconds', time.perf_counter() - started, kind='page')
+    metrics.inc('bytes_total', len(body), direction='down')
+
+    if cache:
+        cache.store(url, html, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return html
+
+async def fetch_article(session, limiter: HostRateLimiter, article_num: int,
+                        section: dict, parse_article, cache=None) -> dict:
+    """Fetch one article page and parse it off the event loop"""
+    article_url = f"{section['url']}{article_num}"
+    missing = {'article_num': article_num, 'section': section['key'], 'found': False}
+
+    try:
+        html = await cached_get_text(session, limiter, cache, article_url)
+
+        return await asyncio.to_thread(parse_article, article_num, article_url, html, section)
+
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            logger.info(f"Article {article_num} not found (404)")
+            return {**missing, 'error': '404 Not Found'}
+        logger.error(f"Error fetching article {article_num}: {e}")
+        return {**missing, 'error': str(e)}
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching article {article_num}: {e}")
+        return {**missing, 'error': str(e)}
+    except Exception as e:
+        logger.error(f"Unexpected error for article {article_num}: {e}")
+        return {**missing, 'error': str(e)}
+
+async def download_file(session, limiter: HostRateLimiter, url: str, output_path: Path,
+                        attempts: int = MAX_ATTEMPTS, on_retry=None) -> dict:
+    """Async counterpart of resumable.download_file"""
+    last_error = None
+
+    for attempt in range(attempts):
+        offset, state = load_part_state(output_path)
+
+        try:
+            await limiter.wait(url)
+            async with session.get(url, headers=resume_headers(offset, state)) as response:
+                if response.status not in (206, 416):
+                    response.raise_for_status()
+                action, total, validators = plan_response(
+                    response.status, response.headers, offset, state)
+
+                if action == 'restart':
+                    discard_part(output_path)
+                    raise IncompleteDownload(f"cannot resume from byte {offset}")
+                hasher = part_hasher(output_path, action)
+                if action == 'complete':
+                    return finalize(output_path, total, hasher)
+
+                save_part_state(output_path, {**validators, 'url': url, 'total': total})
+                mode = 'ab' if action == 'append' else 'wb'
+                with open(part_path(output_path), mode, buffering=WRITE_BUFFER) as f:
+                    async for chunk in response.content.iter_chunked(READ_SIZE):
+                        hasher.update(chunk)
+                        f.write(chunk)
+
+            return finalize(output_path, total, hasher)
+
+        except Exception as e:
+            last_error = e
+            if isinstance(e, aiohttp.ClientResponseError) and 400 <= e.status < 500:
+                break  # Retrying won't change a client error
+            if attempt + 1 < attempts:
+                if on_retry:
+                    on_retry(attempt + 1, e)
+                await asyncio.sleep(min(2 ** attempt, 30) * 0.5)
+
+    raise last_error
+
+async def download_mp3(session, limiter: HostRateLimiter, mp3_info: dict, output_dir: Path) -> bool:
+    """Stream one MP3 to disk over the pooled session"""
+    filename = mp3_info['filename']
+    output_path = output_dir / filename
+
+    # Only completed downloads are renamed into place, so this is never a partial file
+    if output_path.exists():
+        logger.info(f"⏭️  Skipping existing file: {filename}")
+        mp3_info['file_size'] = output_path.stat().st_size
+        return True
+
+    try:
+        offset, _ = load_part_state(output_path)
+        if offset:
+            logger.info(f"⏯️  Resuming: {filename} from {offset / 1024 / 1024:.1f} MB")
+        else:
+            logger.info(f"⬇️  Downloading: {filename}")
+
+        def on_retry(attempt, e):
+            metrics.inc('retries_total', kind='download')
+            logger.warning(f"🔁 Retry {attempt} for {filename}: {e}")
+
+        started = time.perf_counter()
+        mp3_info.update(await download_file(session, limiter, mp3_info['mp3_url'], output_path, on_retry=on_retry))
+        metrics.observe('request_seconds', time.perf_counter() - started, kind='download')
+        metrics.inc('bytes_total', mp3_info['file_size'] - offset, direction='down')
+
+        logger.info(f"✅ Downloaded: {filename} ({mp3_info['file_size'] / 1024 / 1024:.1f} MB)")
+
+        return True
+
+    except Exception as e:
+        # Keep the .part file so the next run resumes instead of starting over
+        logger.error(f"❌ Download failed for {filename}: {e}")
+        return False
+
+async def crawl(jobs: list, parse_article, on_result, page_workers: int = 8,
+                download_workers: int = 4, rate: float = 10.0, cache=None) -> None:
+    """Run page fetches and MP3 downloads as two concurrent stages
+
+    jobs is a list of (section, article_num, output_dir); all sections share
+    one connection pool and one per-host rate budget, and are served in the
+    order given (the caller interleaves them for fairness).
+    on_result(mp3_info, downloaded) is called once per article; `downloaded`
+    is None when the article had no MP3 to fetch.
+    """
+    limiter = HostRateLimiter(rate)
+    connector = aiohttp.TCPConnector(limit=page_workers + download_workers, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+
+    page_queue = asyncio.Queue()
+    download_queue = asyncio.Queue(maxsize=download_workers * 2)
+
+    for job in jobs:
+        page_queue.put_nowait(job)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+        async def page_worker():
+            while True:
+                try:
+                    section, num, output_dir = page_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                metrics.set_gauge('queue_depth', page_queue.qsize(), queue='pages')
+                mp3_info = await fetch_article(session, limiter, num, section, parse_article, cache)
+                if mp3_info.get('found'):
+                    await download_queue.put((mp3_info, output_dir))
+                    metrics.set_gauge('queue_depth', download_queue.qsize(), queue='downloads')
+                else:
+                    on_result(mp3_info, None)
+
+        async def download_worker():
+            while True:
+                mp3_info, output_dir = await download_queue.get()
+                metrics.set_gauge('queue_depth', download_queue.qsize(), queue='downloads')
+                # A failure here must not end the worker: join() would wait on its queue forever
+                try:
+                    ok = await download_mp3(session, limiter, mp3_info, output_dir)
+                    on_result(mp3_info, ok)
+                except Exception as e:
+                    logger.error(f"❌ Download worker error for {mp3_info.get('filename')}: {e}")
+                finally:
+                    download_queue.task_done()
+
+        downloaders = [asyncio.create_task(download_worker()) for _ in range(download_workers)]
+        await asyncio.gather(*(page_worker() for _ in range(page_workers)))
+        await download_queue.join()
+
+        for task in downloaders:
+            task.cancel()
+        await asyncio.gather(*downloaders, return_exceptions=True)
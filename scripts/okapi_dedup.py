@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for downloaded audio
+Every episode file is hardlinked to .objects/<ab>/<sha256>.mp3, so two
+names for the same bulletin (e.g. ...-web.mp3 and ...-web_0.mp3) share one
+copy on disk. The manifest records the hash and marks later names as
+duplicate_of the canonical one.
+Usage: python okapi_dedup.py data/raw/okapi   (adopt existing files)
+"""
+# filepath: scripts/okapi_dedup.py
+
+import os, hashlib, argparse
+from pathlib import Path
+
+OBJECTS_DIR = ".objects"
+HASH_BUFFER = 1024 * 1024
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 of a file already on disk (for files not hashed during download)"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+class ContentStore:
+    """Hardlink farm keyed by SHA-256"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root) / OBJECTS_DIR
+
+    def object_path(self, sha256: str, suffix: str = ".mp3") -> Path:
+        return self.root / sha256[:2] / f"{sha256}{suffix}"
+
+    def adopt(self, path: Path, sha256: str) -> bool:
+        """Link path into the store; returns True if the content was already there
+
+        A duplicate's own bytes are replaced by a hardlink to the stored
+        object, so the space they took is freed. Filesystems without
+        hardlinks just skip the store; the manifest aliases still apply.
+        """
+        obj = self.object_path(sha256, path.suffix)
+        try:
+            if obj.exists():
+                if os.path.samefile(obj, path):
+                    return False
+                tmp = path.with_name(path.name + ".link")
+                os.link(obj, tmp)
+                os.replace(tmp, path)
+                return True
+            obj.parent.mkdir(parents=True, exist_ok=True)
+            os.link(path, obj)
+        except OSError:
+            pass
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate downloaded audio by content hash")
+    parser.add_argument("out", nargs="?", default="data/raw/okapi", help="Output directory (searched recursively)")
+    args = parser.parse_args()
+
+    output_dir = Path(args.out)
+    store = ContentStore(output_dir)
+    files = duplicates = saved = 0
+    for mp3_file in sorted(output_dir.rglob("*.mp3")):
+        if OBJECTS_DIR in mp3_file.parts:
+            continue
+        files += 1
+        size = mp3_file.stat().st_size
+        if store.adopt(mp3_file, file_sha256(mp3_file)):
+            duplicates += 1
+            saved += size
+            print(f"♻️  Duplicate: {mp3_file.relative_to(output_dir)}")
+
+    print(f"📊 {files} files, {duplicates} duplicates, {saved / 1024 / 1024:.1f} MB freed")
+
+if __name__ == "__main__":
+    main()
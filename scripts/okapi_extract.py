@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+MP3 link and title extraction for Radio Okapi article pages
+The fast path is two precompiled searches that stop at their first match
+(the MP3 link and the first h1/h2/title element), so it never builds a
+tree. BeautifulSoup is only used when the fast path can't find a title.
+"""
+# filepath: scripts/okapi_extract.py
+
+import re, html as htmllib
+
+# One pattern covers the quoted href forms and bare paths in scripts/players
+MP3_RE = re.compile(r'(/sites/default/files/[^"\'<>\s]+?\.mp3)')
+
+# First h1/h2/title element in document order, like soup.find(['h1', 'h2', 'title'])
+HEADING_RE = re.compile(r'<(h1|h2|title)\b[^>]*>(.*?)</\1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]+>')
+
+def _text(fragment: str) -> str:
+    """Approximate get_text(strip=True): strip each text node and join them"""
+    parts = (htmllib.unescape(part).strip() for part in TAG_RE.split(fragment))
+    return ''.join(part for part in parts if part)
+
+def extract_fast(page: str):
+    """Return (mp3_path, title) using precompiled searches only
+
+    mp3_path is None when the page has no MP3 link; title is None when no
+    heading could be matched (the caller should then fall back).
+    """
+    match = MP3_RE.search(page)
+    if not match:
+        return None, None
+
+    heading = HEADING_RE.search(page)
+    title = _text(heading.group(2)) if heading else None
+    return match.group(1), title or None
+
+def extract_full(page: str):
+    """Return (mp3_path, title) with the original findall + BeautifulSoup path"""
+    from bs4 import BeautifulSoup
+
+    patterns = [
+        r'(/sites/default/files/[^"\']+?\.mp3)',
+        r'href="(/sites/default/files/[^"]+\.mp3)"',
+        r"href='(/sites/default/files/[^']+\.mp3)'",
+    ]
+
+    for pattern in patterns:
+        matches = re.findall(pattern, page)
+        if matches:
+            soup = BeautifulSoup(page, 'html.parser')
+            title_elem = soup.find(['h1', 'h2', 'title'])
+            title = title_elem.get_text(strip=True) if title_elem else None
+            return matches[0], title or None
+    return None, None
+
+def extract(page: str):
+    """Return (mp3_path, title), trying the fast path first"""
+    mp3_path, title = extract_fast(page)
+    if mp3_path and title:
+        return mp3_path, title
+    if mp3_path is None and '.mp3' not in page:
+        return None, None  # Nothing for the full parse to find either
+    return extract_full(page)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Incremental manifest builder for the Radio Okapi corpus
+Only entries whose audio changed are rebuilt, and manifest.json is written
+atomically (and only when something changed). An append-only manifest.jsonl
+can be written alongside it for consumers that stream updates.
+Usage: python okapi_manifest.py data/raw/okapi [--full] [--format both]
+"""
+# filepath: scripts/okapi_manifest.py
+
+import os, json, hashlib, argparse, tempfile
+from pathlib import Path
+from datetime import datetime
+
+from okapi_dedup import OBJECTS_DIR, file_sha256
+from okapi_sources import DEFAULT_SECTION, SECTIONS
+
+MANIFEST_JSON = "manifest.json"
+MANIFEST_JSONL = "manifest.jsonl"
+MANIFEST_INDEX = ".manifest_index.json"
+
+# Fields holding one value per segment index, and where their writer stamps the segments it saw
+SEGMENT_FIELDS = {'segments_kept': 'segments_kept_hash', 'dialect_labels': 'dialect_labels_hash'}
+
+def atomic_write_json(path: Path, data, indent: int = 2):
+    """Write JSON to a temp file in the same directory, then rename over path"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.fchmod(fd, 0o644)  # mkstemp creates 0600 files
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def iter_manifest_jsonl(path: Path):
+    """Stream raw records from an append-only manifest.jsonl
+
+    Later records for the same filename supersede earlier ones; a record
+    with "deleted": true removes the file.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def load_manifest(output_dir: Path) -> dict:
+    """Current manifest as {filename: entry}, from manifest.json or manifest.jsonl"""
+    json_path = output_dir / MANIFEST_JSON
+    jsonl_path = output_dir / MANIFEST_JSONL
+    entries = {}
+
+    if json_path.exists():
+        with open(json_path, 'r', encoding='utf-8') as f:
+            for entry in json.load(f):
+                entries[entry['filename']] = entry
+    elif jsonl_path.exists():
+        for record in iter_manifest_jsonl(jsonl_path):
+            if record.get('deleted'):
+                entries.pop(record['filename'], None)
+            else:
+                entries[record['filename']] = record
+    return entries
+
+def save_manifest(output_dir: Path, entries: dict, changed: list = (), removed: list = (),
+                  fmt: str = "json"):
+    """Persist the manifest in the requested format(s)
+
+    manifest.json is rewritten atomically; manifest.jsonl only gets the
+    changed/removed records appended.
+    """
+    if fmt in ("json", "both"):
+        atomic_write_json(output_dir / MANIFEST_JSON, list(entries.values()))
+
+    jsonl_path = output_dir / MANIFEST_JSONL
+    if fmt in ("jsonl", "both") and not jsonl_path.exists():
+        # Seed the log with the full manifest, then append from here on
+        changed, removed = list(entries), []
+    if fmt in ("jsonl", "both") and (changed or removed):
+        with open(jsonl_path, 'a', encoding='utf-8') as f:
+            for filename in changed:
+                f.write(json.dumps(entries[filename], ensure_ascii=False) + "\n")
+            for filename in removed:
+                f.write(json.dumps({'filename': filename, 'deleted': True}) + "\n")
+
+def update_entries(output_dir: Path, updates: dict, fmt: str = "json") -> int:
+    """Merge per-file fields into existing manifest entries and save
+
+    Used by downstream stages (segmentation, filtering, ...) to write their
+    results back without rebuilding the manifest. Returns entries changed.
+    """
+    entries = load_manifest(output_dir)
+    changed = []
+    for filename, fields in updates.items():
+        if filename in entries:
+            entries[filename] = {**entries[filename], **fields}
+            changed.append(filename)
+    if changed:
+        save_manifest(output_dir, entries, changed=changed, fmt=fmt)
+    return len(changed)
+
+def segments_hash(segments: list) -> str:
+    """Short digest of a segment list, to tell whether per-segment results still apply"""
+    return hashlib.sha1(json.dumps(segments or []).encode()).hexdigest()[:16]
+
+def segment_field(entry: dict, field: str):
+    """entry[field] if it was computed from the entry's current segments, else None
+
+    Values written before stamping can only be checked against the number
+    of segments.
+    """
+    value = entry.get(field)
+    if value is None:
+        return None
+    segments = entry.get('segments') or []
+    stamp = entry.get(SEGMENT_FIELDS[field])
+    if stamp is not None:
+        return value if stamp == segments_hash(segments) else None
+    if field == 'dialect_labels':
+        return value if len(value) == len(segments) else None
+    return value if all(0 <= i < len(segments) for i in value) else None
+
+def audio_index(output_dir: Path) -> dict:
+    """Map filename -> path for every MP3 under output_dir (content store excluded)"""
+    index = {}
+    for mp3_file in sorted(Path(output_dir).rglob("*.mp3")):
+        if OBJECTS_DIR not in mp3_file.parts:
+            index.setdefault(mp3_file.name, mp3_file)
+    return index
+
+def find_manifest_dirs(paths: list) -> list:
+    """The given directories and their immediate subdirectories that hold a manifest"""
+    found = []
+    for path in map(Path, paths):
+        for candidate in [path] + sorted(p for p in path.iterdir() if p.is_dir()):
+            if (candidate / MANIFEST_JSON).exists() or (candidate / MANIFEST_JSONL).exists():
+                found.append(candidate)
+    return found
+
+def _entry(root: Path, mp3_file: Path, size: int, metadata: dict, language: str,
+           source: str = 'radio_okapi') -> dict:
+    return {
+        'audio_path': str(mp3_file.relative_to(root)),
+        'filename': mp3_file.name,
+        'title': metadata.get('title') or mp3_file.stem,
+        'article_number': metadata.get('article_number'),
+        'date': metadata.get('date'),
+        'source': source,
+        'source_url': metadata.get('source_url'),
+        'file_size': size,
+        'sha256': metadata.get('sha256'),
+        'language': language,
+        'needs_transcription': True
+    }
+
+def _metadata_from_row(row: dict) -> dict:
+    return {
+        'title': row.get('title'),
+        'article_number': row.get('article_num'),
+        'date': row.get('date'),
+        'source_url': row.get('article_url'),
+        'sha256': row.get('sha256'),
+    }
+
+def _metadata_from_json(output_dir: Path, mp3_file: Path) -> dict:
+    metadata_file = output_dir / "metadata" / f"{mp3_file.stem}.json"
+    if metadata_file.exists():
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def data_root(output_dir: Path) -> Path:
+    """The data/ directory audio_path is relative to
+
+    data/raw/okapi for the flat layout, one level deeper for a section's
+    subdirectory (data/raw/okapi/kikongo).
+    """
+    root = output_dir.parent.parent
+    if output_dir.name in {section['subdir'] for section in SECTIONS.values()}:
+        root = root.parent
+    return root
+
+class ManifestBuilder:
+    """Applies changed audio files to an existing manifest"""
+
+    def __init__(self, output_dir: Path, fmt: str = "json", language: str = 'ln', root: Path = None,
+                 source: str = 'radio_okapi'):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.language = language
+        self.source = source
+        # audio_path is relative to the data/ directory, e.g. raw/okapi/x.mp3
+        self.root = root or data_root(output_dir)
+        self.entries = load_manifest(output_dir)
+        self.changed = []
+        self.removed = []
+        self.index_dirty = False
+
+        index_file = output_dir / MANIFEST_INDEX
+        self.index = {}
+        if index_file.exists():
+            with open(index_file, 'r') as f:
+                self.index = json.load(f)
+        self.files = self.index.setdefault('files', {})
+
+    @property
+    def has_index(self) -> bool:
+        return bool(self.index.get('built_at'))
+
+    def _apply(self, mp3_file: Path, stat, metadata: dict):
+        filename = mp3_file.name
+        if self.files.get(filename) != [stat.st_size, stat.st_mtime_ns]:
+            self.files[filename] = [stat.st_size, stat.st_mtime_ns]
+            self.index_dirty = True
+        # Keep fields added by downstream stages (segments, labels, ...)
+        old = self.entries.get(filename, {})
+        fresh = _entry(self.root, mp3_file, stat.st_size, metadata, self.language, self.source)
+        # align_whisper clears needs_transcription; only new audio content sets it again
+        replaced = old.get('sha256') and fresh['sha256'] and old['sha256'] != fresh['sha256']
+        if 'needs_transcription' in old and not replaced:
+            fresh['needs_transcription'] = old['needs_transcription']
+        entry = {**old, **fresh}
+        if entry != old:
+            self.entries[filename] = entry
+            if filename not in self.changed:
+                self.changed.append(filename)
+
+    def scan(self):
+        """Full pass: stat every MP3, rebuild only those whose size/mtime changed"""
+        seen = set()
+        with os.scandir(self.output_dir) as it:
+            for dirent in it:
+                if not dirent.name.endswith(".mp3") or not dirent.is_file():
+                    continue
+                seen.add(dirent.name)
+                stat = dirent.stat()
+                if self.files.get(dirent.name) == [stat.st_size, stat.st_mtime_ns] \
+                        and dirent.name in self.entries:
+                    continue
+                mp3_file = self.output_dir / dirent.name
+                metadata = _metadata_from_json(self.output_dir, mp3_file)
+                # Files that predate hashing during download are hashed once here
+                metadata['sha256'] = file_sha256(mp3_file)
+                self._apply(mp3_file, stat, metadata)
+
+        for filename in list(self.entries):
+            if filename not in seen:
+                del self.entries[filename]
+                self.files.pop(filename, None)
+                self.index_dirty = True
+                self.removed.append(filename)
+
+    def apply_state(self, state):
+        """Delta pass: only articles the crawl state touched since the last build"""
+        cursor = self.index.get('state_cursor')
+        for row in state.changed_since(cursor):
+            cursor = max(cursor or "", row['updated_at'])
+            mp3_file = self.output_dir / row['filename']
+            if not mp3_file.is_file():
+                continue
+            metadata = _metadata_from_row(row)
+            if not metadata['sha256']:
+                # Skipped existing files aren't hashed during download
+                metadata['sha256'] = self.entries.get(row['filename'], {}).get('sha256') or file_sha256(mp3_file)
+            self._apply(mp3_file, mp3_file.stat(), metadata)
+        if cursor and cursor != self.index.get('state_cursor'):
+            self.index['state_cursor'] = cursor
+            self.index_dirty = True
+
+    def mark_duplicates(self):
+        """Point every entry sharing a hash at one canonical entry
+
+        The canonical entry is the lowest article number (then filename), so
+        the choice is stable across runs.
+        """
+        by_hash = {}
+        for filename, entry in self.entries.items():
+            if entry.get('sha256'):
+                by_hash.setdefault(entry['sha256'], []).append(entry)
+
+        for entry in self.entries.values():
+            group = by_hash.get(entry.get('sha256'), [])
+            canonical = min(group, key=lambda e: (e.get('article_number') is None,
+                                                  e.get('article_number') or 0, e['filename']),
+                            default=entry)
+            duplicate_of = canonical['filename'] if canonical is not entry else None
+            if entry.get('duplicate_of') != duplicate_of:
+                if duplicate_of:
+                    entry['duplicate_of'] = duplicate_of
+                else:
+                    entry.pop('duplicate_of', None)
+                if entry['filename'] not in self.changed:
+                    self.changed.append(entry['filename'])
+
+    def save(self) -> bool:
+        """Write manifest and index if anything changed; returns whether it wrote"""
+        manifest_missing = self.fmt in ("json", "both") and not (self.output_dir / MANIFEST_JSON).exists()
+        wrote = bool(self.changed or self.removed or manifest_missing)
+        if wrote:
+            save_manifest(self.output_dir, self.entries, self.changed, self.removed, self.fmt)
+
+        if wrote or self.index_dirty or not self.has_index:
+            self.index['built_at'] = datetime.now().isoformat()
+            atomic_write_json(self.output_dir / MANIFEST_INDEX, self.index, indent=None)
+        return wrote
+
+def build_manifest(output_dir: Path, state=None, fmt: str = "json", full: bool = False,
+                   language: str = 'ln', root: Path = None, source: str = 'radio_okapi') -> ManifestBuilder:
+    """Bring the manifest up to date, scanning only when there's no index yet"""
+    builder = ManifestBuilder(output_dir, fmt, language, root, source)
+    if full or state is None or not builder.has_index:
+        builder.scan()
+    if state is not None:
+        builder.apply_state(state)
+    builder.mark_duplicates()
+    builder.save()
+    return builder
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the Radio Okapi manifest")
+    parser.add_argument("out", nargs="?", default="data/raw/okapi", help="Output directory")
+    parser.add_argument("--full", action="store_true", help="Stat every file instead of using the crawl state")
+    parser.add_argument("--format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    parser.add_argument("--section", choices=SECTIONS, default=DEFAULT_SECTION,
+                        help="Section whose crawl state the directory holds")
+    parser.add_argument("--language", help="Language code for new entries (default: the section's)")
+    args = parser.parse_args()
+
+    from okapi_state import open_state
+
+    section = SECTIONS[args.section]
+    output_dir = Path(args.out)
+    with open_state(output_dir, section['source']) as state:
+        builder = build_manifest(output_dir, state, args.format, args.full,
+                                 language=args.language or section['language'])
+    print(f"📋 Manifest: {len(builder.entries)} files "
+          f"({len(builder.changed)} updated, {len(builder.removed)} removed)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Find the newest Radio Okapi article with galloping + binary search
+Used by find_article_range in download_okapi.py
+"""
+# filepath: scripts/okapi_probe.py
+
+import json, logging
+from pathlib import Path
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE = "probe_cache.json"
+
+def make_head_probe(session, base_url: str, timeout: int = 10):
+    """Return exists(article_num) that checks an article with a HEAD request
+
+    Falls back to a streamed GET (headers only, body never read) for servers
+    that reject HEAD. Results are memoized so no number is probed twice.
+    """
+    seen = {}
+
+    def exists(article_num: int) -> bool:
+        if article_num in seen:
+            return seen[article_num]
+
+        url = f"{base_url}{article_num}"
+        try:
+            with metrics.timer('request_seconds', kind='probe'):
+                response = session.head(url, timeout=timeout, allow_redirects=True)
+            if response.status_code in (405, 501):
+                with session.get(url, timeout=timeout, stream=True) as get_response:
+                    status = get_response.status_code
+            else:
+                status = response.status_code
+        except Exception as e:
+            logger.warning(f"Probe failed for article {article_num}: {e}")
+            status = None
+
+        seen[article_num] = status is not None and 200 <= status < 300
+        return seen[article_num]
+
+    exists.probes = seen
+    return exists
+
+def find_latest(exists, hint: int = None, gap: int = 5) -> int:
+    """Return the highest article number for which exists() is true
+
+    Up to `gap` consecutive missing numbers are treated as holes in the
+    numbering rather than the end. Costs O(gap * log n) probes; starting
+    from a recent `hint` keeps n small.
+    """
+    def alive(num: int) -> bool:
+        # num is "inside" the range if it or one of the next `gap` numbers exists
+        return any(exists(num + i) for i in range(gap + 1))
+
+    lo = hint if hint and hint > 0 and alive(hint) else 1
+    if not alive(lo):
+        return 0
+
+    # Gallop forward until we overshoot the end
+    step = 1
+    while alive(lo + step):
+        lo += step
+        step *= 2
+    hi = lo + step
+
+    # Binary search for the last alive number in [lo, hi)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if alive(mid):
+            lo = mid
+        else:
+            hi = mid
+
+    # alive(lo) and nothing in lo+1 .. lo+gap+1 exists, so lo itself must exist
+    return lo
+
+def load_cached_latest(output_dir: Path, base_url: str):
+    """Last known newest article for base_url, or None"""
+    cache_file = output_dir / PROBE_CACHE
+    if not cache_file.exists():
+        return None
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f).get(base_url)
+    except (ValueError, OSError):
+        return None
+
+def save_cached_latest(output_dir: Path, base_url: str, latest: int):
+    """Remember the newest article so the next probe starts from there"""
+    cache_file = output_dir / PROBE_CACHE
+    cache = {}
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+        except (ValueError, OSError):
+            cache = {}
+    cache[base_url] = latest
+    with open(cache_file, 'w') as f:
+        json.dump(cache, f, indent=2)
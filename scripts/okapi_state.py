@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+SQLite crawl state for the Radio Okapi scraper
+Replaces processed_articles.json; the per-episode metadata JSON files are
+imported once and the database is the source of truth afterwards.
+Usage: python okapi_state.py data/raw/okapi   (print a status summary)
+"""
+# filepath: scripts/okapi_state.py
+
+import json, sqlite3, threading, argparse
+from pathlib import Path
+from datetime import datetime
+
+STATE_DB = "crawl_state.sqlite"
+DEFAULT_SOURCE = "radio_okapi_lingala"
+
+# Articles in these states are skipped by --incremental runs. 404s and
+# failed downloads are retried, since the article may have appeared since.
+DONE_STATUSES = ("downloaded", "no_mp3", "legacy")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    source        TEXT    NOT NULL,
+    article_num   INTEGER NOT NULL,
+    status        TEXT    NOT NULL,
+    article_url   TEXT,
+    mp3_url       TEXT,
+    title         TEXT,
+    date          TEXT,
+    filename      TEXT,
+    etag          TEXT,
+    last_modified TEXT,
+    sha256        TEXT,
+    file_size     INTEGER,
+    error         TEXT,
+    downloaded_at TEXT,
+    updated_at    TEXT    NOT NULL,
+    PRIMARY KEY (source, article_num)
+);
+CREATE INDEX IF NOT EXISTS idx_articles_status ON articles (source, status, article_num);
+CREATE INDEX IF NOT EXISTS idx_articles_filename ON articles (filename);
+CREATE INDEX IF NOT EXISTS idx_articles_updated ON articles (source, updated_at);
+"""
+
+COLUMNS = ("article_url", "mp3_url", "title", "date", "filename", "etag",
+           "last_modified", "sha256", "file_size", "error", "downloaded_at")
+
+class CrawlState:
+    """Thread-safe handle on the crawl state database
+
+    Each thread gets its own connection; WAL mode lets the worker pool
+    write while other threads read, and every write commits immediately
+    so a crash loses at most the article in flight.
+    """
+
+    def __init__(self, db_path: Path, source: str = DEFAULT_SOURCE):
+        self.db_path = Path(db_path)
+        self.source = source
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Connections are only ever used by the thread that opened them, but
+            # close() runs on the main thread
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close every connection opened through this handle"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def pending(self, start_num: int, end_num: int) -> list:
+        """Article numbers in [start_num, end_num] that still need work"""
+        placeholders = ",".join("?" for _ in DONE_STATUSES)
+        rows = self._conn().execute(
+            f"SELECT article_num FROM articles WHERE source = ? AND status IN ({placeholders}) "
+            f"AND article_num BETWEEN ? AND ?",
+            (self.source, *DONE_STATUSES, start_num, end_num),
+        )
+        done = {row[0] for row in rows}
+        return [num for num in range(start_num, end_num + 1) if num not in done]
+
+    def get(self, article_num: int):
+        """Row for one article as a dict, or None"""
+        row = self._conn().execute(
+            "SELECT * FROM articles WHERE source = ? AND article_num = ?",
+            (self.source, article_num),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def downloaded(self) -> list:
+        """All downloaded articles for this source, newest first"""
+        rows = self._conn().execute(
+            "SELECT * FROM articles WHERE source = ? AND status = 'downloaded' ORDER BY article_num DESC",
+            (self.source,),
+        )
+        return [dict(row) for row in rows]
+
+    def changed_since(self, cursor: str = None) -> list:
+        """Downloaded articles updated after `cursor` (an updated_at value)"""
+        rows = self._conn().execute(
+            "SELECT * FROM articles WHERE source = ? AND status = 'downloaded' AND updated_at > ? "
+            "ORDER BY updated_at",
+            (self.source, cursor or ""),
+        )
+        return [dict(row) for row in rows]
+
+    def record(self, article_num: int, status: str, **fields):
+        """Insert or update one article and commit"""
+        fields = {k: v for k, v in fields.items() if k in COLUMNS}
+        columns = ["source", "article_num", "status", "updated_at", *fields]
+        values = [self.source, article_num, status, datetime.now().isoformat(), *fields.values()]
+        # A later failure shouldn't erase what an earlier success learned
+        updates = ", ".join(
+            f"{col} = excluded.{col}" if col in ("status", "updated_at", "error")
+            else f"{col} = COALESCE(excluded.{col}, {col})"
+            for col in columns[2:]
+        )
+
+        conn = self._conn()
+        conn.execute(
+            f"INSERT INTO articles ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (source, article_num) DO UPDATE SET {updates}",
+            values,
+        )
+        conn.commit()
+
+    def record_result(self, mp3_info: dict, downloaded):
+        """Record the outcome of fetching (and maybe downloading) an article"""
+        if downloaded:
+            status = "downloaded"
+        elif downloaded is False:
+            status = "failed"
+        elif mp3_info.get('error') == '404 Not Found':
+            status = "missing"
+        elif mp3_info.get('error') == 'No MP3 found':
+            status = "no_mp3"
+        else:
+            status = "failed"
+
+        self.record(
+            mp3_info['article_num'], status,
+            article_url=mp3_info.get('article_url'),
+            mp3_url=mp3_info.get('mp3_url'),
+            title=mp3_info.get('title'),
+            date=mp3_info.get('date'),
+            filename=mp3_info.get('filename'),
+            etag=mp3_info.get('etag'),
+            last_modified=mp3_info.get('last_modified'),
+            sha256=mp3_info.get('sha256'),
+            file_size=mp3_info.get('file_size'),
+            error=None if downloaded else mp3_info.get('error'),
+            **({'downloaded_at': datetime.now().isoformat()} if downloaded else {}),
+        )
+
+    def is_empty(self) -> bool:
+        return self._conn().execute("SELECT 1 FROM articles LIMIT 1").fetchone() is None
+
+    def status_counts(self) -> dict:
+        rows = self._conn().execute(
+            "SELECT status, COUNT(*) FROM articles WHERE source = ? GROUP BY status", (self.source,))
+        return {status: count for status, count in rows}
+
+def migrate_legacy_json(state: CrawlState, output_dir: Path) -> tuple:
+    """Import processed_articles.json and metadata/*.json into the database
+
+    Returns (processed_imported, metadata_imported). Safe to run again:
+    existing rows are only filled in, never downgraded.
+    """
+    conn = state._conn()
+    metadata_count = 0
+
+    metadata_dir = output_dir / "metadata"
+    for metadata_file in sorted(metadata_dir.glob("*.json")) if metadata_dir.exists() else []:
+        try:
+            with open(metadata_file, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (ValueError, OSError):
+            continue
+        if metadata.get('article_number') is None:
+            continue
+
+        audio_file = output_dir / metadata.get('filename', '')
+        conn.execute(
+            "INSERT OR IGNORE INTO articles (source, article_num, status, article_url, mp3_url, "
+            "title, date, filename, file_size, downloaded_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (state.source, metadata['article_number'],
+             "downloaded" if audio_file.is_file() else "legacy",
+             metadata.get('source_url'), metadata.get('audio_url'), metadata.get('title'),
+             metadata.get('date'), metadata.get('filename'),
+             audio_file.stat().st_size if audio_file.is_file() else None,
+             metadata.get('downloaded_at'), datetime.now().isoformat()),
+        )
+        metadata_count += 1
+
+    processed_count = 0
+    processed_file = output_dir / "processed_articles.json"
+    if processed_file.exists():
+        with open(processed_file, 'r') as f:
+            processed = json.load(f)
+        now = datetime.now().isoformat()
+        conn.executemany(
+            "INSERT OR IGNORE INTO articles (source, article_num, status, updated_at) VALUES (?, ?, 'legacy', ?)",
+            [(state.source, int(num), now) for num in processed],
+        )
+        processed_count = len(processed)
+
+    conn.commit()
+    return processed_count, metadata_count
+
+def open_state(output_dir: Path, source: str = DEFAULT_SOURCE, logger=None) -> CrawlState:
+    """Open the crawl state for output_dir, importing legacy JSON on first use"""
+    state = CrawlState(output_dir / STATE_DB, source)
+    if state.is_empty():
+        processed, metadata = migrate_legacy_json(state, output_dir)
+        if (processed or metadata) and logger:
+            logger.info(f"🗄️  Imported {processed} processed articles and {metadata} metadata files into {STATE_DB}")
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description="Show Radio Okapi crawl state")
+    parser.add_argument("out", nargs="?", default="data/raw/okapi", help="Output directory")
+    parser.add_argument("--source", default=DEFAULT_SOURCE, help="Source name")
+    args = parser.parse_args()
+
+    with open_state(Path(args.out), args.source) as state:
+        for status, count in sorted(state.status_counts().items()):
+            print(f"{status:12} {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Audio quality filter for the corpus
+Each file is decoded once; per-frame energy and clipping statistics are
+computed with NumPy over whole blocks, and SNR, clipping, silence,
+speech-rate and duration features are derived for the file and for each
+of its segments. Features are cached in a columnar store keyed by the
+file's SHA-256, so re-running with different thresholds doesn't decode
+anything.
+Usage: python quality_filter.py data/raw/okapi/lingala --min-snr 15 [--dry-run]
+"""
+# filepath: scripts/quality_filter.py
+
+import os, sys, argparse, tempfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_stream import TARGET_SR
+from audio_cache import DEFAULT_MAX_MB, add_cache_arguments, open_blocks, open_cache
+from segment import FRAME_SECONDS, DEFAULTS as SEGMENT_DEFAULTS
+from okapi_dedup import file_sha256
+from okapi_manifest import audio_index, load_manifest, segments_hash, update_entries
+
+FEATURES_FILE = "quality_features.npz"
+FEATURES = ('duration', 'snr_db', 'clip_ratio', 'silence_ratio', 'speech_rate')
+FEATURE_VERSION = 1  # Bump when the feature definitions change
+
+CLIP_LEVEL = 0.999
+SILENCE_DB = SEGMENT_DEFAULTS['threshold_db']
+
+THRESHOLDS = {
+    # name: (feature, comparison, default)
+    'min_snr': ('snr_db', '>=', 15.0),
+    'max_clip': ('clip_ratio', '<=', 0.001),
+    'max_silence': ('silence_ratio', '<=', 0.5),
+    'min_rate': ('speech_rate', '>=', 1.0),
+    'max_rate': ('speech_rate', '<=', 8.0),
+    'min_duration': ('duration', '>=', 1.0),
+    'max_duration': ('duration', '<=', 30.0),
+}
+
+def frame_stats(blocks, sr: int = TARGET_SR, frame_seconds: float = FRAME_SECONDS):
+    """Per-frame energy (dBFS) and clipped-sample counts for a whole file
+
+    Frames are 20 ms, so the result is ~50 values per second of audio
+    however the file is blocked.
+    """
+    frame_len = int(sr * frame_seconds)
+    carry = np.zeros(0, dtype=np.float32)
+    energies, clipped = [], []
+    for block in blocks:
+        if len(carry):
+            block = np.concatenate((carry, block))
+        n = len(block) // frame_len
+        carry = block[n * frame_len:]
+        frames = block[:n * frame_len].reshape(n, frame_len)
+        energies.append(10 * np.log10(np.einsum('ij,ij->i', frames, frames) / frame_len + 1e-10))
+        clipped.append(np.count_nonzero(np.abs(frames) >= CLIP_LEVEL, axis=1))
+    if len(carry):
+        energies.append(10 * np.log10(np.array([np.mean(carry ** 2)]) + 1e-10))
+        clipped.append(np.array([np.count_nonzero(np.abs(carry) >= CLIP_LEVEL)]))
+    if not energies:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    return np.concatenate(energies), np.concatenate(clipped)
+
+def range_features(db: np.ndarray, clipped: np.ndarray, peaks: np.ndarray, noise_floor: float,
+                   frame_seconds: float = FRAME_SECONDS) -> tuple:
+    """Features of one span of frames, in FEATURES order
+
+    SNR compares the span's loud frames with the whole file's noise floor,
+    since a tightly cut segment has few quiet frames of its own.
+    """
+    if not len(db):
+        return (0.0, 0.0, 0.0, 1.0, 0.0)
+    voiced = db > SILENCE_DB
+    voiced_seconds = np.count_nonzero(voiced) * frame_seconds
+    return (
+        len(db) * frame_seconds,
+        float(np.percentile(db, 95) - noise_floor),
+        float(clipped.sum() / (len(db) * frame_seconds * TARGET_SR)),
+        float(1 - voiced.mean()),
+        float(np.count_nonzero(peaks) / voiced_seconds) if voiced_seconds else 0.0,
+    )
+
+def compute_features(path: str, segments: list, sha256: str = None,
+                     cache_root: str = None, cache_mb: float = DEFAULT_MAX_MB) -> dict:
+    """Decode path once; returns columns for the file row and one row per segment"""
+    db, clipped = frame_stats(open_blocks(Path(path), sha256, open_cache(cache_root, cache_mb)))
+
+    # Syllable-nucleus proxy: local maxima of the smoothed energy envelope
+    smooth = np.convolve(db, np.ones(5) / 5, mode='same') if len(db) >= 5 else db
+    peaks = np.zeros(len(db), dtype=bool)
+    if len(db) >= 3:
+        peaks[1:-1] = (smooth[1:-1] > smooth[:-2]) & (smooth[1:-1] >= smooth[2:]) \
+            & (smooth[1:-1] > SILENCE_DB + 6)
+
+    noise_floor = float(np.percentile(db, 10)) if len(db) else 0.0
+    spans = [(-1, 0.0, len(db) * FRAME_SECONDS)] + [(i, s, e) for i, (s, e) in enumerate(segments or [])]
+    rows = []
+    for index, start, end in spans:
+        a, b = int(round(start / FRAME_SECONDS)), int(round(end / FRAME_SECONDS))
+        rows.append((index, start, end) + range_features(db[a:b], clipped[a:b], peaks[a:b], noise_floor))
+
+    columns = list(zip(*rows))
+    table = {'segment': np.array(columns[0], dtype=np.int32),
+             'start': np.array(columns[1], dtype=np.float32),
+             'end': np.array(columns[2], dtype=np.float32)}
+    for name, values in zip(FEATURES, columns[3:]):
+        table[name] = np.array(values, dtype=np.float32)
+    return table
+
+class FeatureStore:
+    """Columnar feature cache: one array per column in a single .npz
+
+    Rows are (sha256, segment) with segment -1 for the whole file. A file's
+    rows are reused as long as its segment boundaries are unchanged.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._load()
+
+    def _load(self):
+        self.columns = {}
+        if self.path.exists():
+            with np.load(self.path) as data:
+                if int(data['version']) == FEATURE_VERSION:
+                    self.columns = {k: data[k] for k in data.files if k != 'version'}
+        self.added = []
+        self.replaced = set()
+        self._index = {}
+        for row, sha in enumerate(self.columns.get('sha256', [])):
+            self._index.setdefault(str(sha), []).append(row)
+
+    def rows(self, sha256: str) -> list:
+        return self._index.get(sha256, [])
+
+    def is_current(self, sha256: str, segments: list) -> bool:
+        rows = self.rows(sha256)
+        if not rows:
+            return False
+        cached = self.columns['segment'][rows] >= 0
+        bounds = np.stack((self.columns['start'][rows][cached], self.columns['end'][rows][cached]), axis=-1)
+        wanted = np.array(segments or [], dtype=np.float32).reshape(-1, 2)
+        return bounds.shape == wanted.shape and np.allclose(bounds, wanted)
+
+    def put(self, sha256: str, table: dict):
+        table = {'sha256': np.array([sha256] * len(table['segment']), dtype='U64'), **table}
+        self.added.append(table)
+        if sha256 in self._index:
+            self.replaced.add(sha256)
+
+    def save(self):
+        """Merge new rows in and rewrite the .npz atomically"""
+        if not self.added:
+            return
+        keep = None
+        if self.columns and self.replaced:
+            keep = ~np.isin(self.columns['sha256'], list(self.replaced))
+        parts = ([{k: v[keep] if keep is not None else v for k, v in self.columns.items()}]
+                 if self.columns else []) + self.added
+        merged = {k: np.concatenate([p[k] for p in parts]) for k in parts[-1]}
+
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        os.fchmod(fd, 0o644)  # mkstemp creates 0600 files
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, version=FEATURE_VERSION, **merged)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._load()
+
+def passes(columns: dict, thresholds: dict, exempt: dict = None) -> tuple:
+    """Vectorized threshold check; returns (pass mask, {threshold: rejected mask})
+
+    exempt maps a threshold name to a mask of rows it does not apply to.
+    """
+    rejected = {}
+    for name, value in thresholds.items():
+        if value is None:
+            continue
+        feature, op, _ = THRESHOLDS[name]
+        values = columns[feature]
+        rejected[name] = values < value if op == '>=' else values > value
+        if exempt and name in exempt:
+            rejected[name] &= ~exempt[name]
+    mask = np.ones(len(columns['segment']), dtype=bool)
+    for reject in rejected.values():
+        mask &= ~reject
+    return mask, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter corpus audio by quality features")
+    parser.add_argument("manifest_dir", nargs="?", default="data/raw/okapi", help="Directory with manifest.json and the audio")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes for feature extraction")
+    parser.add_argument("--level", choices=["segment", "file"], default="segment",
+                        help="Filter segments (files without segments are judged whole) or whole files")
+    for name, (feature, op, default) in THRESHOLDS.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=float,
+                            help=f"Keep if {feature} {op} this (default {default})")
+    add_cache_arguments(parser)
+    parser.add_argument("--dry-run", action="store_true", help="Report pass/fail counts without touching the manifest")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    args = parser.parse_args()
+
+    manifest_dir = Path(args.manifest_dir)
+    entries = load_manifest(manifest_dir)
+    paths = audio_index(manifest_dir)
+    store = FeatureStore(manifest_dir / FEATURES_FILE)
+
+    files = {}
+    for filename, entry in entries.items():
+        if entry.get('duplicate_of') or filename not in paths:
+            continue
+        sha = entry.get('sha256') or file_sha256(paths[filename])
+        files[filename] = sha
+
+    todo = [f for f, sha in files.items() if not store.is_current(sha, entries[f].get('segments'))]
+    print(f"🔎 {len(files)} files, {len(files) - len(todo)} cached, {len(todo)} to decode")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            cache_root = None if args.no_audio_cache else str(manifest_dir)
+            futures = {executor.submit(compute_features, str(paths[f]), entries[f].get('segments'),
+                                       files[f], cache_root, args.audio_cache_mb): f
+                       for f in todo}
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    store.put(files[filename], future.result())
+                except Exception as e:
+                    print(f"❌ {filename}: {e}")
+        store.save()
+
+    if not store.columns:
+        print("❌ No features available")
+        sys.exit(1)
+
+    # A file whose extraction failed may still have rows from an older segmentation
+    current = {f: sha for f, sha in files.items() if store.is_current(sha, entries[f].get('segments'))}
+    if len(current) < len(files):
+        print(f"⚠️  {len(files) - len(current)} files have no features for their current segments; left as they are")
+
+    # Everything below works on cached columns only
+    columns = store.columns
+    shas = set(current.values())
+    in_corpus = np.isin(columns['sha256'], list(shas))
+    has_segments = {sha for sha in shas if np.any(columns['segment'][store.rows(sha)] >= 0)}
+    if args.level == 'file':
+        selected = in_corpus & (columns['segment'] < 0)
+    else:
+        file_rows = (columns['segment'] < 0) & ~np.isin(columns['sha256'], list(has_segments))
+        selected = in_corpus & ((columns['segment'] >= 0) | file_rows)
+
+    thresholds = {}
+    for name, (feature, _, default) in THRESHOLDS.items():
+        value = getattr(args, name)
+        # Duration defaults are meant for segments, not whole bulletins
+        if value is None and not (args.level == 'file' and feature == 'duration'):
+            value = default
+        thresholds[name] = value
+    exempt = {}
+    if args.level == 'segment':
+        # Duration limits are sized for utterances; unsegmented bulletins are judged on the rest
+        file_level = columns['segment'] < 0
+        exempt = {name: file_level for name, (feature, _, _) in THRESHOLDS.items() if feature == 'duration'}
+    keep, rejected = passes(columns, thresholds, exempt)
+    total = np.count_nonzero(selected)
+    kept = np.count_nonzero(keep & selected)
+    kept_hours = columns['duration'][keep & selected].sum() / 3600
+    print(f"📊 {kept}/{total} {args.level}s pass ({kept_hours:.2f} h kept)")
+    for name, reject in rejected.items():
+        print(f"   • {name}: rejects {np.count_nonzero(reject & selected)}")
+
+    if args.dry_run:
+        return
+
+    updates = {}
+    for filename, sha in current.items():
+        rows = store.rows(sha)
+        file_row = next(r for r in rows if columns['segment'][r] < 0)
+        update = {
+            'quality': {name: round(float(columns[name][file_row]), 4) for name in FEATURES},
+            'quality_thresholds': thresholds,
+        }
+        segment_rows = [r for r in rows if columns['segment'][r] >= 0]
+        if args.level == 'segment' and segment_rows:
+            update['segments_kept'] = [int(columns['segment'][r]) for r in segment_rows if keep[r]]
+            update['segments_kept_hash'] = segments_hash(entries[filename].get('segments'))
+            update['quality_pass'] = bool(update['segments_kept'])
+        else:
+            update['quality_pass'] = bool(keep[file_row])
+        updates[filename] = update
+
+    changed = update_entries(manifest_dir, updates, args.manifest_format)
+    print(f"📋 Updated {changed} manifest entries")
+
+if __name__ == "__main__":
+    main()
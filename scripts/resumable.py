@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Resumable, verified downloads via HTTP Range requests
+Shared by the threaded and async engines in download_okapi.py
+"""
+# filepath: scripts/resumable.py
+
+import os, re, json, time, hashlib
+from pathlib import Path
+
+PART_SUFFIX = ".part"
+READ_SIZE = 64 * 1024       # Small reads lose little when a connection drops
+WRITE_BUFFER = 1024 * 1024  # ...but disk writes go out in 1 MiB chunks
+MAX_ATTEMPTS = 5
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)')
+
+class IncompleteDownload(Exception):
+    """Raised when the bytes on disk don't match what the server announced"""
+
+def part_path(output_path: Path) -> Path:
+    """Path of the in-progress file for a download"""
+    return output_path.with_name(output_path.name + PART_SUFFIX)
+
+def _state_path(part: Path) -> Path:
+    return part.with_name(part.name + ".json")
+
+def load_part_state(output_path: Path) -> tuple:
+    """Return (offset, validators) for a previous partial download"""
+    part = part_path(output_path)
+    if not part.exists():
+        return 0, {}
+
+    state = {}
+    state_file = _state_path(part)
+    if state_file.exists():
+        try:
+            state = json.loads(state_file.read_text())
+        except ValueError:
+            state = {}
+    return part.stat().st_size, state
+
+def save_part_state(output_path: Path, state: dict):
+    """Remember the validators of the entity being downloaded"""
+    _state_path(part_path(output_path)).write_text(json.dumps(state))
+
+def discard_part(output_path: Path):
+    """Throw away a partial download that can't be resumed"""
+    part = part_path(output_path)
+    for path in (part, _state_path(part)):
+        if path.exists():
+            path.unlink()
+
+def resume_headers(offset: int, state: dict) -> dict:
+    """Range/If-Range headers to continue a download from `offset`"""
+    if offset <= 0:
+        return {}
+    headers = {'Range': f'bytes={offset}-'}
+    # If-Range makes the server send the whole file (200) if it has changed
+    validator = state.get('etag') or state.get('last_modified')
+    if validator:
+        headers['If-Range'] = validator
+    return headers
+
+def plan_response(status: int, headers, offset: int, state: dict) -> tuple:
+    """Decide how to consume a response to a (possibly ranged) request
+
+    Returns (action, total, validators) where action is 'append' to continue
+    the part file, 'write' to start it over with this body, 'complete' if the
+    part file already holds the whole entity, or 'restart' to discard it and
+    request again without a Range.
+    """
+    validators = {
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+    }
+
+    if status == 416:
+        match = _CONTENT_RANGE.match(headers.get('Content-Range', ''))
+        if match and match.group(3) != '*' and int(match.group(3)) == offset and offset > 0:
+            return 'complete', offset, state
+        return 'restart', None, validators
+
+    if status == 206:
+        match = _CONTENT_RANGE.match(headers.get('Content-Range', ''))
+        if not match or match.group(1) is None or int(match.group(1)) != offset:
+            return 'restart', None, validators
+        if state.get('etag') and validators['etag'] and state['etag'] != validators['etag']:
+            return 'restart', None, validators
+        total = int(match.group(3)) if match.group(3) != '*' else None
+        return 'append', total, {**state, **{k: v for k, v in validators.items() if v}}
+
+    length = headers.get('Content-Length')
+    return 'write', int(length) if length is not None else None, validators
+
+def part_hasher(output_path: Path, action: str):
+    """SHA-256 hasher primed with the bytes already in the part file
+
+    Fresh downloads are hashed as they stream, so only the prefix of a
+    resumed download is ever read back from disk.
+    """
+    hasher = hashlib.sha256()
+    part = part_path(output_path)
+    if action in ('append', 'complete') and part.exists():
+        with open(part, 'rb') as f:
+            for block in iter(lambda: f.read(WRITE_BUFFER), b''):
+                hasher.update(block)
+    return hasher
+
+def finalize(output_path: Path, total: int = None, hasher=None) -> dict:
+    """Verify the part file and atomically move it into place
+
+    Returns the final file size, its SHA-256 and the HTTP validators it was
+    fetched with.
+    """
+    part = part_path(output_path)
+    size = part.stat().st_size
+    if total is not None and size != total:
+        raise IncompleteDownload(f"got {size} of {total} bytes")
+
+    _, state = load_part_state(output_path)
+    os.replace(part, output_path)
+    state_file = _state_path(part)
+    if state_file.exists():
+        state_file.unlink()
+    return {
+        'file_size': size,
+        'sha256': hasher.hexdigest() if hasher else None,
+        'etag': state.get('etag'),
+        'last_modified': state.get('last_modified'),
+    }
+
+def download_file(session, url: str, output_path: Path, timeout: int = 30,
+                  attempts: int = MAX_ATTEMPTS, on_retry=None) -> dict:
+    """Download `url` to `output_path`, resuming any earlier .part file
+
+    Returns the result of finalize(). The .part file is kept on failure so
+    the next run picks up where this one stopped.
+    """
+    last_error = None
+
+    for attempt in range(attempts):
+        offset, state = load_part_state(output_path)
+
+        try:
+            with session.get(url, stream=True, timeout=timeout,
+                             headers=resume_headers(offset, state)) as response:
+                if response.status_code not in (206, 416):
+                    response.raise_for_status()
+                action, total, validators = plan_response(
+                    response.status_code, response.headers, offset, state)
+
+                if action == 'restart':
+                    discard_part(output_path)
+                    raise IncompleteDownload(f"cannot resume from byte {offset}")
+                hasher = part_hasher(output_path, action)
+                if action == 'complete':
+                    return finalize(output_path, total, hasher)
+
+                save_part_state(output_path, {**validators, 'url': url, 'total': total})
+                mode = 'ab' if action == 'append' else 'wb'
+                with open(part_path(output_path), mode, buffering=WRITE_BUFFER) as f:
+                    for chunk in response.iter_content(chunk_size=READ_SIZE):
+                        hasher.update(chunk)
+                        f.write(chunk)
+
+            return finalize(output_path, total, hasher)
+
+        except Exception as e:
+            last_error = e
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status is not None and 400 <= status < 500:
+                break  # Retrying won't change a client error
+            if attempt + 1 < attempts:
+                if on_retry:
+                    on_retry(attempt + 1, e)
+                time.sleep(min(2 ** attempt, 30) * 0.5)
+
+    raise last_error
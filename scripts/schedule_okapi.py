@@ -1,68 +1,311 @@
 #!/usr/bin/env python3
 """
 Schedule regular downloads from Radio Okapi
-Usage: python schedule_okapi.py --interval daily
+The scraper runs in this process, so its keep-alive HTTP session and page
+cache stay warm between runs. Runs fire on a cron-style wall-clock schedule
+(each fire time is computed from the schedule, not from when the last run
+ended, so it doesn't drift), a lock file keeps runs from overlapping, failed
+runs are retried with jittered exponential backoff, and downstream stages
+can be chained after each successful crawl.
+Usage: python schedule_okapi.py --schedule daily --languages lingala,kikongo,tshiluba
+       python schedule_okapi.py --schedule "0 6,18 * * *" --then manifest,upload
+       python schedule_okapi.py --once
 """
-import subprocess
-import time
-import argparse
+# filepath: scripts/schedule_okapi.py
+
+import os, sys, time, fcntl, random, argparse, subprocess
+from pathlib import Path
 from datetime import datetime, timedelta
-import logging
-
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-def run_download():
-    """Run the download script"""
-    cmd = [
-        'python', 'download_okapi.py',
-        '--out', 'data/raw/radio_okapi',
-        '--pages', '5',  # Check last 5 pages
-        '--metadata',
-        '--manifest', 
-        '--incremental'  # Only download new files
-    ]
-    
+
+import metrics
+import download_okapi
+from download_okapi import logger
+
+ALIASES = {
+    'hourly': "0 * * * *",
+    'daily': "0 6 * * *",       # Morning bulletins are up by then
+    'twice-daily': "0 6,18 * * *",  # Same slots as the GitHub Actions workflow
+    'weekly': "0 6 * * 1",
+}
+
+LOCK_FILE = ".schedule.lock"
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week
+
+    Fields accept *, lists (1,15), ranges (1-5) and steps (*/15, 0-30/10).
+    As in cron, when both day fields are restricted a day matching either
+    one fires. Day-of-week 0 and 7 are Sunday.
+    """
+
+    FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = ALIASES.get(expression, expression)
+        parts = self.expression.split()
+        if len(parts) != len(self.FIELDS):
+            raise ValueError(f"Expected 5 cron fields or one of {', '.join(ALIASES)}: {expression!r}")
+        values = {}
+        for part, (name, lo, hi) in zip(parts, self.FIELDS):
+            values[name] = self._parse_field(part, lo, hi)
+        self.minutes, self.hours = values['minute'], values['hour']
+        self.days, self.months = values['day'], values['month']
+        self.weekdays = {d % 7 for d in values['weekday']}
+        # Like cron, a field starting with * (including */2) counts as unrestricted
+        self.any_day = parts[2].startswith('*')
+        self.any_weekday = parts[4].startswith('*')
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> set:
+        values = set()
+        for item in field.split(','):
+            spec, _, step = item.partition('/')
+            if spec == '*':
+                first, last = lo, hi
+            elif '-' in spec:
+                first, last = map(int, spec.split('-'))
+            else:
+                first = last = int(spec)
+                if step:
+                    last = hi
+            if not (lo <= first <= last <= hi) or (step and int(step) < 1):
+                raise ValueError(f"Invalid cron field {field!r} (allowed {lo}-{hi})")
+            values.update(range(first, last + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, when: datetime) -> bool:
+        in_days = when.day in self.days
+        in_weekdays = (when.weekday() + 1) % 7 in self.weekdays  # cron counts from Sunday
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        """First fire time strictly after `after` (skipping whole days/hours that can't match)"""
+        when = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = when + timedelta(days=366 * 5)
+        while when < limit:
+            if when.month not in self.months or not self._day_matches(when):
+                when = when.replace(hour=0, minute=0) + timedelta(days=1)
+            elif when.hour not in self.hours:
+                when = when.replace(minute=0) + timedelta(hours=1)
+            elif when.minute not in self.minutes:
+                when += timedelta(minutes=1)
+            else:
+                return when
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+class RunLock:
+    """Non-blocking exclusive flock; a run is skipped while another holds it"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a+')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            self.file = None
+            return False
+        # Record the holder for whoever finds the lock taken
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(f"{os.getpid()} {datetime.now().isoformat(timespec='seconds')}\n")
+        self.file.flush()
+        return True
+
+    def holder(self) -> str:
+        try:
+            return self.path.read_text().strip() or "unknown"
+        except OSError:
+            return "unknown"
+
+    def release(self):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter: uniform in [delay / 2, delay]"""
+    delay = min(cap, base * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+def sleep_until(when: datetime, poll: float = 60.0):
+    """Sleep to a wall-clock time, re-reading the clock so suspends and clock changes don't shift it"""
+    while True:
+        remaining = (when - datetime.now()).total_seconds()
+        if remaining <= 0:
+            return
+        time.sleep(min(remaining, poll))
+
+def stage_manifest(args, sections: dict):
+    """Full manifest rebuild, reconciling files changed outside the crawl"""
+    from okapi_state import open_state
+    for section in sections.values():
+        section_dir = Path(section['dir'])
+        with open_state(section_dir, section['source']) as state:
+            download_okapi.generate_manifest(section_dir, state, args.manifest_format, True,
+                                             language=section['language'])
+
+def stage_upload(args, sections: dict):
+    from upload_to_gdrive import upload_to_gdrive
+    for section in sections.values():
+        # Each section syncs into its own Drive folder, mirroring <out>/<subdir>
+        subdir = Path(section['dir']).relative_to(args.out)
+        upload_to_gdrive(section['dir'], args.upload_workers, variant=args.upload_variant,
+                         subfolder=subdir.as_posix() if subdir.parts else None)
+
+def run_script(script: str, *script_args):
+    """Processing stages run their own process pools, so they get a fresh interpreter"""
+    cmd = [sys.executable, str(SCRIPTS_DIR / script), *map(str, script_args)]
+    logger.info(f"▶️  {' '.join(cmd[1:])}")
+    subprocess.run(cmd, check=True)
+
+def stage_segment(args, sections: dict):
+    for section in sections.values():
+        run_script("segment.py", section['dir'], "--manifest-dir", section['dir'],
+                   "--manifest-format", args.manifest_format)
+
+def stage_quality(args, sections: dict):
+    for section in sections.values():
+        run_script("quality_filter.py", section['dir'], "--manifest-format", args.manifest_format)
+
+def stage_transcode(args, sections: dict):
+    run_script("transcode.py", *(s['dir'] for s in sections.values()),
+               "--manifest-format", args.manifest_format)
+
+def stage_fingerprint(args, sections: dict):
+    # The index spans the whole corpus, not just the sections crawled this run
+    run_script("fingerprint.py", args.out, "--manifest-format", args.manifest_format)
+
+def stage_dialect(args, sections: dict):
+    run_script("dialect_classifier.py", *(s['dir'] for s in sections.values()),
+               "--manifest-format", args.manifest_format)
+
+STAGES = {
+    'manifest': stage_manifest,
+    'upload': stage_upload,
+    'segment': stage_segment,
+    'quality': stage_quality,
+    'dialect': stage_dialect,
+    'transcode': stage_transcode,
+    'fingerprint': stage_fingerprint,
+}
+
+def run_once(args, scraper_args) -> bool:
+    """Crawl and the chained stages under the run lock; True when everything succeeded"""
+    lock = RunLock(Path(args.out) / LOCK_FILE)
+    if not lock.acquire():
+        logger.warning(f"⏭️  Another run holds {lock.path} ({lock.holder()}); skipping")
+        return True
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-        if result.returncode == 0:
-            logger.info("✅ Download completed successfully")
-            logger.info(result.stdout)
-        else:
-            logger.error(f"❌ Download failed: {result.stderr}")
-    except subprocess.TimeoutExpired:
-        logger.error("❌ Download timed out after 5 minutes")
+        logger.info(f"🚀 Scheduled run at {datetime.now().isoformat(timespec='seconds')}")
+        started = time.monotonic()
+        summary = download_okapi.run(scraper_args, keep_warm=True)
+        if summary['failed']:
+            logger.error(f"❌ {summary['failed']} downloads failed")
+            return False
+        for stage in args.then:
+            logger.info(f"🔗 Stage: {stage}")
+            with metrics.stage(f"then_{stage}"):
+                STAGES[stage](args, summary['sections'])
+        # Again, now with the in-process stages (the crawl wrote its own report already)
+        metrics.export_from_args(scraper_args)
+        logger.info(f"✅ Run finished in {time.monotonic() - started:.0f}s")
+        return True
     except Exception as e:
-        logger.error(f"❌ Download error: {e}")
+        logger.error(f"❌ Run failed: {e}")
+        return False
+    finally:
+        lock.release()
+
+def run_with_retries(args, scraper_args, deadline: datetime = None) -> bool:
+    """run_once, retried with jittered backoff until it succeeds, retries run out or the deadline"""
+    for attempt in range(args.retries + 1):
+        if run_once(args, scraper_args):
+            return True
+        if attempt == args.retries:
+            break
+        delay = backoff_delay(attempt, args.backoff, args.backoff_max)
+        retry_at = datetime.now() + timedelta(seconds=delay)
+        if deadline and retry_at >= deadline:
+            logger.info("⏭️  Next scheduled run comes before the retry; leaving it to that")
+            break
+        logger.info(f"🔁 Retry {attempt + 1}/{args.retries} in {delay:.0f}s")
+        sleep_until(retry_at)
+    return False
+
+def parse_stages(value: str) -> list:
+    stages = [s.strip() for s in value.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGES)}")
+    return stages
 
 def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--interval', choices=['hourly', 'daily', 'weekly'], 
-                       default='daily', help='Download interval')
-    parser.add_argument('--once', action='store_true', 
-                       help='Run once and exit')
-    args = parser.parse_args()
-
-    intervals = {
-        'hourly': 3600,    # 1 hour
-        'daily': 86400,    # 24 hours  
-        'weekly': 604800   # 7 days
-    }
+    parser = argparse.ArgumentParser(description="Run the Radio Okapi scraper on a schedule")
+    parser.add_argument('--schedule', '--interval', dest='schedule', default='daily',
+                        help=f"Cron expression (\"m h dom mon dow\", local time) or one of {', '.join(ALIASES)}")
+    parser.add_argument('--once', action='store_true', help='Run once (with retries) and exit')
+    parser.add_argument('--out', default='data/raw/okapi', help='Output directory')
+    parser.add_argument('--sections', '--languages', dest='sections', help='Comma-separated sections to crawl')
+    parser.add_argument('--latest', type=int, default=10, help='Articles per section to check each run')
+    parser.add_argument('--engine', choices=['threads', 'async'], default='threads',
+                        help='Scraping engine (threads keeps its HTTP session across runs)')
+    parser.add_argument('--then', type=parse_stages, default=[],
+                        help=f"Comma-separated stages to chain after a successful crawl ({', '.join(STAGES)})")
+    parser.add_argument('--manifest-format', choices=['json', 'jsonl', 'both'], default='json', help='Manifest format')
+    parser.add_argument('--upload-workers', type=int, default=4, help='Parallel uploads for the upload stage')
+    parser.add_argument('--upload-variant', choices=['mp3', 'flac', 'opus'], default='mp3',
+                        help='Audio the upload stage syncs (chain transcode before upload for flac/opus)')
+    parser.add_argument('--retries', type=int, default=3, help='Retries after a failed run')
+    parser.add_argument('--backoff', type=float, default=60.0, help='First retry delay (s), doubled each retry')
+    parser.add_argument('--backoff-max', type=float, default=1800.0, help='Retry delay cap (s)')
+    args, extra = parser.parse_known_args()
+
+    # Anything not recognized here is passed through to download_okapi.py
+    scraper_argv = ['--out', args.out, '--latest', str(args.latest), '--engine', args.engine,
+                    '--manifest-format', args.manifest_format, '--incremental']
+    if args.sections:
+        scraper_argv += ['--sections', args.sections]
+    scraper_args = download_okapi.parse_args(scraper_argv + extra)
+
+    try:
+        schedule = CronSchedule(args.schedule)
+    except ValueError as e:
+        parser.error(str(e))
 
     if args.once:
         logger.info("Running single download...")
-        run_download()
-        return
+        ok = run_with_retries(args, scraper_args)
+        download_okapi.close_page_cache()
+        sys.exit(0 if ok else 1)
 
-    interval_seconds = intervals[args.interval]
-    logger.info(f"Starting scheduler with {args.interval} interval ({interval_seconds}s)")
+    logger.info(f"⏰ Scheduler started: {schedule.expression!r}")
+    fire = schedule.next_after(datetime.now())
+    try:
+        while True:
+            logger.info(f"💤 Next run at {fire.isoformat(timespec='minutes')}")
+            sleep_until(fire)
+            run_with_retries(args, scraper_args, deadline=schedule.next_after(fire))
 
-    while True:
-        logger.info(f"Starting scheduled download at {datetime.now()}")
-        run_download()
-        
-        logger.info(f"Sleeping for {interval_seconds}s until next run...")
-        time.sleep(interval_seconds)
+            # Next slot from the schedule, not from when the run ended
+            fire = schedule.next_after(fire)
+            now = datetime.now()
+            if fire <= now:
+                missed = fire
+                fire = schedule.next_after(now)
+                logger.warning(f"⚠️  Run overran; skipped slots from {missed.isoformat(timespec='minutes')}")
+    except KeyboardInterrupt:
+        logger.info("👋 Scheduler stopped")
+    finally:
+        download_okapi.close_page_cache()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
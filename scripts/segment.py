@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Silence-based segmentation of bulletin audio
+Each MP3 is streamed in blocks (see audio_stream.py), frame energies are
+computed with NumPy over a whole block at a time, and utterance boundaries
+come out of a generator, so memory stays flat regardless of file length.
+Files are processed in parallel and the segment offsets are written back
+into the manifest; when a file's segments change, the results that later
+stages keyed by segment index are cleared so they are redone. Recurring
+jingles found by fingerprint.py ("strip_regions" in the manifest) are cut
+out of the segments, so later stages never see them.
+Usage: python segment.py data/raw/okapi/lingala/ --out_dir data/interim/okapi/lingala --batch_mode
+"""
+# filepath: scripts/segment.py
+
+import os, sys, json, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from audio_stream import TARGET_SR, BLOCK_SECONDS
+from audio_cache import DEFAULT_MAX_MB, add_cache_arguments, open_blocks, open_cache
+from okapi_manifest import (
+    MANIFEST_JSON, MANIFEST_JSONL, SEGMENT_FIELDS, find_manifest_dirs, load_manifest, update_entries,
+)
+
+FRAME_SECONDS = 0.02
+
+DEFAULTS = {
+    'threshold_db': -35.0,  # Frames quieter than this (dBFS) count as silence
+    'min_silence': 0.3,     # A pause at least this long ends an utterance
+    'min_speech': 0.5,      # Shorter utterances are dropped
+    'max_speech': 20.0,     # Longer ones are split at their longest pause
+    'pad': 0.1,             # Context kept on each side of an utterance
+}
+
+# Later stages' per-segment results, reset when a file is re-segmented
+STALE_RESULTS = {**{field: None for field in (*SEGMENT_FIELDS, *SEGMENT_FIELDS.values())},
+                 'quality_pass': None, 'needs_transcription': True}
+
+def frame_energies(blocks, sr: int = TARGET_SR, frame_seconds: float = FRAME_SECONDS):
+    """Yield per-frame energy in dBFS for each block of samples
+
+    Frames are non-overlapping; samples left over at the end of a block are
+    carried into the next one so frame boundaries don't depend on blocking.
+    """
+    frame_len = int(sr * frame_seconds)
+    carry = np.zeros(0, dtype=np.float32)
+    for block in blocks:
+        if len(carry):
+            block = np.concatenate((carry, block))
+        n = len(block) // frame_len
+        carry = block[n * frame_len:]
+        if n:
+            frames = block[:n * frame_len].reshape(n, frame_len)
+            yield 10 * np.log10(np.einsum('ij,ij->i', frames, frames) / frame_len + 1e-10)
+    if len(carry):
+        yield 10 * np.log10(np.array([np.mean(carry ** 2)]) + 1e-10)
+
+def find_segments(energies, threshold_db: float = DEFAULTS['threshold_db'],
+                  min_silence: float = DEFAULTS['min_silence'],
+                  min_speech: float = DEFAULTS['min_speech'],
+                  max_speech: float = DEFAULTS['max_speech'],
+                  pad: float = DEFAULTS['pad'],
+                  frame_seconds: float = FRAME_SECONDS):
+    """Yield (start, end) seconds of utterances from a stream of frame energies
+
+    Works on runs of voiced/unvoiced frames found with np.diff per block, so
+    the Python loop is per run, not per frame. Utterances are emitted as
+    soon as the pause after them is long enough.
+    """
+    min_gap = max(1, round(min_silence / frame_seconds))
+    min_len = round(min_speech / frame_seconds)
+    max_len = round(max_speech / frame_seconds)
+    pad_frames = round(pad / frame_seconds)
+
+    start = end = None  # Current utterance in frames, end exclusive
+    pauses = []         # Short pauses inside it, as (gap_start, gap_end)
+    floor = 0           # Earliest frame the next utterance's padding may reach
+    pos = 0
+
+    def emit(a, b):
+        nonlocal floor
+        if b - a >= min_len:
+            lo = max(floor, a - pad_frames)
+            floor = b + pad_frames
+            return (round(lo * frame_seconds, 2), round(floor * frame_seconds, 2))
+        return None
+
+    for db in energies:
+        voiced = db > threshold_db
+        edges = np.flatnonzero(voiced[1:] != voiced[:-1]) + 1
+        run_starts = np.concatenate(([0], edges))
+        run_ends = np.concatenate((edges, [len(voiced)]))
+
+        for a, b in zip(run_starts[voiced[run_starts]] + pos, run_ends[voiced[run_starts]] + pos):
+            a, b = int(a), int(b)
+            if start is None:
+                start, end = a, b
+                continue
+            if a - end >= min_gap:
+                segment = emit(start, end)
+                if segment:
+                    yield segment
+                start, pauses = a, []
+            elif a > end:
+                pauses.append((end, a))
+            end = b
+
+            # Over-long utterance: cut at the longest pause that leaves a
+            # usable first part, or hard-cut at max_len if there is none
+            while end - start > max_len:
+                usable = [p for p in pauses if min_len <= p[0] - start <= max_len]
+                if usable:
+                    cut_end, cut_start = max(usable, key=lambda p: p[1] - p[0])
+                else:
+                    cut_end = cut_start = start + max_len
+                segment = emit(start, cut_end)
+                if segment:
+                    yield segment
+                start = cut_start
+                pauses = [p for p in pauses if p[0] >= cut_start]
+        pos += len(voiced)
+
+    if start is not None:
+        segment = emit(start, end)
+        if segment:
+            lo, hi = segment
+            yield (lo, min(hi, round(pos * frame_seconds, 2)))
+
+def cut_regions(segments: list, regions: list, min_speech: float = DEFAULTS['min_speech']) -> list:
+    """Remove [start, end] regions from segments, dropping pieces shorter than min_speech"""
+    for a, b in sorted(regions or []):
+        kept = []
+        for start, end in segments:
+            for lo, hi in ((start, min(end, a)), (max(start, b), end)):
+                if hi - lo >= min_speech:
+                    kept.append([round(lo, 2), round(hi, 2)])
+        segments = kept
+    return segments
+
+def segment_file(path: str, params: dict, block_seconds: float = BLOCK_SECONDS,
+                 sha256: str = None, cache_root: str = None, cache_mb: float = DEFAULT_MAX_MB,
+                 strip_regions: list = None) -> dict:
+    """Segment one file; returns the fields to merge into its manifest entry"""
+    samples = 0
+
+    def counted(blocks):
+        nonlocal samples
+        for block in blocks:
+            samples += len(block)
+            yield block
+
+    blocks = counted(open_blocks(Path(path), sha256, open_cache(cache_root, cache_mb), block_seconds))
+    segments = [list(s) for s in find_segments(frame_energies(blocks), **params)]
+    segments = cut_regions(segments, strip_regions, params['min_speech'])
+    return {
+        'duration': round(samples / TARGET_SR, 2),
+        'segments': segments,
+        'speech_seconds': round(sum(end - start for start, end in segments), 2),
+        'segment_params': params,
+        'segment_strip_regions': strip_regions or [],
+    }
+
+def find_audio(inputs: list, recursive: bool) -> list:
+    files = []
+    for item in map(Path, inputs):
+        if item.is_dir():
+            found = item.rglob("*.mp3") if recursive else item.glob("*.mp3")
+            files.extend(f for f in found if ".objects" not in f.parts)
+        elif item.suffix == ".mp3":
+            files.append(item)
+    return sorted(set(files))
+
+def find_manifest_dir(files: list):
+    """Nearest directory above the audio holding a manifest"""
+    common = Path(os.path.commonpath([str(f.resolve()) for f in files]))
+    if not common.is_dir():
+        common = common.parent
+    for parent in (common, *common.parents):
+        if (parent / MANIFEST_JSON).exists() or (parent / MANIFEST_JSONL).exists():
+            return parent
+    return None
+
+def manifest_owners(files: list, inputs: list) -> dict:
+    """Map each file to the manifest directory that lists it
+
+    data/raw/okapi holds one manifest per section, found with
+    find_manifest_dirs; the nearest manifest above the inputs covers a
+    section passed directly. The deepest manifest listing a file wins.
+    """
+    candidates = find_manifest_dirs([p for p in map(Path, inputs) if p.is_dir()])
+    nearest = find_manifest_dir(files)
+    if nearest:
+        candidates.append(nearest)
+
+    owners = {}
+    dirs = {d.resolve(): d for d in candidates}
+    for resolved in sorted(dirs, key=lambda d: len(d.parts), reverse=True):
+        listed = load_manifest(resolved)
+        for f in files:
+            if f not in owners and f.name in listed and resolved in f.resolve().parents:
+                owners[f] = dirs[resolved]
+    return owners
+
+def main():
+    parser = argparse.ArgumentParser(description="Silence-based segmentation of bulletin audio")
+    parser.add_argument("inputs", nargs="+", help="MP3 files or directories")
+    parser.add_argument("--out_dir", type=str, help="Also write <name>.segments.json files here")
+    parser.add_argument("--batch_mode", action="store_true", help="Search input directories recursively")
+    parser.add_argument("--manifest-dir", type=str, help="Directory holding manifest.json (default: the section manifest listing each file)")
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--block-seconds", type=float, default=BLOCK_SECONDS, help="Decode block length")
+    parser.add_argument("--threshold-db", type=float, default=DEFAULTS['threshold_db'], help="Silence threshold (dBFS)")
+    parser.add_argument("--min-silence", type=float, default=DEFAULTS['min_silence'], help="Pause that ends an utterance (s)")
+    parser.add_argument("--min-speech", type=float, default=DEFAULTS['min_speech'], help="Shortest utterance kept (s)")
+    parser.add_argument("--max-speech", type=float, default=DEFAULTS['max_speech'], help="Longest utterance before splitting (s)")
+    parser.add_argument("--pad", type=float, default=DEFAULTS['pad'], help="Padding around utterances (s)")
+    parser.add_argument("--force", action="store_true", help="Re-segment files already segmented with these settings")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    params = {key: getattr(args, key) for key in DEFAULTS}
+    files = find_audio(args.inputs, args.batch_mode)
+    if not files:
+        print("❌ No MP3 files found")
+        sys.exit(1)
+
+    if args.manifest_dir:
+        owners = {f: Path(args.manifest_dir) for f in files}
+    else:
+        owners = manifest_owners(files, args.inputs)
+    manifests = {d: load_manifest(d) for d in set(owners.values())}
+    entries = {f: manifests[owners[f]].get(f.name, {}) if f in owners else {} for f in files}
+    if not args.force:
+        # Files are redone when the settings or fingerprint.py's strip regions change
+        files = [f for f in files if entries[f].get('segment_params') != params
+                 or entries[f].get('segment_strip_regions', []) != entries[f].get('strip_regions', [])]
+    print(f"✂️  Segmenting {len(files)} files with {args.workers} workers")
+
+    out_dir = Path(args.out_dir) if args.out_dir else None
+    if out_dir:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    def cache_root(f):
+        # Decoded audio is cached next to the manifest for the later stages
+        return None if args.no_audio_cache or f not in owners else str(owners[f])
+
+    updates, unrecorded, failed = {}, 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(segment_file, str(f), params, args.block_seconds,
+                                   entries[f].get('sha256'), cache_root(f), args.audio_cache_mb,
+                                   entries[f].get('strip_regions')): f
+                   for f in files}
+        for future in as_completed(futures):
+            mp3_file = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {mp3_file.name}: {e}")
+                continue
+            if entries[mp3_file].get('segments') not in (None, result['segments']):
+                result = {**result, **STALE_RESULTS}
+            if mp3_file in owners:
+                updates.setdefault(owners[mp3_file], {})[mp3_file.name] = result
+            else:
+                unrecorded += 1
+            print(f"✅ {mp3_file.name}: {len(result['segments'])} segments, "
+                  f"{result['speech_seconds']:.0f}/{result['duration']:.0f}s speech")
+            if out_dir:
+                with open(out_dir / f"{mp3_file.stem}.segments.json", 'w', encoding='utf-8') as f:
+                    json.dump({'filename': mp3_file.name, **result}, f, indent=2)
+
+    for manifest_dir, dir_updates in updates.items():
+        changed = update_entries(manifest_dir, dir_updates, args.manifest_format)
+        print(f"📋 Updated {changed} manifest entries in {manifest_dir}")
+    if unrecorded:
+        print(f"⚠️  No manifest lists {unrecorded} files; their segment offsets were not recorded "
+              "(use --out_dir or --manifest-dir)")
+
+    segmented = unrecorded + sum(len(u) for u in updates.values())
+    print(f"📊 {segmented} segmented, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Transcode corpus audio into compact 16 kHz mono variants
+Each MP3 is decoded once (through the shared decode cache) and written to
+every requested variant in the same pass:
+  flac  lossless 16-bit FLAC, the training copy
+  opus  Ogg Opus at --opus-kbps, the distribution copy
+Variants go to <manifest dir>/variants/<variant>/ and are recorded in the
+manifest entry's "variants" field (path, size, codec, source SHA-256 and
+encoder settings), so a re-run skips every file whose source and settings
+are unchanged.
+Usage: python transcode.py data/raw/okapi/lingala --variants flac,opus --workers 4
+"""
+# filepath: scripts/transcode.py
+
+import os, sys, time, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import soundfile as sf
+
+import metrics
+from audio_stream import TARGET_SR
+from audio_cache import DEFAULT_MAX_MB, add_cache_arguments, open_blocks, open_cache
+from okapi_dedup import file_sha256
+from okapi_manifest import audio_index, find_manifest_dirs, load_manifest, update_entries
+
+VARIANTS_DIR = "variants"
+TRANSCODE_VERSION = 1  # Bump when the decode/encode pipeline changes
+
+VARIANTS = {
+    'flac': {'format': 'FLAC', 'subtype': 'PCM_16', 'suffix': '.flac', 'codec': 'flac', 'mimetype': 'audio/flac'},
+    'opus': {'format': 'OGG', 'subtype': 'OPUS', 'suffix': '.opus', 'codec': 'opus', 'mimetype': 'audio/ogg'},
+}
+
+def opus_level(kbps: float) -> float:
+    """libsndfile's Opus compression level for a bitrate (0 is 256 kb/s, 1 is 6 kb/s)"""
+    return float(np.clip(1 - (kbps - 6) / 250, 0.0, 1.0))
+
+def variant_settings(variant: str, args: argparse.Namespace) -> dict:
+    """Encoder settings that, with the source hash, decide whether a variant is current"""
+    if variant == 'opus':
+        return {'bitrate_kbps': args.opus_kbps}
+    return {'compression_level': args.flac_level}
+
+def variant_path(manifest_dir: Path, filename: str, variant: str) -> Path:
+    return manifest_dir / VARIANTS_DIR / variant / (Path(filename).stem + VARIANTS[variant]['suffix'])
+
+def is_current(record: dict, sha256: str, settings: dict, path: Path) -> bool:
+    """A variant is reused while its source, settings and file on disk are unchanged"""
+    if not record:
+        return False
+    return (record.get('source_sha256') == sha256 and record.get('settings') == settings
+            and record.get('version') == TRANSCODE_VERSION
+            and path.exists() and path.stat().st_size == record.get('size'))
+
+def transcode_file(path: str, sha256: str, targets: dict, cache_root: str = None,
+                   cache_mb: float = DEFAULT_MAX_MB) -> dict:
+    """Decode path once and encode each {variant: (output path, settings)}
+
+    Outputs are written to temp files and renamed into place, so an
+    interrupted run never leaves a truncated variant behind.
+    """
+    started = time.perf_counter()
+    writers, tmps = {}, {}
+    try:
+        for variant, (out, settings) in targets.items():
+            spec = VARIANTS[variant]
+            out = Path(out)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmps[variant] = out.with_name(f".{out.name}.tmp")
+            level = opus_level(settings['bitrate_kbps']) if variant == 'opus' else settings['compression_level']
+            writers[variant] = sf.SoundFile(tmps[variant], 'w', samplerate=TARGET_SR, channels=1,
+                                            format=spec['format'], subtype=spec['subtype'],
+                                            compression_level=level)
+
+        samples = 0
+        for block in open_blocks(Path(path), sha256, open_cache(cache_root, cache_mb)):
+            # Resampling can overshoot full scale slightly; clip rather than wrap
+            block = np.clip(block, -1.0, 1.0)
+            samples += len(block)
+            for writer in writers.values():
+                writer.write(block)
+        for writer in writers.values():
+            writer.close()
+
+        results = {}
+        for variant, (out, settings) in targets.items():
+            os.replace(tmps[variant], out)
+            spec = VARIANTS[variant]
+            results[variant] = {
+                'size': Path(out).stat().st_size,
+                'codec': spec['codec'],
+                'mimetype': spec['mimetype'],
+                'sample_rate': TARGET_SR,
+                'channels': 1,
+                'duration': round(samples / TARGET_SR, 3),
+                'settings': settings,
+                'source_sha256': sha256,
+                'version': TRANSCODE_VERSION,
+            }
+        return {'variants': results, 'seconds': time.perf_counter() - started}
+    finally:
+        for writer in writers.values():
+            if not writer.closed:
+                writer.close()
+        for tmp in tmps.values():
+            if tmp.exists():
+                tmp.unlink()
+
+def transcode_dir(manifest_dir: Path, variants: list, args: argparse.Namespace) -> int:
+    """Bring one manifest directory's variants up to date; returns the failure count"""
+    entries = load_manifest(manifest_dir)
+    paths = audio_index(manifest_dir)
+    settings = {v: variant_settings(v, args) for v in variants}
+
+    jobs, source_bytes = {}, 0
+    for filename, entry in entries.items():
+        # Duplicates share their canonical entry's content, and its variants
+        if entry.get('duplicate_of') or filename not in paths:
+            continue
+        sha = entry.get('sha256') or file_sha256(paths[filename])
+        current = entry.get('variants', {})
+        targets = {}
+        for v in variants:
+            out = variant_path(manifest_dir, filename, v)
+            if args.force or not is_current(current.get(v), sha, settings[v], out):
+                targets[v] = (str(out), settings[v])
+        if targets:
+            jobs[filename] = (sha, targets)
+            source_bytes += paths[filename].stat().st_size
+
+    print(f"🎛️  {manifest_dir}: {len(entries)} files, {len(jobs)} to transcode "
+          f"({source_bytes / 1024 / 1024:.1f} MB of MP3) → {', '.join(variants)}")
+    if not jobs:
+        return 0
+
+    updates, failed = {}, 0
+    cache_root = None if args.no_audio_cache else str(manifest_dir)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(transcode_file, str(paths[f]), sha, targets, cache_root, args.audio_cache_mb): f
+                   for f, (sha, targets) in jobs.items()}
+        for future in as_completed(futures):
+            filename = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                metrics.inc('items_total', stage='transcode', result='failed')
+                print(f"❌ {filename}: {e}")
+                continue
+            metrics.observe('transcode_seconds', result['seconds'])
+            metrics.inc('items_total', stage='transcode', result='transcoded')
+            records = {**entries[filename].get('variants', {})}
+            for v, record in result['variants'].items():
+                path = variant_path(manifest_dir, filename, v)
+                records[v] = {'path': str(path.relative_to(manifest_dir)), **record}
+                metrics.inc('variant_bytes_total', record['size'], variant=v)
+            updates[filename] = {'variants': records}
+            sizes = ', '.join(f"{v} {r['size'] / 1024 / 1024:.1f} MB" for v, r in result['variants'].items())
+            print(f"✅ {filename}: {sizes}")
+
+    # Corpus-wide footprint of each variant next to the MP3s it replaces
+    changed = update_entries(manifest_dir, updates, args.manifest_format)
+    entries = load_manifest(manifest_dir)
+    mp3_bytes = sum(e.get('file_size') or 0 for e in entries.values() if not e.get('duplicate_of'))
+    print(f"📋 Updated {changed} manifest entries")
+    for v in variants:
+        total = sum(e.get('variants', {}).get(v, {}).get('size', 0) for e in entries.values())
+        ratio = f" ({total / mp3_bytes:.0%} of MP3)" if mp3_bytes else ""
+        print(f"   • {v}: {total / 1024 / 1024:.1f} MB{ratio}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcode corpus audio to 16 kHz mono FLAC/Opus variants")
+    parser.add_argument("manifest_dirs", nargs="*", default=["data/raw/okapi"],
+                        help="Directories with manifest.json (or their parent, e.g. data/raw/okapi)")
+    parser.add_argument("--variants", default="flac,opus", help=f"Comma-separated variants ({', '.join(VARIANTS)})")
+    parser.add_argument("--opus-kbps", type=float, default=24.0, help="Opus bitrate (speech is clear from ~16 kb/s)")
+    parser.add_argument("--flac-level", type=float, default=1.0, help="FLAC compression level, 0 (fast) to 1 (small)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--force", action="store_true", help="Re-encode even when the variant is current")
+    add_cache_arguments(parser)
+    parser.add_argument("--manifest-format", choices=["json", "jsonl", "both"], default="json", help="Manifest format")
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args)
+
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown or not variants:
+        parser.error(f"Unknown variant(s) {', '.join(unknown)}; choose from {', '.join(VARIANTS)}")
+
+    manifest_dirs = find_manifest_dirs(args.manifest_dirs)
+    if not manifest_dirs:
+        print("❌ No manifest found; run download_okapi.py or okapi_manifest.py first")
+        sys.exit(1)
+
+    failed = 0
+    for manifest_dir in manifest_dirs:
+        with metrics.stage('transcode'):
+            failed += transcode_dir(manifest_dir, variants, args)
+    metrics.export_from_args(args)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,93 @@
 import os
 import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
 
+import metrics
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+CHUNK_SIZE = 8 * 1024 * 1024  # Resumable upload chunk (multiple of 256 KiB)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 5
+
+def with_retries(func, attempts=MAX_ATTEMPTS, what="request"):
+    """Call func(), retrying transient Drive/network errors with jittered backoff"""
+    for attempt in range(attempts):
+        try:
+            return func()
+        except HttpError as e:
+            status = getattr(e.resp, 'status', None)
+            if status not in RETRY_STATUSES and not (status == 403 and 'rateLimitExceeded' in str(e)):
+                raise
+            error = e
+        except (ConnectionError, TimeoutError, OSError) as e:
+            error = e
+        if attempt + 1 == attempts:
+            raise error
+        delay = min(2 ** attempt, 32) + random.uniform(0, 1)
+        metrics.inc('retries_total', kind='drive')
+        print(f"🔁 Retrying {what} in {delay:.1f}s ({error})")
+        time.sleep(delay)
+
 def get_or_create_folder(service, folder_name, parent_id=None):
     """Get folder ID or create if it doesn't exist"""
-    query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder'"
+    query = f"name='{folder_name}' and mimeType='{FOLDER_MIME}' and trashed=false"
     if parent_id:
         query += f" and '{parent_id}' in parents"
-    
-    results = service.files().list(q=query).execute()
+
+    results = with_retries(lambda: service.files().list(q=query, fields='files(id)').execute())
     items = results.get('files', [])
-    
+
     if items:
         return items[0]['id']
     else:
         # Create folder
         folder_metadata = {
             'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder'
+            'mimeType': FOLDER_MIME
         }
         if parent_id:
             folder_metadata['parents'] = [parent_id]
-            
-        folder = service.files().create(body=folder_metadata, fields='id').execute()
+
+        folder = with_retries(lambda: service.files().create(body=folder_metadata, fields='id').execute())
         return folder.get('id')
 
-def file_exists_in_drive(service, filename, parent_id):
-    """Check if file already exists in Drive"""
-    query = f"name='{filename}' and '{parent_id}' in parents and trashed=false"
-    results = service.files().list(q=query).execute()
-    return len(results.get('files', [])) > 0
+def list_folder(service, folder_id):
+    """Index a folder's files by name in one paginated listing
 
+    Replaces a files().list round trip per file with one per 1000 files.
+    """
+    index = {}
+    page_token = None
+    while True:
+        with metrics.timer('request_seconds', kind='drive_list'):
+            results = with_retries(lambda: service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false and mimeType!='{FOLDER_MIME}'",
+                fields='nextPageToken, files(id, name, md5Checksum, size)',
+                pageSize=1000,
+                pageToken=page_token,
+            ).execute(), what="folder listing")
+        for item in results.get('files', []):
+            index.setdefault(item['name'], item)
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return index
 
+def file_md5(path):
+    """MD5 of a local file, comparable to Drive's md5Checksum"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
 
 def share_folder_with_user(service, folder_id, user_email):
     """Share folder with a specific user"""
@@ -53,140 +106,210 @@ def share_folder_with_user(service, folder_id, user_email):
     except Exception as e:
         print(f"⚠️  Could not share folder: {e}")
 
-def upload_to_gdrive():
+def upload_file(service, file_path, folder_id, existing, mimetype):
+    """Create, update or skip one file; returns 'uploaded', 'updated' or 'skipped'
+
+    existing is the folder index entry for this name (or None). Files whose
+    MD5 matches Drive's are skipped; changed ones are updated in place.
+    """
+    filename = os.path.basename(file_path)
+    if existing and existing.get('md5Checksum') == file_md5(file_path):
+        return 'skipped'
+
+    # Audio goes up in resumable chunks so a dropped connection only costs one chunk
+    resumable = mimetype.startswith('audio/')
+    media = MediaFileUpload(file_path, mimetype=mimetype, resumable=resumable,
+                            chunksize=CHUNK_SIZE if resumable else -1)
+    if existing:
+        request = service.files().update(fileId=existing['id'], media_body=media, fields='id')
+    else:
+        request = service.files().create(
+            body={'name': filename, 'parents': [folder_id]}, media_body=media, fields='id')
+
+    if resumable:
+        response = None
+        while response is None:
+            # The request object remembers the session URI, so a retry resumes
+            _, response = with_retries(lambda: request.next_chunk(), what=filename)
+    else:
+        with_retries(request.execute, what=filename)
+
+    return 'updated' if existing else 'uploaded'
+
+def load_credentials():
+    """Service-account credentials from the GOOGLE_SERVICE_ACCOUNT env var"""
+    credentials_json = os.environ.get('GOOGLE_SERVICE_ACCOUNT')
+    if not credentials_json:
+        raise ValueError("GOOGLE_SERVICE_ACCOUNT environment variable not set")
+
+    # Parse JSON and create credentials
     try:
-        # Load credentials from JSON string
-        credentials_json = os.environ.get('GOOGLE_SERVICE_ACCOUNT')
-        if not credentials_json:
-            raise ValueError("GOOGLE_SERVICE_ACCOUNT environment variable not set")
-        
-        # Parse JSON and create credentials
-        try:
-            credentials_info = json.loads(credentials_json)
-        except json.JSONDecodeError as e:
-            print(f"❌ Invalid JSON in credentials: {e}")
-            print(f"First 100 chars of credentials: {credentials_json[:100]}")
-            raise
-        
-        credentials = service_account.Credentials.from_service_account_info(
-            credentials_info,
-            scopes=['https://www.googleapis.com/auth/drive.file']
-        )
-        
-        service = build('drive', 'v3', credentials=credentials)
-        
+        credentials_info = json.loads(credentials_json)
+    except json.JSONDecodeError as e:
+        print(f"❌ Invalid JSON in credentials: {e}")
+        print(f"First 100 chars of credentials: {credentials_json[:100]}")
+        raise
+
+    return service_account.Credentials.from_service_account_info(
+        credentials_info,
+        scopes=['https://www.googleapis.com/auth/drive.file']
+    )
+
+def thread_local_services(credentials):
+    """Return get_service() giving each worker thread its own Drive client
+
+    The underlying httplib2 connection is not thread-safe.
+    """
+    local = threading.local()
+
+    def get_service():
+        if not hasattr(local, 'service'):
+            local.service = build('drive', 'v3', credentials=credentials, cache_discovery=False)
+        return local.service
+
+    return get_service
+
+def manifest_entries(audio_dir):
+    """Entries of audio_dir's manifest.json (empty without one)"""
+    manifest_path = os.path.join(audio_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def duplicate_files(audio_dir):
+    """Filenames the manifest marks as duplicate_of another episode"""
+    return {entry['filename'] for entry in manifest_entries(audio_dir) if entry.get('duplicate_of')}
+
+def variant_files(audio_dir, variant):
+    """(path, mimetype) of each transcoded file the manifest records for a variant
+
+    Only variants written by transcode.py are listed, so a file whose
+    transcode failed or went stale is left out rather than half-synced.
+    """
+    files = []
+    for entry in manifest_entries(audio_dir):
+        record = entry.get('variants', {}).get(variant)
+        if entry.get('duplicate_of') or not record:
+            continue
+        path = os.path.join(audio_dir, record['path'])
+        if os.path.exists(path) and os.path.getsize(path) == record['size']:
+            files.append((path, record['mimetype']))
+    return sorted(files)
+
+def timed_upload(get_service, file_path, *job):
+    """upload_file with latency and bytes recorded for transfers that happened"""
+    started = time.perf_counter()
+    result = upload_file(get_service(), file_path, *job)
+    if result != 'skipped':
+        metrics.observe('request_seconds', time.perf_counter() - started, kind='upload')
+        metrics.inc('bytes_total', os.path.getsize(file_path), direction='up')
+    return result
+
+def sync_files(get_service, jobs, workers):
+    """Upload (path, folder_id, existing, mimetype) jobs in parallel; returns counts"""
+    counts = {'uploaded': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+    icons = {'uploaded': '✅ Uploaded', 'updated': '🔄 Updated', 'skipped': '⏭️  Skipping'}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # get_service() runs inside the worker so each thread uses its own client
+        futures = {executor.submit(timed_upload, get_service, *job): job[0] for job in jobs}
+        metrics.set_gauge('queue_depth', len(futures), queue='uploads')
+        for done, future in enumerate(as_completed(futures), 1):
+            file_path = futures[future]
+            metrics.set_gauge('queue_depth', len(futures) - done, queue='uploads')
+            try:
+                result = future.result()
+                counts[result] += 1
+                print(f"{icons[result]}: {os.path.basename(file_path)}")
+            except Exception as e:
+                result = 'failed'
+                counts['failed'] += 1
+                print(f"❌ Upload failed for {os.path.basename(file_path)}: {e}")
+            metrics.inc('items_total', stage='upload', result=result)
+    return counts
+
+def upload_to_gdrive(audio_dir='data/raw/okapi', workers=4, get_service=None, variant='mp3', subfolder=None):
+    """Sync audio, metadata and manifest; variant picks the MP3s or one transcoded copy
+
+    subfolder puts them under lingala-stt/<subfolder>/ so each section keeps
+    its own manifest.json instead of overwriting the others'.
+    """
+    try:
+        if get_service is None:
+            get_service = thread_local_services(load_credentials())
+        service = get_service()
+
         # Create main folder structure
         main_folder_id = get_or_create_folder(service, 'lingala-stt')
-        audio_folder_id = get_or_create_folder(service, 'audio', main_folder_id)
-        metadata_folder_id = get_or_create_folder(service, 'metadata', main_folder_id)
-        
+        sync_folder_id = get_or_create_folder(service, subfolder, main_folder_id) if subfolder else main_folder_id
+        # Transcoded copies get their own folder (audio_flac, audio_opus) next to the MP3s
+        audio_folder_name = 'audio' if variant == 'mp3' else f'audio_{variant}'
+        audio_folder_id = get_or_create_folder(service, audio_folder_name, sync_folder_id)
+        metadata_folder_id = get_or_create_folder(service, 'metadata', sync_folder_id)
+
         # Share the main folder with your personal email
         personal_email = os.environ.get('PERSONAL_EMAIL')
         if personal_email:
             share_folder_with_user(service, main_folder_id, personal_email)
-            
-        uploaded_count = 0
-        skipped_count = 0
-        
+
         print("📤 Starting upload to Google Drive...")
-        
-        # Upload audio files
-        audio_dir = 'data/raw/okapi'
-        if os.path.exists(audio_dir):
-            for filename in os.listdir(audio_dir):
-                if filename.endswith('.mp3'):
-                    file_path = os.path.join(audio_dir, filename)
-                    
-                    # Check if file already exists
-                    if file_exists_in_drive(service, filename, audio_folder_id):
-                        print(f"⏭️  Skipping {filename} (already exists)")
-                        skipped_count += 1
-                        continue
-                    
-                    # Upload file
-                    media = MediaFileUpload(file_path, mimetype='audio/mpeg')
-                    file_metadata = {
-                        'name': filename,
-                        'parents': [audio_folder_id]
-                    }
-                    
-                    service.files().create(
-                        body=file_metadata,
-                        media_body=media,
-                        fields='id'
-                    ).execute()
-                    
-                    print(f"✅ Uploaded: {filename}")
-                    uploaded_count += 1
-        
-        # Upload metadata files
-        metadata_dir = 'data/raw/okapi/metadata'
+
+        # One listing per folder instead of one query per file
+        with metrics.stage('list'):
+            audio_index = list_folder(service, audio_folder_id)
+            metadata_index = list_folder(service, metadata_folder_id)
+            main_index = list_folder(service, sync_folder_id)
+        print(f"📇 Drive has {len(audio_index)} audio and {len(metadata_index)} metadata files")
+
+        jobs = []
+        duplicates = duplicate_files(audio_dir)
+
+        # Audio files (duplicate content is already uploaded under its canonical name)
+        if variant != 'mp3':
+            for path, mimetype in variant_files(audio_dir, variant):
+                jobs.append((path, audio_folder_id, audio_index.get(os.path.basename(path)), mimetype))
+        elif os.path.exists(audio_dir):
+            for filename in sorted(os.listdir(audio_dir)):
+                if filename.endswith('.mp3') and filename not in duplicates:
+                    jobs.append((os.path.join(audio_dir, filename), audio_folder_id,
+                                 audio_index.get(filename), 'audio/mpeg'))
+
+        # Metadata files
+        metadata_dir = os.path.join(audio_dir, 'metadata')
         if os.path.exists(metadata_dir):
-            for filename in os.listdir(metadata_dir):
+            for filename in sorted(os.listdir(metadata_dir)):
                 if filename.endswith('.json'):
-                    file_path = os.path.join(metadata_dir, filename)
-                    
-                    # Check if file already exists
-                    if file_exists_in_drive(service, filename, metadata_folder_id):
-                        print(f"⏭️  Skipping {filename} (already exists)")
-                        skipped_count += 1
-                        continue
-                    
-                    # Upload file
-                    media = MediaFileUpload(file_path, mimetype='application/json')
-                    file_metadata = {
-                        'name': filename,
-                        'parents': [metadata_folder_id]
-                    }
-                    
-                    service.files().create(
-                        body=file_metadata,
-                        media_body=media,
-                        fields='id'
-                    ).execute()
-                    
-                    print(f"✅ Uploaded metadata: {filename}")
-                    uploaded_count += 1
-        
-        # Upload manifest file
-        manifest_path = 'manifest.json'
+                    jobs.append((os.path.join(metadata_dir, filename), metadata_folder_id,
+                                 metadata_index.get(filename), 'application/json'))
+
+        # Manifest file
+        manifest_path = os.path.join(audio_dir, 'manifest.json')
         if os.path.exists(manifest_path):
-            if not file_exists_in_drive(service, 'manifest.json', main_folder_id):
-                media = MediaFileUpload(manifest_path, mimetype='application/json')
-                file_metadata = {
-                    'name': 'manifest.json',
-                    'parents': [main_folder_id]
-                }
-                
-                service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
-                
-                print("✅ Uploaded manifest.json")
-                uploaded_count += 1
-            else:
-                # Update existing manifest
-                query = f"name='manifest.json' and '{main_folder_id}' in parents"
-                results = service.files().list(q=query).execute()
-                if results.get('files'):
-                    file_id = results['files'][0]['id']
-                    media = MediaFileUpload(manifest_path, mimetype='application/json')
-                    service.files().update(fileId=file_id, media_body=media).execute()
-                    print("🔄 Updated manifest.json")
-        
+            jobs.append((manifest_path, sync_folder_id, main_index.get('manifest.json'), 'application/json'))
+
+        with metrics.stage('upload'):
+            counts = sync_files(get_service, jobs, workers)
+
         print(f"\n📊 Upload Summary:")
-        print(f"   • New files uploaded: {uploaded_count}")
-        print(f"   • Files skipped: {skipped_count}")
-        print(f"   • Google Drive folder: https://drive.google.com/drive/folders/{main_folder_id}")
-        
+        print(f"   • New files uploaded: {counts['uploaded']}")
+        print(f"   • Files updated: {counts['updated']}")
+        print(f"   • Files skipped: {counts['skipped']} (+{len(duplicates)} duplicates)")
+        print(f"   • Failed: {counts['failed']}")
+        print(f"   • Google Drive folder: https://drive.google.com/drive/folders/{sync_folder_id}")
+
         # Create summary for GitHub Actions
         with open('upload_summary.txt', 'w') as f:
-            f.write(f"uploaded={uploaded_count}\n")
-            f.write(f"skipped={skipped_count}\n")
+            f.write(f"uploaded={counts['uploaded']}\n")
+            f.write(f"updated={counts['updated']}\n")
+            f.write(f"skipped={counts['skipped']}\n")
+            f.write(f"failed={counts['failed']}\n")
+            f.write(f"seconds={metrics.REGISTRY.stages['upload']['seconds']}\n")
             f.write(f"folder_id={main_folder_id}\n")
-        
+
+        if counts['failed']:
+            raise RuntimeError(f"{counts['failed']} uploads failed")
+
     except HttpError as error:
         print(f"❌ An error occurred: {error}")
         raise
@@ -195,4 +318,16 @@ def upload_to_gdrive():
         raise
 
 if __name__ == '__main__':
-    upload_to_gdrive()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sync the corpus to Google Drive")
+    parser.add_argument("--audio-dir", default="data/raw/okapi", help="Directory with MP3s, metadata/ and manifest.json")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel uploads")
+    parser.add_argument("--variant", choices=["mp3", "flac", "opus"], default="mp3",
+                        help="Audio to sync: the original MP3s or a copy made by transcode.py")
+    parser.add_argument("--drive-subfolder", help="Sync into lingala-stt/<name>/ (one per section, e.g. kikongo)")
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+    metrics.configure_from_args(args)
+    try:
+        upload_to_gdrive(args.audio_dir, args.workers, variant=args.variant, subfolder=args.drive_subfolder)
+    finally:
+        metrics.export_from_args(args)
@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Local review UI for segments and transcripts
+Segments are listed through a paginated query API backed by in-memory
+indexes (built once from the manifests, rebuilt only when a manifest or
+the transcripts change). Audio is served per segment as a WAV view of the
+decoded cache, with HTTP Range support, so nothing is cut to disk and
+playback starts at once. Waveforms are drawn from peaks precomputed in the
+cache. Edits are buffered in the browser and saved in batches to an
+append-only reviews JSONL.
+Usage: python validate_ui.py data/raw/okapi --port 8765
+       python audio_cache.py data/raw/okapi/lingala --warm --peaks   (precompute peaks)
+"""
+# filepath: scripts/validate_ui.py
+
+import os, re, sys, json, struct, argparse, threading
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs, unquote, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from audio_stream import TARGET_SR
+from audio_cache import PEAKS_PER_SECOND, add_cache_arguments, open_cache, slice_seconds
+from export_shards import load_transcripts
+from align_whisper import DEFAULT_OUT as DEFAULT_TRANSCRIPTS, current_transcript
+from okapi_manifest import (
+    MANIFEST_JSON, MANIFEST_JSONL, audio_index, find_manifest_dirs, load_manifest, segment_field,
+)
+
+DEFAULT_REVIEWS = "data/interim/okapi/reviews.jsonl"
+STATUSES = ('unreviewed', 'ok', 'fix', 'reject')
+MAX_PER_PAGE = 200
+CHUNK = 256 * 1024
+
+def wav_header(n_samples: int, sr: int = TARGET_SR) -> bytes:
+    """44-byte header of a 16-bit mono PCM WAV"""
+    data = n_samples * 2
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data, b'WAVE', b'fmt ', 16, 1, 1,
+                       sr, sr * 2, 2, 16, b'data', data)
+
+def parse_range(header: str, size: int):
+    """(start, end inclusive) of a single-range Range header, None if absent, False if unsatisfiable"""
+    match = re.match(r"bytes=(\d*)-(\d*)$", header or "")
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:  # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    return (start, end) if start <= end and start < size else False
+
+class ReviewLog:
+    """Append-only JSONL of reviewer edits; later records win
+
+    Records carry the segment's bounds, so an edit made before the file was
+    re-segmented neither merges with nor shows up on the new segment.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+
+    def load(self) -> dict:
+        reviews = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from a crash
+                    previous = reviews.get(record['id'], {})
+                    if [previous.get('start'), previous.get('end')] != [record.get('start'), record.get('end')]:
+                        previous = {}
+                    reviews[record['id']] = {**previous, **record}
+        return reviews
+
+    def append(self, records: list):
+        """One write and fsync per batch"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+class SegmentIndex:
+    """All segments of the corpus with lookup indexes for the query API"""
+
+    FACETS = ('language', 'dialect', 'status', 'quality', 'transcribed')
+
+    def __init__(self, manifest_dirs: list, transcripts_path: Path, reviews: ReviewLog):
+        self.manifest_dirs = manifest_dirs
+        self.transcripts_path = Path(transcripts_path)
+        self.reviews = reviews
+        self.lock = threading.RLock()
+        self.version = None
+        self.refresh()
+
+    def _sources(self) -> tuple:
+        """mtimes of everything the index is built from"""
+        stamps = []
+        for path in [*(d / name for d in self.manifest_dirs for name in (MANIFEST_JSON, MANIFEST_JSONL)),
+                     self.transcripts_path]:
+            try:
+                stamps.append(path.stat().st_mtime_ns)
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def refresh(self):
+        """Rebuild only if a manifest or the transcripts changed"""
+        version = self._sources()
+        if version == self.version:
+            return
+        with self.lock:
+            transcripts = load_transcripts(self.transcripts_path)
+            reviews = self.reviews.load()
+            rows, files = [], {}
+            for d, manifest_dir in enumerate(self.manifest_dirs):
+                paths = audio_index(manifest_dir)
+                for filename, entry in sorted(load_manifest(manifest_dir).items()):
+                    if filename not in paths or entry.get('duplicate_of'):
+                        continue
+                    files[(d, filename)] = (paths[filename], entry.get('sha256'))
+                    # Results from before a re-segmentation are left out, not misattributed
+                    segments = entry.get('segments') or []
+                    kept = segment_field(entry, 'segments_kept')
+                    kept = set(range(len(segments)) if kept is None else kept)
+                    labels = segment_field(entry, 'dialect_labels') or []
+                    for i, (start, end) in enumerate(segments):
+                        row_id = f"{d}:{filename}:{i}"
+                        transcript = current_transcript(transcripts.get((filename, i)), [start, end]) or {}
+                        review = reviews.get(row_id, {})
+                        if 'start' in review and [review['start'], review['end']] != [start, end]:
+                            review = {}
+                        rows.append({
+                            'id': row_id, 'dir': d, 'filename': filename, 'segment': i,
+                            'start': start, 'end': end, 'duration': round(end - start, 2),
+                            'language': entry.get('language'),
+                            'dialect': labels[i][0] if i < len(labels) else None,
+                            'quality': 'pass' if i in kept and entry.get('quality_pass') is not False else 'fail',
+                            'transcribed': 'yes' if transcript.get('text') else 'no',
+                            'asr_text': transcript.get('text'),
+                            'text': review.get('text', transcript.get('text')),
+                            'status': review.get('status', 'unreviewed'),
+                            'date': entry.get('date'),
+                        })
+            self.rows, self.files = rows, files
+            self.positions = {row['id']: pos for pos, row in enumerate(rows)}
+            self.indexes = {facet: {} for facet in self.FACETS}
+            for pos, row in enumerate(rows):
+                for facet in self.FACETS:
+                    self.indexes[facet].setdefault(row[facet], set()).add(pos)
+            self.by_file = {}
+            for pos, row in enumerate(rows):
+                self.by_file.setdefault(row['filename'], []).append(pos)
+            self.version = version
+
+    def query(self, params: dict) -> dict:
+        page = max(1, int(params.get('page', 1)))
+        per_page = min(MAX_PER_PAGE, max(1, int(params.get('per_page', 25))))
+        with self.lock:
+            candidates = None
+            # Intersect the smallest index sets first
+            sets = [self.indexes[f].get(params[f], set()) for f in self.FACETS if params.get(f)]
+            if params.get('file'):
+                sets.append(set(self.by_file.get(params['file'], [])))
+            for s in sorted(sets, key=len):
+                candidates = s if candidates is None else candidates & s
+            positions = range(len(self.rows)) if candidates is None else sorted(candidates)
+            text = (params.get('q') or "").lower()
+            if text:
+                positions = [p for p in positions if text in (self.rows[p]['text'] or "").lower()]
+            total = len(positions)
+            items = [self.rows[p] for p in positions[(page - 1) * per_page:page * per_page]]
+            facets = {f: {str(k): len(v) for k, v in self.indexes[f].items()} for f in self.FACETS}
+        return {'total': total, 'page': page, 'per_page': per_page, 'items': items, 'facets': facets}
+
+    def apply_edits(self, edits: list) -> int:
+        """Validate, log and index a batch of edits; returns how many were applied"""
+        records, now = [], datetime.now().isoformat(timespec='seconds')
+        with self.lock:
+            for edit in edits:
+                pos = self.positions.get(edit.get('id'))
+                if pos is None:
+                    continue
+                row = self.rows[pos]
+                record = {'id': edit['id'], 'filename': row['filename'], 'segment': row['segment'],
+                          'start': row['start'], 'end': row['end'], 'edited_at': now}
+                if isinstance(edit.get('text'), str):
+                    record['text'] = edit['text']
+                if edit.get('status') in STATUSES:
+                    record['status'] = edit['status']
+                if edit.get('reviewer'):
+                    record['reviewer'] = str(edit['reviewer'])[:64]
+                records.append(record)
+            if records:
+                self.reviews.append(records)
+            for record in records:
+                pos = self.positions[record['id']]
+                row = self.rows[pos]
+                if 'status' in record and record['status'] != row['status']:
+                    self.indexes['status'][row['status']].discard(pos)
+                    self.indexes['status'].setdefault(record['status'], set()).add(pos)
+                    row['status'] = record['status']
+                if 'text' in record:
+                    row['text'] = record['text']
+        return len(records)
+
+def make_handler(index: SegmentIndex, cache_for, page_html: bytes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, data, status: int = 200):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-store')
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def send_ranged(self, size: int, read, content_type: str):
+            """Serve `size` bytes produced by read(start, end) honouring a Range header"""
+            byte_range = parse_range(self.headers.get('Range'), size)
+            if byte_range is False:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start, end = byte_range or (0, size - 1)
+            self.send_response(206 if byte_range else 200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Cache-Control', 'max-age=86400')
+            if byte_range:
+                self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+            self.end_headers()
+            if self.command == 'HEAD':
+                return
+            try:
+                for offset in range(start, end + 1, CHUNK):
+                    self.wfile.write(read(offset, min(end, offset + CHUNK - 1)))
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  # Browsers drop media requests when seeking
+
+        def row_for(self, d: str, filename: str):
+            """(path, sha256) of a file in the index, or (None, None)"""
+            return index.files.get((int(d), unquote(filename)), (None, None))
+
+        def audio_url(self, row: dict) -> str:
+            name = quote(row['filename'])
+            if cache_for(row['dir']) is not None:
+                return f"/audio/{row['dir']}/{name}/{row['segment']}.wav"
+            # No decode cache: the browser range-requests the MP3 and plays the fragment
+            return f"/source/{row['dir']}/{name}#t={row['start']},{row['end']}"
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [p for p in url.path.split('/') if p]
+            try:
+                if not parts:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(page_html)))
+                    self.end_headers()
+                    if self.command != 'HEAD':
+                        self.wfile.write(page_html)
+                elif parts == ['api', 'segments']:
+                    index.refresh()
+                    result = index.query({k: v[0] for k, v in parse_qs(url.query).items()})
+                    result['items'] = [{**row, 'audio_url': self.audio_url(row)} for row in result['items']]
+                    self.send_json(result)
+                elif parts[:2] == ['api', 'peaks'] and len(parts) == 4:
+                    self.serve_peaks(parts[2], parts[3], parse_qs(url.query))
+                elif parts[0] == 'audio' and len(parts) == 4:
+                    self.serve_segment(parts[1], parts[2], parts[3])
+                elif parts[0] == 'source' and len(parts) == 3:
+                    self.serve_source(parts[1], parts[2])
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+            except (ValueError, KeyError) as e:
+                self.send_json({'error': str(e)}, 400)
+
+        def do_POST(self):
+            if urlsplit(self.path).path != '/api/edits':
+                return self.send_json({'error': 'not found'}, 404)
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                edits = json.loads(self.rfile.read(length) or b"[]")
+                if not isinstance(edits, list):
+                    raise ValueError("expected a list of edits")
+            except ValueError as e:
+                return self.send_json({'error': str(e)}, 400)
+            self.send_json({'saved': index.apply_edits(edits)})
+
+        def serve_segment(self, d: str, filename: str, segment: str):
+            """Segment as a WAV view of the cached PCM (/audio/<dir>/<file>/<segment>.wav)"""
+            path, sha256 = self.row_for(d, filename)
+            cache = cache_for(int(d))
+            if path is None or cache is None:
+                return self.send_json({'error': 'no cached audio'}, 404)
+            row = index.rows[index.positions[f"{int(d)}:{unquote(filename)}:{int(segment.split('.')[0])}"]]
+            pcm = slice_seconds(cache.pcm(path, sha256), row['start'], row['end'])
+            header = wav_header(len(pcm))
+            data = pcm.view(np.uint8)  # Still a view into the mapped file
+
+            def read(start, end):
+                head = header[start:end + 1] if start < len(header) else b""
+                lo, hi = max(0, start - len(header)), end + 1 - len(header)
+                return head + (data[lo:hi].tobytes() if hi > lo else b"")
+
+            self.send_ranged(len(header) + len(data), read, 'audio/wav')
+
+        def serve_source(self, d: str, filename: str):
+            """The original MP3, for playback without a decode cache (/source/<dir>/<file>)"""
+            path, _ = self.row_for(d, filename)
+            if path is None:
+                return self.send_json({'error': 'not found'}, 404)
+            with open(path, 'rb') as f:
+                def read(start, end):
+                    f.seek(start)
+                    return f.read(end - start + 1)
+                self.send_ranged(path.stat().st_size, read, 'audio/mpeg')
+
+        def serve_peaks(self, d: str, filename: str, query: dict):
+            """min/max waveform bins for [start, end) seconds of a file"""
+            path, sha256 = self.row_for(d, filename)
+            cache = cache_for(int(d))
+            if path is None or cache is None:
+                return self.send_json({'error': 'no cached audio'}, 404)
+            peaks = slice_seconds(cache.peaks(path, sha256), float(query.get('start', ['0'])[0]),
+                                  float(query.get('end', ['1e9'])[0]), PEAKS_PER_SECOND)
+            body = json.dumps({'peaks_per_second': PEAKS_PER_SECOND,
+                               'min': peaks[:, 0].tolist(), 'max': peaks[:, 1].tolist()}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'max-age=86400')
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+    return Handler
+
+PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Segment review</title>
+<style>
+body{font-family:sans-serif;margin:1em 2em;background:#fafafa}
+#filters *{margin-right:.5em}.seg{background:#fff;border:1px solid #ddd;margin:.5em 0;padding:.5em}
+.seg.ok{border-left:6px solid #3a3}.seg.fix{border-left:6px solid #e90}.seg.reject{border-left:6px solid #c33}
+.meta{color:#666;font-size:.85em}canvas{width:100%;height:48px;background:#f4f4f4;cursor:pointer}
+textarea{width:100%;font-size:1em}.asr{color:#999;font-size:.8em}#saved{float:right;color:#666}
+</style></head><body>
+<div id="filters">
+ <select id="status"><option value="">any status</option><option>unreviewed</option><option>ok</option><option>fix</option><option>reject</option></select>
+ <select id="language"><option value="">any language</option></select>
+ <select id="quality"><option value="">any quality</option><option>pass</option><option>fail</option></select>
+ <input id="q" placeholder="search text"> <button id="go">Filter</button>
+ <button id="prev">&larr;</button><span id="pageinfo"></span><button id="next">&rarr;</button>
+ <span id="saved"></span>
+</div>
+<div id="list"></div>
+<script>
+const pending = new Map(); let page = 1, total = 0, perPage = 25;
+const $ = id => document.getElementById(id);
+function edit(id, field, value) {
+  pending.set(id, Object.assign(pending.get(id) || {id}, {[field]: value}));
+  $('saved').textContent = pending.size + ' unsaved';
+}
+async function flush() {
+  if (!pending.size) return;
+  const batch = [...pending.values()]; pending.clear();
+  try {
+    const r = await fetch('/api/edits', {method: 'POST', body: JSON.stringify(batch)});
+    $('saved').textContent = 'saved ' + (await r.json()).saved + ' at ' + new Date().toLocaleTimeString();
+  } catch (e) { batch.forEach(b => pending.set(b.id, Object.assign(b, pending.get(b.id) || {}))); }
+}
+setInterval(flush, 2000);
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'hidden' && pending.size) {
+    navigator.sendBeacon('/api/edits', JSON.stringify([...pending.values()])); pending.clear();
+  }
+});
+async function draw(canvas, row) {
+  const r = await fetch(`/api/peaks/${row.dir}/${encodeURIComponent(row.filename)}?start=${row.start}&end=${row.end}`);
+  if (!r.ok) return;
+  const p = await r.json(), ctx = canvas.getContext('2d');
+  canvas.width = canvas.clientWidth; canvas.height = 48;
+  const n = p.min.length, w = canvas.width, mid = 24;
+  ctx.fillStyle = '#47a';
+  for (let x = 0; x < w; x++) {
+    const i = Math.floor(x * n / w), j = Math.max(i + 1, Math.floor((x + 1) * n / w));
+    let lo = 0, hi = 0;
+    for (let k = i; k < j && k < n; k++) { lo = Math.min(lo, p.min[k]); hi = Math.max(hi, p.max[k]); }
+    ctx.fillRect(x, mid - hi * mid / 128, 1, Math.max(1, (hi - lo) * mid / 128));
+  }
+}
+function render(rows) {
+  const list = $('list'); list.innerHTML = '';
+  for (const row of rows) {
+    const div = document.createElement('div'); div.className = 'seg ' + row.status;
+    div.innerHTML = `<div class="meta"></div><canvas></canvas><audio controls preload="none"></audio>
+      <select>${['unreviewed','ok','fix','reject'].map(s => `<option ${s === row.status ? 'selected' : ''}>${s}</option>`).join('')}</select>
+      <textarea rows="2"></textarea><div class="asr"></div>`;
+    const [meta, canvas, audio, select, text, asr] = ['.meta', 'canvas', 'audio', 'select', 'textarea', '.asr'].map(s => div.querySelector(s));
+    // Manifest values go in as text, never as markup
+    meta.textContent = `${row.filename} #${row.segment} · ${row.start.toFixed(2)}–${row.end.toFixed(2)}s · ` +
+      `${row.language || ''} ${row.dialect ? '(' + row.dialect + ')' : ''} · quality ${row.quality}`;
+    audio.src = row.audio_url;
+    text.value = row.text || ''; asr.textContent = row.asr_text && row.asr_text !== row.text ? 'ASR: ' + row.asr_text : '';
+    text.oninput = () => edit(row.id, 'text', text.value);
+    select.onchange = () => { edit(row.id, 'status', select.value); div.className = 'seg ' + select.value; };
+    canvas.onclick = () => audio.paused ? audio.play() : audio.pause();
+    list.appendChild(div); draw(canvas, row);
+  }
+}
+async function load() {
+  await flush();
+  const params = new URLSearchParams({page, per_page: perPage});
+  for (const f of ['status', 'language', 'quality', 'q']) if ($(f).value) params.set(f, $(f).value);
+  const data = await (await fetch('/api/segments?' + params)).json();
+  total = data.total; render(data.items);
+  $('pageinfo').textContent = ` page ${page} of ${Math.max(1, Math.ceil(total / perPage))} (${total}) `;
+  const lang = $('language');
+  if (lang.options.length === 1) for (const l of Object.keys(data.facets.language)) lang.add(new Option(l, l));
+}
+$('go').onclick = () => { page = 1; load(); };
+$('prev').onclick = () => { if (page > 1) { page--; load(); } };
+$('next').onclick = () => { if (page * perPage < total) { page++; load(); } };
+load();
+</script></body></html>
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Review segments and transcripts in the browser")
+    parser.add_argument("manifest_dirs", nargs="*", default=["data/raw/okapi"],
+                        help="Directories with manifest.json (section subdirectories are included)")
+    parser.add_argument("--transcripts", type=str, default=DEFAULT_TRANSCRIPTS, help="align_whisper.py results JSONL")
+    parser.add_argument("--reviews", type=str, default=DEFAULT_REVIEWS, help="Where reviewer edits are appended")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    manifest_dirs = find_manifest_dirs(args.manifest_dirs)
+    if not manifest_dirs:
+        print("❌ No manifests found")
+        sys.exit(1)
+    index = SegmentIndex(manifest_dirs, Path(args.transcripts), ReviewLog(Path(args.reviews)))
+    print(f"📇 Indexed {len(index.rows)} segments from {len(index.files)} files in {len(manifest_dirs)} manifest(s)")
+
+    caches = {}
+
+    def cache_for(d: int):
+        if args.no_audio_cache:
+            return None
+        if d not in caches:
+            caches[d] = open_cache(manifest_dirs[d], args.audio_cache_mb)
+        return caches[d]
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(index, cache_for, PAGE.encode('utf-8')))
+    server.daemon_threads = True
+    print(f"🌐 Review UI at http://{args.host}:{server.server_address[1]}/ (edits go to {args.reviews})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("👋 Stopped")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
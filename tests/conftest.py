@@ -0,0 +1,6 @@
+# filepath: tests/conftest.py
+# The scripts import each other as top-level modules (see scripts/*.py)
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
@@ -0,0 +1,91 @@
+"""
+Offline tests for download_topcongo.py against a fixture directory of local
+media files (transcoded with soundfile, so ffmpeg is not needed)
+"""
+# filepath: tests/test_download_topcongo.py
+
+import json, sqlite3
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+import download_topcongo as topcongo
+from audio_stream import TARGET_SR
+
+def tone(path, freq: float, seconds: float = 1.0):
+    t = np.arange(int(TARGET_SR * seconds)) / TARGET_SR
+    sf.write(str(path), (0.2 * np.sin(2 * np.pi * freq * t)).astype('float32'), TARGET_SR)
+
+@pytest.fixture
+def fixtures(tmp_path):
+    src = tmp_path / "fixtures"
+    (src / "sub").mkdir(parents=True)
+    tone(src / "a.wav", 220)
+    tone(src / "sub" / "a.flac", 440)  # Same stem as a.wav, different episode
+    tone(src / "b.wav", 330)
+    return src
+
+@pytest.fixture
+def fetches(monkeypatch):
+    monkeypatch.setattr(topcongo.shutil, 'which', lambda name: None)  # Take the soundfile path
+    calls = []
+    fetch = topcongo.fetch_episode
+
+    def counting(episode, *args):
+        calls.append(episode['id'])
+        return fetch(episode, *args)
+    monkeypatch.setattr(topcongo, 'fetch_episode', counting)
+    return calls
+
+def run(monkeypatch, *argv) -> int:
+    monkeypatch.setattr(topcongo.sys, 'argv', ["download_topcongo.py", *map(str, argv)])
+    with pytest.raises(SystemExit) as exit_info:
+        topcongo.main()
+    return exit_info.value.code
+
+def index_rows(out) -> dict:
+    with sqlite3.connect(out / topcongo.INDEX_DB) as db:
+        return {row[0]: row[1:] for row in db.execute("SELECT episode_id, status, filename FROM episodes")}
+
+def test_same_stem_in_subdirectory_is_a_separate_episode(fixtures, fetches, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+
+    assert run(monkeypatch, fixtures, "--out", out, "--workers", 4) == 0
+
+    rows = index_rows(out)
+    assert len(rows) == 3 and {status for status, _ in rows.values()} == {'downloaded'}
+    filenames = sorted(filename for _, filename in rows.values())
+    assert sorted(p.name for p in out.glob("*.mp3")) == filenames
+    assert not list(out.glob("*.part"))
+
+    # Each file holds its own source's audio, not whichever fetch finished last
+    metadata = [json.loads(p.read_text()) for p in (out / "metadata").glob("*.json")]
+    assert sorted(m['filename'] for m in metadata) == filenames
+    manifest = json.loads((out / "manifest.json").read_text())
+    assert len({entry['sha256'] for entry in manifest}) == 3
+
+def test_rerun_skips_indexed_episodes(fixtures, fetches, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+    assert run(monkeypatch, fixtures, "--out", out) == 0
+    first = index_rows(out)
+    fetches.clear()
+
+    assert run(monkeypatch, fixtures, "--out", out) == 0
+
+    assert fetches == []
+    assert index_rows(out) == first
+
+    tone(fixtures / "sub" / "c.wav", 550)
+    assert run(monkeypatch, fixtures, "--out", out) == 0
+    assert len(fetches) == 1 and fetches[0].endswith("-c")
+    assert len(index_rows(out)) == 4
+
+def test_source_listed_twice_is_fetched_once(fixtures, fetches, tmp_path, monkeypatch):
+    out = tmp_path / "out"
+
+    assert run(monkeypatch, fixtures, fixtures, "--out", out, "--workers", 4) == 0
+
+    assert sorted(fetches) == sorted(set(fetches)) and len(fetches) == 3
+    assert {status for status, _ in index_rows(out).values()} == {'downloaded'}
@@ -0,0 +1,117 @@
+"""
+ManifestBuilder tests: incremental apply from the crawl state, --full
+rebuilds, fields kept across rebuilds and audio_path for both layouts
+"""
+# filepath: tests/test_okapi_manifest.py
+
+import os, sys, json, hashlib
+
+import pytest
+
+import okapi_manifest
+from okapi_manifest import build_manifest, load_manifest, update_entries
+from okapi_state import open_state
+
+@pytest.fixture
+def section_dir(tmp_path):
+    path = tmp_path / "data" / "raw" / "okapi" / "kikongo"
+    path.mkdir(parents=True)
+    return path
+
+@pytest.fixture
+def state(section_dir):
+    with open_state(section_dir, 'radio_okapi_kikongo') as state:
+        yield state
+
+def download(state, output_dir, num: int, content: bytes) -> str:
+    """Write an MP3 and its metadata and record it the way the scraper does"""
+    filename = f"0{num}012025-kikongo-{num}.mp3"
+    (output_dir / filename).write_bytes(content)
+    (output_dir / "metadata").mkdir(exist_ok=True)
+    (output_dir / "metadata" / f"{filename[:-4]}.json").write_text(json.dumps(
+        {'title': f"Journal {num}", 'article_number': num, 'source_url': f"https://example.org/{num}"}))
+    state.record(num, 'downloaded', filename=filename, title=f"Journal {num}",
+                 article_url=f"https://example.org/{num}", sha256=hashlib.sha256(content).hexdigest(),
+                 file_size=len(content))
+    return filename
+
+def test_incremental_build_applies_only_state_changes(section_dir, state):
+    first = download(state, section_dir, 1, b"one")
+    builder = build_manifest(section_dir, state, language='kg')
+    assert builder.changed == [first]
+    entry = load_manifest(section_dir)[first]
+    assert entry['article_number'] == 1 and entry['language'] == 'kg' and entry['needs_transcription']
+
+    second = download(state, section_dir, 2, b"two")
+    (section_dir / "03012025-kikongo-3.mp3").write_bytes(b"outside the crawl")
+
+    builder = build_manifest(section_dir, state, language='kg')
+
+    # The file the crawl never recorded waits for a --full rebuild
+    assert builder.changed == [second]
+    assert sorted(load_manifest(section_dir)) == [first, second]
+
+    builder = build_manifest(section_dir, state, full=True, language='kg')
+    assert builder.changed == ["03012025-kikongo-3.mp3"]
+    assert len(load_manifest(section_dir)) == 3
+
+def test_full_rebuild_drops_deleted_files(section_dir, state):
+    first = download(state, section_dir, 1, b"one")
+    second = download(state, section_dir, 2, b"two")
+    build_manifest(section_dir, state)
+
+    (section_dir / second).unlink()
+    builder = build_manifest(section_dir, state, full=True)
+
+    assert builder.removed == [second]
+    assert list(load_manifest(section_dir)) == [first]
+
+def test_rebuild_keeps_downstream_fields_and_transcription_flag(section_dir, state):
+    filename = download(state, section_dir, 1, b"one")
+    build_manifest(section_dir, state)
+    update_entries(section_dir, {filename: {'segments': [[0.0, 1.0]], 'needs_transcription': False}})
+
+    # Same content, new mtime: the file is re-read but nothing downstream is lost
+    os.utime(section_dir / filename, ns=(0, 0))
+    builder = build_manifest(section_dir, state, full=True)
+    entry = load_manifest(section_dir)[filename]
+    assert builder.changed == []
+    assert entry['segments'] == [[0.0, 1.0]] and entry['needs_transcription'] is False
+
+    # New audio under the same name has to be transcribed again
+    download(state, section_dir, 1, b"replaced")
+    build_manifest(section_dir, state)
+    entry = load_manifest(section_dir)[filename]
+    assert entry['needs_transcription'] is True
+    assert entry['sha256'] == hashlib.sha256(b"replaced").hexdigest()
+
+def test_duplicates_point_at_lowest_article(section_dir, state):
+    first = download(state, section_dir, 1, b"same")
+    second = download(state, section_dir, 2, b"same")
+
+    build_manifest(section_dir, state)
+
+    entries = load_manifest(section_dir)
+    assert 'duplicate_of' not in entries[first]
+    assert entries[second]['duplicate_of'] == first
+
+def test_audio_path_matches_between_scraper_and_cli(section_dir, state, tmp_path, monkeypatch):
+    filename = download(state, section_dir, 1, b"one")
+    build_manifest(section_dir, state)
+    scraped = load_manifest(section_dir)[filename]['audio_path']
+
+    for path in section_dir.glob("manifest*"):
+        path.unlink()
+    (section_dir / okapi_manifest.MANIFEST_INDEX).unlink()
+    monkeypatch.setattr(sys, 'argv',
+                        ["okapi_manifest.py", str(section_dir), "--full", "--section", "kikongo"])
+    okapi_manifest.main()
+
+    assert scraped == f"raw/okapi/kikongo/{filename}"
+    assert load_manifest(section_dir)[filename]['audio_path'] == scraped
+
+    flat = tmp_path / "data" / "raw" / "okapi"
+    (flat / "x.mp3").write_bytes(b"flat")
+    build_manifest(flat, full=True)
+    assert load_manifest(flat)["x.mp3"]['audio_path'] == "raw/okapi/x.mp3"
+    assert json.loads((flat / okapi_manifest.MANIFEST_JSON).read_text())[0]['filename'] == "x.mp3"
@@ -0,0 +1,184 @@
+"""
+Resume and atomic-rename tests for resumable.py (threaded engine) and
+okapi_async.download_file, against a local server that drops connections
+"""
+# filepath: tests/test_resumable.py
+
+import asyncio, hashlib, re, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import okapi_async
+import resumable
+from resumable import IncompleteDownload, download_file, part_path
+
+BODY = bytes(range(256)) * 2048  # 512 KiB, several READ_SIZE chunks
+
+class DroppingServer:
+    """Serves one file with Range/If-Range support; the first `drops` responses are cut short"""
+
+    def __init__(self, body: bytes = BODY, drops: int = 1):
+        self.body, self.drops = body, drops
+        self.requests = []  # Headers of every request, in order
+
+    @property
+    def etag(self) -> str:
+        return f'"{hashlib.md5(self.body).hexdigest()}"'
+
+    def start(self) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                body, start, status = server.body, 0, 200
+                match = re.match(r"bytes=(\d+)-$", self.headers.get('Range', ''))
+                if match and self.headers.get('If-Range') in (None, server.etag):
+                    start = int(match.group(1))
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{len(body)}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    status = 206
+
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body) - start))
+                self.send_header('ETag', server.etag)
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+                self.end_headers()
+
+                stop = len(body)
+                if server.drops > 0:
+                    server.drops -= 1
+                    stop = start + (len(body) - start) // 2
+                    self.close_connection = True
+                self.wfile.write(body[start:stop])
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/bulletin.mp3"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    server = DroppingServer()
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resumable.time, 'sleep', lambda seconds: None)
+
+    async def no_sleep(seconds):
+        pass
+    monkeypatch.setattr(okapi_async.asyncio, 'sleep', no_sleep)
+
+def leftovers(output_path) -> list:
+    return sorted(p.name for p in output_path.parent.iterdir() if p.name != output_path.name)
+
+def test_resumes_after_dropped_connection(server, tmp_path):
+    url = server.start()
+    output = tmp_path / "bulletin.mp3"
+    retries = []
+
+    with requests.Session() as session:
+        result = download_file(session, url, output, on_retry=lambda attempt, e: retries.append(attempt))
+
+    assert retries == [1]
+    assert len(server.requests) == 2
+    assert 'Range' not in server.requests[0]
+    assert server.requests[1]['Range'] == f"bytes={len(BODY) // 2}-"
+    assert server.requests[1]['If-Range'] == server.etag
+    assert output.read_bytes() == BODY
+    assert result['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert result['file_size'] == len(BODY)
+    assert result['etag'] == server.etag
+    assert leftovers(output) == []
+
+def test_changed_file_is_downloaded_from_scratch(server, tmp_path):
+    url = server.start()
+    output = tmp_path / "bulletin.mp3"
+    part_path(output).write_bytes(b"stale" * 1000)
+    resumable.save_part_state(output, {'etag': '"old"', 'url': url})
+    server.drops = 0
+
+    with requests.Session() as session:
+        result = download_file(session, url, output)
+
+    # If-Range no longer matches, so the server answers 200 with the whole file
+    assert server.requests[0]['If-Range'] == '"old"'
+    assert output.read_bytes() == BODY
+    assert result['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert leftovers(output) == []
+
+def test_complete_part_file_is_finalized(server, tmp_path):
+    url = server.start()
+    output = tmp_path / "bulletin.mp3"
+    part_path(output).write_bytes(BODY)
+    resumable.save_part_state(output, {'etag': server.etag, 'url': url})
+
+    with requests.Session() as session:
+        result = download_file(session, url, output)
+
+    assert result['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert output.read_bytes() == BODY
+    assert leftovers(output) == []
+
+def test_failed_download_keeps_part_file(server, tmp_path):
+    url = server.start()
+    output = tmp_path / "bulletin.mp3"
+    server.drops = 10
+
+    with requests.Session() as session:
+        with pytest.raises(Exception):
+            download_file(session, url, output, attempts=2)
+
+    # Nothing is renamed into place until the bytes are all there
+    assert not output.exists()
+    assert 0 < part_path(output).stat().st_size < len(BODY)
+
+    server.drops = 0
+    with requests.Session() as session:
+        result = download_file(session, url, output)
+    assert result['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert leftovers(output) == []
+
+def test_async_engine_resumes_after_dropped_connection(server, tmp_path):
+    import aiohttp
+
+    url = server.start()
+    output = tmp_path / "bulletin.mp3"
+
+    async def run():
+        async with aiohttp.ClientSession() as session:
+            return await okapi_async.download_file(session, okapi_async.HostRateLimiter(0), url, output)
+
+    result = asyncio.run(run())
+
+    assert server.requests[-1]['Range'].startswith("bytes=")
+    assert server.requests[-1]['If-Range'] == server.etag
+    assert output.read_bytes() == BODY
+    assert result['sha256'] == hashlib.sha256(BODY).hexdigest()
+    assert leftovers(output) == []
+
+def test_short_body_raises_incomplete(tmp_path):
+    output = tmp_path / "bulletin.mp3"
+    part_path(output).write_bytes(b"x" * 10)
+
+    with pytest.raises(IncompleteDownload):
+        resumable.finalize(output, total=20)
+    assert not output.exists()
@@ -0,0 +1,236 @@
+"""
+Drive sync tests for upload_to_gdrive.py against an in-memory Drive stub:
+paginated listings, MD5 skips, resumable chunked uploads and 5xx retries
+"""
+# filepath: tests/test_upload_to_gdrive.py
+
+import re, json, hashlib, itertools
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("googleapiclient")
+import httplib2
+from googleapiclient.errors import HttpError
+
+import upload_to_gdrive as gdrive
+from upload_to_gdrive import FOLDER_MIME
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({'status': status}), b'{"error": "injected"}')
+
+class Request:
+    def __init__(self, drive, op, run, media=None):
+        self.drive, self.op, self.run, self.media = drive, op, run, media
+        self.offset = 0  # Bytes the server has acknowledged, as a resumable session would
+
+    def execute(self):
+        self.drive.maybe_fail(self.op)
+        return self.run(self.media.getbytes(0, self.media.size()) if self.media else None)
+
+    def next_chunk(self):
+        self.drive.maybe_fail(self.op + '_chunk')
+        size, step = self.media.size(), self.media.chunksize()
+        self.drive.chunks.append((self.offset, min(size, self.offset + step)))
+        self.offset = min(size, self.offset + step)
+        if self.offset < size:
+            return None, None
+        return None, self.run(self.media.getbytes(0, size))
+
+class Files:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q, fields=None, pageSize=100, pageToken=None):
+        def run(_):
+            matches = [f for f in self.drive.files.values() if self.drive.matches(f, q)]
+            start = int(pageToken or 0)
+            page = {'files': [dict(f) for f in matches[start:start + pageSize]]}
+            if start + pageSize < len(matches):
+                page['nextPageToken'] = str(start + pageSize)
+            self.drive.list_calls += 1
+            return page
+        return Request(self.drive, 'list', run)
+
+    def create(self, body, media_body=None, fields=None):
+        def run(content):
+            return {'id': self.drive.add(body['name'], body.get('parents', [None])[0],
+                                         body.get('mimeType', 'application/octet-stream'), content)}
+        return Request(self.drive, 'create', run, media_body)
+
+    def update(self, fileId, media_body=None, fields=None):
+        def run(content):
+            self.drive.set_content(fileId, content)
+            return {'id': fileId}
+        return Request(self.drive, 'update', run, media_body)
+
+class FakeDrive:
+    """Enough of the Drive v3 files() API for upload_to_gdrive"""
+
+    def __init__(self):
+        self.files, self.ids = {}, itertools.count(1)
+        self.failures = {}  # op -> numbers of the calls (from 1) that get a 503
+        self.calls = Counter()
+        self.chunks, self.list_calls = [], 0
+
+    def maybe_fail(self, op):
+        self.calls[op] += 1
+        if self.calls[op] in self.failures.get(op, ()):
+            raise http_error(503)
+
+    def add(self, name, parent, mimetype, content=None):
+        file_id = f"id{next(self.ids)}"
+        self.files[file_id] = {'id': file_id, 'name': name, 'parent': parent, 'mimeType': mimetype}
+        self.set_content(file_id, content)
+        return file_id
+
+    def set_content(self, file_id, content):
+        if content is not None:
+            self.files[file_id].update(content=content, size=str(len(content)),
+                                       md5Checksum=hashlib.md5(content).hexdigest())
+
+    def matches(self, f, q):
+        name = re.search(r"name='([^']*)'", q)
+        parent = re.search(r"'([^']*)' in parents", q)
+        if name and f['name'] != name.group(1):
+            return False
+        if (parent.group(1) if parent else None) != f['parent']:
+            return False
+        if f"mimeType='{FOLDER_MIME}'" in q and f['mimeType'] != FOLDER_MIME:
+            return False
+        if f"mimeType!='{FOLDER_MIME}'" in q and f['mimeType'] == FOLDER_MIME:
+            return False
+        return True
+
+    def folder(self, *names):
+        parent = None
+        for name in names:
+            parent = next(f['id'] for f in self.files.values()
+                          if f['name'] == name and f['parent'] == parent and f['mimeType'] == FOLDER_MIME)
+        return parent
+
+    def content(self, folder_id, name):
+        return next(f.get('content') for f in self.files.values() if f['parent'] == folder_id and f['name'] == name)
+
+class Service:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def files(self):
+        return Files(self.drive)
+
+@pytest.fixture
+def drive(monkeypatch):
+    monkeypatch.setattr(gdrive.time, 'sleep', lambda seconds: None)
+    return FakeDrive()
+
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # upload_summary.txt is written to the working directory
+    audio = tmp_path / "okapi"
+    (audio / "metadata").mkdir(parents=True)
+    for i in range(3):
+        (audio / f"0{i}012025-lingala-{i}.mp3").write_bytes(bytes([i]) * (300 * 1024))
+        (audio / "metadata" / f"0{i}012025-lingala-{i}.json").write_text(json.dumps({'n': i}))
+    (audio / "03012025-lingala-3.mp3").write_bytes(bytes([0]) * (300 * 1024))
+    manifest = [{'filename': f"0{i}012025-lingala-{i}.mp3"} for i in range(3)]
+    manifest.append({'filename': "03012025-lingala-3.mp3", 'duplicate_of': "00012025-lingala-0.mp3"})
+    (audio / "manifest.json").write_text(json.dumps(manifest))
+    return audio
+
+def test_list_folder_follows_pages(drive):
+    folder = drive.add('audio', None, FOLDER_MIME)
+    for i in range(2500):
+        drive.add(f"{i}.mp3", folder, 'audio/mpeg', b'x')
+    drive.add('sub', folder, FOLDER_MIME)
+
+    index = gdrive.list_folder(Service(drive), folder)
+
+    assert len(index) == 2500
+    assert drive.list_calls == 3
+
+def test_listing_retries_server_errors(drive):
+    folder = drive.add('audio', None, FOLDER_MIME)
+    drive.add('a.mp3', folder, 'audio/mpeg', b'x')
+    drive.failures['list'] = {1, 2}
+
+    assert list(gdrive.list_folder(Service(drive), folder)) == ['a.mp3']
+    assert drive.calls['list'] == 3
+
+def test_client_errors_are_not_retried(drive):
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise http_error(404)
+
+    with pytest.raises(HttpError):
+        gdrive.with_retries(request)
+    assert len(calls) == 1
+
+def test_unchanged_file_is_skipped_by_md5(drive, tmp_path):
+    folder = drive.add('metadata', None, FOLDER_MIME)
+    path = tmp_path / "a.json"
+    path.write_text('{"n": 1}')
+    existing = {'id': drive.add('a.json', folder, 'application/json', path.read_bytes())}
+    existing['md5Checksum'] = drive.files[existing['id']]['md5Checksum']
+    service = Service(drive)
+
+    assert gdrive.upload_file(service, str(path), folder, existing, 'application/json') == 'skipped'
+
+    path.write_text('{"n": 2}')
+    assert gdrive.upload_file(service, str(path), folder, existing, 'application/json') == 'updated'
+    assert drive.content(folder, 'a.json') == b'{"n": 2}'
+
+def test_audio_uploads_in_resumable_chunks_through_errors(drive, tmp_path, monkeypatch):
+    monkeypatch.setattr(gdrive, 'CHUNK_SIZE', 256 * 1024)
+    folder = drive.add('audio', None, FOLDER_MIME)
+    path = tmp_path / "a.mp3"
+    content = bytes(range(256)) * 4096  # 1 MiB, four chunks
+    path.write_bytes(content)
+    drive.failures['create_chunk'] = {3}  # The third chunk call fails once
+
+    assert gdrive.upload_file(Service(drive), str(path), folder, None, 'audio/mpeg') == 'uploaded'
+
+    # The failed call is retried on the same request, which picks up at its last acknowledged byte
+    assert drive.calls['create_chunk'] == 5
+    assert drive.chunks == [(0, 262144), (262144, 524288), (524288, 786432), (786432, 1048576)]
+    assert drive.content(folder, 'a.mp3') == content
+
+def test_sync_uploads_then_skips_everything(drive, audio_dir):
+    service = Service(drive)
+    drive.failures['create'] = {4}  # One metadata upload hits a 503 and is retried
+
+    gdrive.upload_to_gdrive(str(audio_dir), workers=2, get_service=lambda: service)
+
+    audio = drive.folder('lingala-stt', 'audio')
+    metadata = drive.folder('lingala-stt', 'metadata')
+    assert sorted(f['name'] for f in drive.files.values() if f['parent'] == audio) == \
+        [f"0{i}012025-lingala-{i}.mp3" for i in range(3)]  # The duplicate stays local
+    assert drive.content(metadata, "01012025-lingala-1.json") == b'{"n": 1}'
+    assert drive.content(drive.folder('lingala-stt'), 'manifest.json') == (audio_dir / "manifest.json").read_bytes()
+    assert "uploaded=7" in open("upload_summary.txt").read()
+
+    gdrive.upload_to_gdrive(str(audio_dir), workers=2, get_service=lambda: service)
+    summary = open("upload_summary.txt").read()
+    assert "uploaded=0" in summary and "skipped=7" in summary and "failed=0" in summary
+
+def test_sections_sync_into_their_own_folders(drive, audio_dir, tmp_path):
+    service = Service(drive)
+    other = tmp_path / "kikongo"
+    other.mkdir()
+    (other / "01012025-kikongo-1.mp3").write_bytes(b'k' * 1024)
+    (other / "manifest.json").write_text(json.dumps([{'filename': "01012025-kikongo-1.mp3"}]))
+
+    gdrive.upload_to_gdrive(str(audio_dir), workers=2, get_service=lambda: service, subfolder='lingala')
+    gdrive.upload_to_gdrive(str(other), workers=2, get_service=lambda: service, subfolder='kikongo')
+
+    # Neither section's manifest or audio lands in the other's folder
+    for section, path in (('lingala', audio_dir), ('kikongo', other)):
+        assert drive.content(drive.folder('lingala-stt', section), 'manifest.json') == \
+            (path / "manifest.json").read_bytes()
+        audio = drive.folder('lingala-stt', section, 'audio')
+        assert sorted(f['name'] for f in drive.files.values() if f['parent'] == audio) == \
+            sorted(p.name for p in path.glob("*.mp3") if p.name != "03012025-lingala-3.mp3")
+    assert not any(f['name'] == 'manifest.json' and f['parent'] == drive.folder('lingala-stt')
+                   for f in drive.files.values())